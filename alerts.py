@@ -0,0 +1,200 @@
+from dataclasses import dataclass
+from typing import Dict, Any, List, Mapping, Tuple
+
+import numpy as np
+
+
+@dataclass
+class AlertThresholds:
+    spike_pct: float = 30.0
+    spike_abs_eur: float = 2.0
+    dip_pct: float = -25.0
+    min_price_eur: float = 1.5
+    sell_candidate_pct: float = 80.0
+    sell_candidate_abs_gbp: float = 5.0
+    buy_more_pct: float = -30.0
+    trend_window: int = 14
+    trend_spike_pct: float = 20.0
+    trend_dip_pct: float = -15.0
+    trend_min_points: int = 6
+
+    @classmethod
+    def from_args(cls, args: Any) -> "AlertThresholds":
+        return cls(**{f: getattr(args, f) for f in cls.__dataclass_fields__})
+
+
+@dataclass
+class AlertResult:
+    alerts: List[str]
+    sell_candidates: List[str]
+    buy_more_signals: List[str]
+    trend_alerts: List[str]
+
+
+def _to_float(v: Any) -> float:
+    try:
+        return float(v) if v is not None else np.nan
+    except Exception:
+        return np.nan
+
+
+def _opt(x: float) -> float | None:
+    return None if np.isnan(x) else float(x)
+
+
+def fmt_money_gbp_first(eur: float | None, gbp: float | None) -> str:
+    if gbp is not None and eur is not None:
+        return f"£{gbp:.2f} (€{eur:.2f})"
+    if gbp is not None:
+        return f"£{gbp:.2f}"
+    if eur is not None:
+        return f"€{eur:.2f}"
+    return "n/a"
+
+
+def trend_window_stats(
+    history: Mapping[str, List[Dict[str, Any]]],
+    keys: List[str],
+    window: int,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # (points, avg_eur, avg_gbp) per key over the last `window` entries
+    n = len(keys)
+    points = np.zeros(n, dtype=np.int64)
+    avg_eur = np.full(n, np.nan)
+    avg_gbp = np.full(n, np.nan)
+    pos = {k: i for i, k in enumerate(keys)}
+    for k, entries in history.items():
+        i = pos.get(k)
+        if i is None or not isinstance(entries, list) or not entries:
+            continue
+        entries = entries[-window:]
+        points[i] = len(entries)
+        eurs = [e for e in (_to_float(x.get("eur")) for x in entries) if not np.isnan(e)]
+        gbps = [g for g in (_to_float(x.get("gbp")) for x in entries) if not np.isnan(g)]
+        if eurs:
+            avg_eur[i] = sum(eurs) / len(eurs)
+        if gbps:
+            avg_gbp[i] = sum(gbps) / len(gbps)
+    return points, avg_eur, avg_gbp
+
+
+def trend_stats_from_rolling(
+    rolling: Dict[str, Dict[str, Any]],
+    keys: List[str],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Same shape as trend_window_stats, read from the history store's precomputed rolling rows
+    n = len(keys)
+    points = np.zeros(n, dtype=np.int64)
+    avg_eur = np.full(n, np.nan)
+    avg_gbp = np.full(n, np.nan)
+    for i, k in enumerate(keys):
+        st = rolling.get(k)
+        if not st:
+            continue
+        points[i] = st["n"]
+        if st["n_eur"]:
+            avg_eur[i] = st["sum_eur"] / st["n_eur"]
+        if st["n_gbp"]:
+            avg_gbp[i] = st["sum_gbp"] / st["n_gbp"]
+    return points, avg_eur, avg_gbp
+
+
+def evaluate_alerts(
+    curr_cards: Dict[str, Any],
+    prev_cards: Dict[str, Any],
+    trend_stats: Tuple[np.ndarray, np.ndarray, np.ndarray],
+    rate: float | None,
+    th: AlertThresholds,
+) -> AlertResult:
+    keys = list(curr_cards.keys())
+    infos = list(curr_cards.values())
+    n = len(keys)
+
+    eur = np.fromiter((_to_float(i.get("eur")) for i in infos), dtype=np.float64, count=n)
+    prev = np.fromiter((_to_float(prev_cards.get(k, {}).get("eur")) for k in keys), dtype=np.float64, count=n)
+    points, avg_eur, avg_gbp = trend_stats
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # Same gate as the old per-card loop: priced now, above the floor, and priced last run
+        valid = ~np.isnan(eur) & (eur >= th.min_price_eur) & ~np.isnan(prev) & (prev > 0)
+        delta_eur = eur - prev
+        pct = (delta_eur / prev) * 100.0
+        if rate is not None:
+            delta_gbp = eur * rate - prev * rate
+        else:
+            delta_gbp = np.full(n, np.nan)
+
+        spike = valid & ((pct >= th.spike_pct) | (delta_eur >= th.spike_abs_eur))
+        dip = valid & (pct <= th.dip_pct)
+        sell = valid & ((pct >= th.sell_candidate_pct) | (delta_gbp >= th.sell_candidate_abs_gbp))
+        buy = valid & (pct <= th.buy_more_pct)
+
+        has_trend = valid & (points >= th.trend_min_points) & (avg_eur > 0)
+        trend_spike = has_trend & (eur >= avg_eur * (1.0 + th.trend_spike_pct / 100.0))
+        trend_dip = has_trend & (eur <= avg_eur * (1.0 + th.trend_dip_pct / 100.0))
+
+    # Messages are only built for rows where something fired
+    def common(i: int) -> Tuple[Dict[str, Any], str, str, str, str]:
+        info = infos[i]
+        e, p = float(eur[i]), float(prev[i])
+        gbp = (e * rate) if rate is not None else None
+        prev_gbp = (p * rate) if rate is not None else None
+        links = "\n".join([u for u in [info.get("scryfall_uri"), info.get("cardmarket_url")] if u])
+        tag = f"{info['set'].upper()} #{info['collector_number']} · {info['foil_kind']} · x{info['qty']}"
+        return info, tag, links, fmt_money_gbp_first(e, gbp), fmt_money_gbp_first(p, prev_gbp)
+
+    # A card can fire both a spike and a dip (or both trend alerts); like the old per-card
+    # loop, each one that holds gets its own message, spike first
+    alerts: List[str] = []
+    for i in np.flatnonzero(spike | dip):
+        info, tag, links, money_now, money_prev = common(i)
+        for head, mask in (("📈 **PRICE SPIKE**", spike), ("📉 **PRICE DIP**", dip)):
+            if not mask[i]:
+                continue
+            alerts.append(
+                f"{head}\n"
+                f"**{info['name']}** ({tag})\n"
+                f"Yesterday: {money_prev}\n"
+                f"Today: {money_now} (**{float(pct[i]):+.0f}%**, Δ€{float(delta_eur[i]):+.2f})\n"
+                f"Risk: {info.get('risk','?')}\n"
+                f"{links}"
+            )
+
+    def signal(mask: np.ndarray, head: str) -> List[str]:
+        out = []
+        for i in np.flatnonzero(mask):
+            info, tag, links, money_now, _ = common(i)
+            dg = _opt(delta_gbp[i])
+            dgbp = f"{dg:+.2f}" if dg is not None else "n/a"
+            out.append(
+                f"{head}\n"
+                f"**{info['name']}** ({tag})\n"
+                f"Now: {money_now} (Δ£{dgbp}, {float(pct[i]):+.0f}%)\n"
+                f"Risk: {info.get('risk','?')}\n"
+                f"{links}"
+            )
+        return out
+
+    trend_alerts: List[str] = []
+    for i in np.flatnonzero(trend_spike | trend_dip):
+        info, tag, links, money_now, _ = common(i)
+        a_eur, a_gbp = float(avg_eur[i]), _opt(avg_gbp[i])
+        pct_vs_avg = ((float(eur[i]) - a_eur) / a_eur) * 100.0
+        for head, mask in (("📊 **TREND SPIKE**", trend_spike), ("📉 **TREND DIP**", trend_dip)):
+            if not mask[i]:
+                continue
+            trend_alerts.append(
+                f"{head}\n"
+                f"**{info['name']}** ({tag})\n"
+                f"Now: {money_now}\n"
+                f"Avg ({int(points[i])} pts): {fmt_money_gbp_first(a_eur, a_gbp)} (**{pct_vs_avg:+.0f}%**)\n"
+                f"Risk: {info.get('risk','?')}\n"
+                f"{links}"
+            )
+
+    return AlertResult(
+        alerts=alerts,
+        sell_candidates=signal(sell, "💰 **SELL CANDIDATE**"),
+        buy_more_signals=signal(buy, "🛒 **BUY-MORE SIGNAL**"),
+        trend_alerts=trend_alerts,
+    )
@@ -0,0 +1,309 @@
+"""Stage-by-stage benchmark of the tracker pipeline on synthetic collections.
+
+    python benchmarks/bench_pipeline.py --sizes 1000,10000
+    python benchmarks/bench_pipeline.py --sizes 1000,10000 --save-baseline
+    python benchmarks/bench_pipeline.py --sizes 1000,10000 --compare
+
+Each stage reports its best wall-clock time over --repeat calls and its
+tracemalloc peak. --compare exits non-zero when a stage is slower than the
+stored baseline by more than --tolerance (and by more than --min-delta
+seconds, so tiny stages don't flap).
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pipeline  # noqa: E402
+import weekly_upload  # noqa: E402
+from alerts import AlertThresholds, evaluate_alerts, trend_stats_from_rolling  # noqa: E402
+from history_store import HistoryStore  # noqa: E402
+from snapshot_archive import SnapshotArchive  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+MOXFIELD_HEADER = [
+    "Count", "Tradelist Count", "Name", "Edition", "Condition", "Language", "Foil", "Tags",
+    "Last Modified", "Collector Number", "Alter", "Proxy", "Purchase Price",
+]
+LANGS = ["English"] * 17 + ["Japanese", "German", "French"]
+FOILS = [""] * 8 + ["foil", "etched"]
+
+
+# -------- Synthetic data --------
+
+def synth_sets(n_rows: int) -> List[str]:
+    return [f"s{i:03d}" for i in range(max(4, n_rows // 300))]
+
+
+def write_synthetic_csv(path: str, n_rows: int, rng: random.Random) -> None:
+    sets = synth_sets(n_rows)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, quoting=csv.QUOTE_ALL)
+        w.writerow(MOXFIELD_HEADER)
+        for i in range(n_rows):
+            cn = str(rng.randint(1, 400))
+            w.writerow([
+                rng.randint(1, 4), 0, f"Card {i % (n_rows // 2 + 1)}", rng.choice(sets), "Near Mint",
+                rng.choice(LANGS), rng.choice(FOILS), "", "2025-10-29 13:08:06.133000", cn,
+                "False", "True" if i % 97 == 0 else "False", "",
+            ])
+
+
+def synth_scryfall_card(ident: Dict[str, str], rng: random.Random) -> Dict[str, Any]:
+    eur = round(rng.uniform(0.1, 60.0), 2)
+    return {
+        "set": ident["set"],
+        "collector_number": ident["collector_number"],
+        "lang": ident["lang"],
+        "prices": {"eur": str(eur), "eur_foil": str(round(eur * 2, 2)), "eur_etched": None},
+        "purchase_uris": {"cardmarket": f"https://www.cardmarket.com/x/{ident['set']}/{ident['collector_number']}"},
+        "scryfall_uri": f"https://scryfall.com/card/{ident['set']}/{ident['collector_number']}",
+        "released_at": f"{rng.randint(1994, 2025)}-01-01",
+        "reserved": rng.random() < 0.02,
+    }
+
+
+def synth_responses(identifiers: List[Dict[str, str]], rng: random.Random) -> List[Tuple[List[Dict[str, str]], List[Dict[str, Any]]]]:
+    out = []
+    for batch in pipeline.chunk(identifiers, 75):
+        out.append((batch, [synth_scryfall_card(i, rng) for i in batch]))
+    return out
+
+
+def synth_prev_cards(curr_cards: Dict[str, Any], rng: random.Random) -> Dict[str, Any]:
+    prev = {}
+    for k, info in curr_cards.items():
+        eur = info.get("eur")
+        if eur is not None:
+            eur = round(eur * rng.uniform(0.6, 1.4), 2)
+        prev[k] = {**info, "eur": eur}
+    return prev
+
+
+def seed_history(store: HistoryStore, curr_cards: Dict[str, Any], points: int, rng: random.Random) -> str:
+    start = datetime(2025, 1, 1, 7, tzinfo=timezone.utc)
+    data: Dict[str, List[Dict[str, Any]]] = {}
+    for k, info in curr_cards.items():
+        eur = info.get("eur") or 1.0
+        data[k] = [
+            {
+                "ts": (start + timedelta(hours=12 * j)).isoformat(),
+                "eur": round(eur * rng.uniform(0.7, 1.3), 2),
+                "gbp": round(eur * 0.85, 4),
+            }
+            for j in range(points)
+        ]
+    store.import_json_history(data)
+    store.rebuild_rolling()
+    return (start + timedelta(hours=12 * points)).isoformat()
+
+
+# -------- Measurement --------
+
+def measure(fn: Callable[[], Any], memory: bool, repeat: int) -> Tuple[Any, float, int]:
+    # Best of `repeat` untraced calls; tracemalloc slows allocation-heavy code several-fold,
+    # so the peak comes from one more, traced call (all stages are repeatable).
+    elapsed = float("inf")
+    result = None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        result = fn()
+        elapsed = min(elapsed, time.perf_counter() - t0)
+    peak = 0
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def run_size(n_rows: int, window: int, seed: int, memory: bool = True, repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    rng = random.Random(seed + n_rows)
+    stages: Dict[str, Dict[str, float]] = {}
+
+    def record(name: str, fn: Callable[[], Any]) -> Any:
+        result, elapsed, peak = measure(fn, memory, repeat)
+        stages[name] = {"seconds": round(elapsed, 4), "peak_mb": round(peak / 1e6, 2)}
+        return result
+
+    with tempfile.TemporaryDirectory(prefix="mtg-bench-") as tmp:
+        csv_path = os.path.join(tmp, "moxfield.csv")
+        write_synthetic_csv(csv_path, n_rows, rng)
+
+        grouped = record("csv_ingest_group", lambda: pipeline.group_collection(pipeline.read_collection_csvs([csv_path])))
+        identifiers, key_to_meta = record("build_identifiers", lambda: pipeline.build_identifiers(grouped))
+        grouped = None
+
+        responses = synth_responses(identifiers, rng)
+        curr_cards: Dict[str, Any] = {}
+
+        def merge() -> None:
+            curr_cards.clear()
+            for batch, cards_data in responses:
+                pipeline.merge_collection_batch(batch, cards_data, key_to_meta, curr_cards)
+        record("merge_responses", merge)
+        responses = None
+
+        prev_cards = synth_prev_cards(curr_cards, rng)
+        store = HistoryStore(os.path.join(tmp, "history.sqlite"), max_points=window, stats_window=window)
+        next_ts = datetime.fromisoformat(seed_history(store, curr_cards, window, rng))
+
+        def append() -> int:
+            # A fresh timestamp per call so the traced repeat is a real append too
+            nonlocal next_ts
+            next_ts += timedelta(hours=12)
+            return store.append(curr_cards, 0.85, next_ts.isoformat())
+        record("update_history", append)
+
+        th = AlertThresholds(trend_window=window)
+        keys = list(curr_cards.keys())
+        record(
+            "alerts",
+            lambda: evaluate_alerts(curr_cards, prev_cards, trend_stats_from_rolling(store.rolling_stats(keys), keys), 0.85, th),
+        )
+
+        snap_dir = os.path.join(tmp, "snapshots")
+        latest_csv = os.path.join(snap_dir, "2025-02-09.csv")
+        record("write_export_snapshot_csv", lambda: pipeline.write_export_snapshot_csv(latest_csv, curr_cards, 0.85))
+        pipeline.write_export_snapshot_csv(os.path.join(snap_dir, "2025-02-02.csv"), prev_cards, 0.85)
+
+        # Full export into an empty directory, then a re-export with nothing changed,
+        # which the incremental exporter should turn into hash checks only
+        record(
+            "export_dashboard_from_history",
+            lambda: pipeline.export_dashboard_from_history(
+                history=store, curr_cards=curr_cards, out_dir=tempfile.mkdtemp(prefix="dash-", dir=tmp)
+            ),
+        )
+        dash_dir = os.path.join(tmp, "dash")
+        pipeline.export_dashboard_from_history(history=store, curr_cards=curr_cards, out_dir=dash_dir)
+        record(
+            "export_dashboard_unchanged",
+            lambda: pipeline.export_dashboard_from_history(history=store, curr_cards=curr_cards, out_dir=dash_dir),
+        )
+        # The weekly summary reads earlier weeks from the archive, as the weekly workflow does
+        # after its backfill
+        arch_dir = os.path.join(tmp, "archive")
+        SnapshotArchive(arch_dir).backfill(snap_dir)
+        record("weekly_build_summary", lambda: weekly_upload.build_summary(latest_csv, arch_dir))
+
+        # A quarter of weekly snapshots: the 1/4/12-week report should cost about the same
+        quarter_dir = os.path.join(tmp, "snapshots_quarter")
+        os.makedirs(quarter_dir)
+        latest_day = datetime(2025, 2, 9)
+        for w in range(13):
+            day = (latest_day - timedelta(weeks=w)).strftime("%Y-%m-%d")
+            shutil.copyfile(latest_csv if w == 0 else os.path.join(snap_dir, "2025-02-02.csv"), os.path.join(quarter_dir, f"{day}.csv"))
+        quarter_latest = os.path.join(quarter_dir, "2025-02-09.csv")
+        quarter_arch = os.path.join(tmp, "archive_quarter")
+        SnapshotArchive(quarter_arch).backfill(quarter_dir)
+        record("weekly_build_summary_quarter", lambda: weekly_upload.build_summary(quarter_latest, quarter_arch, [1, 4, 12]))
+        store.close()
+
+    return stages
+
+
+# -------- Reporting / baseline --------
+
+def print_report(results: Dict[str, Dict[str, Dict[str, float]]], baseline: Dict[str, Any] | None) -> None:
+    for size, stages in results.items():
+        print(f"\n== {int(size):,} rows ==")
+        print(f"{'stage':<32}{'seconds':>10}{'peak MB':>10}{'vs base':>10}")
+        for name, m in stages.items():
+            ratio = ""
+            base = ((baseline or {}).get(size) or {}).get(name)
+            if base and base.get("seconds"):
+                ratio = f"{m['seconds'] / base['seconds']:.2f}x"
+            print(f"{name:<32}{m['seconds']:>10.3f}{m['peak_mb']:>10.1f}{ratio:>10}")
+
+
+def find_regressions(
+    results: Dict[str, Dict[str, Dict[str, float]]],
+    baseline: Dict[str, Any],
+    tolerance: float,
+    min_delta: float,
+) -> List[str]:
+    out = []
+    for size, stages in results.items():
+        for name, m in stages.items():
+            if size not in baseline:
+                continue
+            base = baseline[size].get(name)
+            if not base:
+                # A new stage must land with its baseline, or --compare never checks it
+                out.append(f"{size} rows / {name}: no baseline entry")
+                continue
+            slow = m["seconds"] > base["seconds"] * tolerance and m["seconds"] - base["seconds"] > min_delta
+            fat = bool(m["peak_mb"]) and m["peak_mb"] > base["peak_mb"] * tolerance and m["peak_mb"] - base["peak_mb"] > 1.0
+            if slow:
+                out.append(f"{size} rows / {name}: {m['seconds']:.3f}s vs baseline {base['seconds']:.3f}s")
+            if fat:
+                out.append(f"{size} rows / {name}: {m['peak_mb']:.1f}MB vs baseline {base['peak_mb']:.1f}MB")
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1000,10000", help="Comma-separated row counts, e.g. 1000,10000,100000,1000000")
+    ap.add_argument("--window", type=int, default=14, help="History points per card")
+    ap.add_argument("--seed", type=int, default=1234)
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--save-baseline", action="store_true", help="Write results as the new baseline")
+    ap.add_argument("--compare", action="store_true", help="Exit 1 if any stage regressed against the baseline")
+    ap.add_argument("--tolerance", type=float, default=1.5, help="Allowed slowdown factor vs baseline")
+    ap.add_argument("--min-delta", type=float, default=0.1, help="Ignore slowdowns smaller than this many seconds")
+    ap.add_argument("--repeat", type=int, default=3, help="Timed calls per stage; the fastest is reported")
+    ap.add_argument("--no-memory", action="store_true", help="Skip the traced pass (peak MB reported as 0)")
+    ap.add_argument("--json", default="", help="Also write results to this JSON file")
+    args = ap.parse_args()
+
+    sizes = [int(s) for s in pipeline.parse_csv_list(args.sizes)]
+    results = {str(n): run_size(n, args.window, args.seed, memory=not args.no_memory, repeat=args.repeat) for n in sizes}
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results")
+
+    print_report(results, baseline)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"results": results}, f, indent=2)
+
+    if args.save_baseline:
+        merged = dict(baseline or {})
+        merged.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "results": merged}, f, indent=2, sort_keys=True)
+        print(f"\nSaved baseline to {args.baseline}")
+
+    if args.compare:
+        if not baseline:
+            raise SystemExit(f"No baseline at {args.baseline}; run with --save-baseline first")
+        regressions = find_regressions(results, baseline, args.tolerance, args.min_delta)
+        if regressions:
+            print("\nRegressions:")
+            for r in regressions:
+                print(f"- {r}")
+            raise SystemExit(1)
+        print("\nNo regressions against baseline.")
+
+
+if __name__ == "__main__":
+    main()
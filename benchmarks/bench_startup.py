@@ -0,0 +1,106 @@
+"""Start-up cost of tracker.py runs that stop at the run-time gate.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --rows 100000 --max-seconds 0.5
+
+Each scenario runs `python tracker.py ...` in a fresh interpreter (--repeat
+times, fastest reported) with -X importtime, and fails when pandas, numpy
+or requests gets imported on the way to "Not a scheduled run time", or when
+the run takes longer than --max-seconds.
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import List, Tuple
+
+from zoneinfo import ZoneInfo
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_pipeline import write_synthetic_csv  # noqa: E402
+
+import pipeline  # noqa: E402
+from snapshot_store import save_snapshot  # noqa: E402
+
+HEAVY_MODULES = ["pandas", "numpy", "requests"]
+
+
+def imported_modules(importtime_stderr: str) -> List[str]:
+    # Module names from -X importtime lines: "import time: self | cumulative | name"
+    out = []
+    for line in importtime_stderr.splitlines():
+        if line.startswith("import time:") and line.count("|") == 2:
+            out.append(line.rsplit("|", 1)[1].strip())
+    return out
+
+
+def run_gated(argv: List[str], cwd: str, repeat: int) -> Tuple[float, List[str], str]:
+    # (best seconds, heavy modules imported, stdout of the last run)
+    best = float("inf")
+    heavy: List[str] = []
+    stdout = ""
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        p = subprocess.run(
+            [sys.executable, "-X", "importtime", os.path.join(ROOT, "tracker.py"), *argv],
+            cwd=cwd, capture_output=True, text=True,
+        )
+        best = min(best, time.perf_counter() - t0)
+        if p.returncode != 0:
+            raise SystemExit(f"tracker.py {' '.join(argv)} failed:\n{p.stderr[-2000:]}")
+        mods = imported_modules(p.stderr)
+        heavy = sorted({m.split(".")[0] for m in mods if m.split(".")[0] in HEAVY_MODULES})
+        stdout = p.stdout
+    return best, heavy, stdout
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=10000, help="Rows in the synthetic collection CSV")
+    ap.add_argument("--repeat", type=int, default=5, help="Runs per scenario; the fastest is reported")
+    ap.add_argument("--max-seconds", type=float, default=0.4, help="Fail when a gated run takes longer")
+    ap.add_argument("--seed", type=int, default=1234)
+    args = ap.parse_args()
+
+    tz = "Europe/London"
+    off_hour = (datetime.now(ZoneInfo(tz)).hour + 12) % 24
+    gate = ["--tz", tz, "--run-times", f"{off_hour:02d}:00"]
+
+    failures = []
+    with tempfile.TemporaryDirectory(prefix="mtg-startup-") as tmp:
+        csv_path = os.path.join(tmp, "collection.csv")
+        write_synthetic_csv(csv_path, args.rows, random.Random(args.seed))
+        snap_path = os.path.join(tmp, "last_prices.snap")
+        save_snapshot(snap_path, {"_meta": {"csv_sha256": pipeline.collection_hash([csv_path])}, "cards": {}})
+
+        scenarios = [
+            ("gate_exit", ["--csv", csv_path, *gate]),
+            ("gate_exit_csv_unchanged", ["--csv", csv_path, "--snapshot", snap_path, "--incremental-on-csv-change", *gate]),
+        ]
+        print(f"{'scenario':<32}{'seconds':>10}  heavy imports")
+        for name, argv in scenarios:
+            seconds, heavy, stdout = run_gated(argv, tmp, args.repeat)
+            print(f"{name:<32}{seconds:>10.3f}  {', '.join(heavy) or '-'}")
+            if "Not a scheduled run time" not in stdout:
+                failures.append(f"{name}: did not stop at the gate")
+            if heavy:
+                failures.append(f"{name}: imported {', '.join(heavy)}")
+            if seconds > args.max_seconds:
+                failures.append(f"{name}: {seconds:.3f}s > {args.max_seconds:.3f}s")
+
+    if failures:
+        print("\nFast path regressions:")
+        for f in failures:
+            print(f"- {f}")
+        raise SystemExit(1)
+    print("\nGated runs stay on the fast path.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import json
+import os
+from typing import Dict, Any, List, Tuple
+
+CARD_CACHE_PATH = "data/card_cache.json"
+
+# Only the parts of a Scryfall card object that the tracker reads.
+STATIC_FIELDS = ("set", "collector_number", "lang", "scryfall_uri", "released_at", "reserved")
+PRICE_FIELDS = ("eur", "eur_foil", "eur_etched")
+
+
+def ident_key(set_code: str, collector_number: str, lang: str) -> str:
+    return f"{set_code}|{collector_number}|{lang}"
+
+
+def card_ident_key(c: Dict[str, Any]) -> str:
+    # Same normalisation as the merge step uses for Scryfall responses
+    return ident_key(
+        str(c.get("set", "")).lower(),
+        str(c.get("collector_number", "")).strip(),
+        str(c.get("lang", "en")).lower(),
+    )
+
+
+def load_card_cache(path: str) -> Dict[str, Dict[str, Any]]:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            content = f.read().strip()
+            if not content:
+                return {}
+            data = json.loads(content)
+            return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def save_card_cache(path: str, cache: Dict[str, Dict[str, Any]]) -> None:
+    # One entry per line, so a diff between two caches shows the cards that changed.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("{\n")
+        items = sorted(cache.items())
+        for i, (k, v) in enumerate(items):
+            sep = "," if i < len(items) - 1 else ""
+            f.write(f"{json.dumps(k, ensure_ascii=False)}: {json.dumps(v, ensure_ascii=False, sort_keys=True)}{sep}\n")
+        f.write("}\n")
+    os.replace(tmp, path)
+
+
+def cache_entry_to_card(entry: Dict[str, Any]) -> Dict[str, Any]:
+    card = {f: entry.get(f) for f in STATIC_FIELDS}
+    card["purchase_uris"] = {"cardmarket": entry.get("cardmarket_url")}
+    card["prices"] = dict(entry.get("prices") or {})
+    return card
+
+
+def remember_cards(cache: Dict[str, Dict[str, Any]], cards_data: List[Dict[str, Any]], now: float) -> None:
+    for c in cards_data:
+        prices = c.get("prices") or {}
+        purchase = c.get("purchase_uris") or {}
+        entry = {f: c.get(f) for f in STATIC_FIELDS}
+        entry["cardmarket_url"] = purchase.get("cardmarket")
+        entry["prices"] = {f: prices.get(f) for f in PRICE_FIELDS}
+        entry["prices_at"] = now
+        cache[card_ident_key(c)] = entry
+
+
+def remember_not_found(cache: Dict[str, Dict[str, Any]], not_found: List[Dict[str, Any]], now: float) -> None:
+    for ident in not_found:
+        k = ident_key(
+            str(ident.get("set", "")).lower(),
+            str(ident.get("collector_number", "")).strip(),
+            str(ident.get("lang", "en")).lower(),
+        )
+        # Never let a transient miss wipe out metadata we already know
+        if k in cache and "not_found_at" not in cache[k]:
+            continue
+        cache[k] = {"not_found_at": now}
+
+
+def split_cached(
+    identifiers: List[Dict[str, str]],
+    cache: Dict[str, Dict[str, Any]],
+    now: float,
+    price_ttl_s: float,
+    not_found_ttl_s: float,
+) -> Tuple[Dict[str, Dict[str, Any]], List[Dict[str, str]], Dict[str, int]]:
+    cached_cards: Dict[str, Dict[str, Any]] = {}
+    to_fetch: List[Dict[str, str]] = []
+    stats = {"hits": 0, "misses": 0, "not_found": 0}
+    seen = set()
+
+    for ident in identifiers:
+        k = ident_key(ident["set"], ident["collector_number"], ident["lang"])
+        # foil and nonfoil rows share one identifier; it only needs resolving once
+        if k in seen:
+            continue
+        seen.add(k)
+        entry = cache.get(k)
+        if entry is not None:
+            nf_at = entry.get("not_found_at")
+            if nf_at is not None:
+                if now - float(nf_at) < not_found_ttl_s:
+                    stats["not_found"] += 1
+                    continue
+            elif now - float(entry.get("prices_at") or 0) < price_ttl_s:
+                cached_cards[k] = cache_entry_to_card(entry)
+                stats["hits"] += 1
+                continue
+        to_fetch.append(ident)
+        stats["misses"] += 1
+
+    return cached_cards, to_fetch, stats
@@ -0,0 +1,211 @@
+import sys
+from collections import deque
+from collections.abc import Mapping
+from operator import attrgetter
+from typing import Any, Dict, Iterator, List, Tuple
+
+# A run keeps one record per printing for the collection (key_to_meta), this run's prices
+# and the previous snapshot's prices. As dicts each of those repeated every key and held
+# its own copy of set codes, languages and names; these records keep the fields in slots
+# and share the repeated strings (sys.intern), at a fraction of the size. They read like
+# the dicts they replace (card["eur"], card.get("risk"), iteration in field order, equal
+# to a dict with the same items), so alerts, the CSV writers and the dashboard don't care.
+
+# In the order merge_collection_batch() fills them, which is also the snapshot column order
+CARD_FIELDS = (
+    "name",
+    "set",
+    "collector_number",
+    "lang",
+    "foil_kind",
+    "qty",
+    "scryfall_uri",
+    "cardmarket_url",
+    "eur",
+    "released_year",
+    "reserved_list",
+    "risk",
+)
+# Low-cardinality text fields whose strings are shared between records
+INTERNED_FIELDS = frozenset(["name", "set", "lang", "foil_kind", "risk"])
+
+_FIELDS = frozenset(CARD_FIELDS)
+_UNSET: Any = object()
+_all_fields = attrgetter(*CARD_FIELDS)
+
+
+def intern_value(v: Any) -> Any:
+    return sys.intern(v) if type(v) is str else v
+
+
+class Card(Mapping):
+    # One printing. A field that was never set is absent, like a missing dict key; fields
+    # outside CARD_FIELDS (only ever seen in old snapshots) live in a side dict.
+    __slots__ = CARD_FIELDS + ("_extra",)
+
+    def __init__(
+        self,
+        name: Any = _UNSET,
+        set: Any = _UNSET,
+        collector_number: Any = _UNSET,
+        lang: Any = _UNSET,
+        foil_kind: Any = _UNSET,
+        qty: Any = _UNSET,
+        scryfall_uri: Any = _UNSET,
+        cardmarket_url: Any = _UNSET,
+        eur: Any = _UNSET,
+        released_year: Any = _UNSET,
+        reserved_list: Any = _UNSET,
+        risk: Any = _UNSET,
+    ):
+        # Spelled out: cards are built once per printing per run, so this is a hot path
+        self._extra: Dict[str, Any] | None = None
+        if name is not _UNSET:
+            self.name = name
+        if set is not _UNSET:
+            self.set = set
+        if collector_number is not _UNSET:
+            self.collector_number = collector_number
+        if lang is not _UNSET:
+            self.lang = lang
+        if foil_kind is not _UNSET:
+            self.foil_kind = foil_kind
+        if qty is not _UNSET:
+            self.qty = qty
+        if scryfall_uri is not _UNSET:
+            self.scryfall_uri = scryfall_uri
+        if cardmarket_url is not _UNSET:
+            self.cardmarket_url = cardmarket_url
+        if eur is not _UNSET:
+            self.eur = eur
+        if released_year is not _UNSET:
+            self.released_year = released_year
+        if reserved_list is not _UNSET:
+            self.reserved_list = reserved_list
+        if risk is not _UNSET:
+            self.risk = risk
+
+    @classmethod
+    def from_mapping(cls, data: Mapping) -> "Card":
+        if type(data) is cls:
+            return data
+        out = cls()
+        for f, v in data.items():
+            out.put(f, v)
+        return out
+
+    def put(self, field: str, value: Any) -> None:
+        if field in _FIELDS:
+            setattr(self, field, intern_value(value) if field in INTERNED_FIELDS else value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[field] = value
+
+    def priced(
+        self,
+        scryfall_uri: str | None,
+        cardmarket_url: str | None,
+        eur: float | None,
+        released_year: int | None,
+        reserved_list: bool,
+    ) -> "Card":
+        # This collection record with the Scryfall fields of one run added (risk is left
+        # for the caller, which derives it from the result)
+        return Card(
+            self.name, self.set, self.collector_number, self.lang, self.foil_kind, self.qty,
+            scryfall_uri, cardmarket_url, eur, released_year, reserved_list,
+        )
+
+    def merged(self, **fields: Any) -> "Card":
+        # A copy with fields set or replaced, like {**card, **fields}
+        out = Card()
+        for f in CARD_FIELDS:
+            v = getattr(self, f, _UNSET)
+            if v is not _UNSET:
+                setattr(out, f, v)
+        if self._extra:
+            out._extra = dict(self._extra)
+        for f, v in fields.items():
+            out.put(f, v)
+        return out
+
+    # ---- Mapping API ----
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _FIELDS:
+            v = getattr(self, key, _UNSET)
+            if v is not _UNSET:
+                return v
+        elif self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in _FIELDS:
+            return getattr(self, key, default)
+        if self._extra:
+            return self._extra.get(key, default)
+        return default
+
+    def __iter__(self) -> Iterator[str]:
+        for f in CARD_FIELDS:
+            if hasattr(self, f):
+                yield f
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"Card({dict(self)!r})"
+
+
+class CardPrice(Mapping):
+    # The previous snapshot's price of a card: the only field alerts and the weekly CSV
+    # read from it, without a full Card's slots
+    __slots__ = ("eur",)
+
+    def __init__(self, eur: float | None):
+        self.eur = eur
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "eur":
+            return self.eur
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.eur if key == "eur" else default
+
+    def __iter__(self) -> Iterator[str]:
+        yield "eur"
+
+    def __len__(self) -> int:
+        return 1
+
+    def __repr__(self) -> str:
+        return f"CardPrice({self.eur!r})"
+
+
+def fill_column(cards: List["Card"], field: str, values: List[Any]) -> None:
+    # cards[i][field] = values[i], with the slot written straight from C for known fields
+    if field not in _FIELDS:
+        for c, v in zip(cards, values):
+            c.put(field, v)
+        return
+    if field in INTERNED_FIELDS:
+        values = list(map(intern_value, values))
+    deque(map(getattr(Card, field).__set__, cards, values), maxlen=0)
+
+
+def full_columns(cards: List[Any]) -> Tuple[List[str], Dict[str, List[Any]]] | None:
+    # Every field as a column when all cards are Cards carrying exactly CARD_FIELDS (what a
+    # run produces), in one C-level pass; None when they don't
+    if not cards or not all(type(c) is Card and c._extra is None for c in cards):
+        return None
+    try:
+        rows = list(map(_all_fields, cards))
+    except AttributeError:
+        return None
+    return list(CARD_FIELDS), dict(zip(CARD_FIELDS, (list(col) for col in zip(*rows))))
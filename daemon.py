@@ -0,0 +1,197 @@
+import argparse
+import signal
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Any, Tuple
+
+from zoneinfo import ZoneInfo
+
+from discord_queue import DiscordQueue
+from pipeline import WarmState, parse_csv_list, parse_weekday, run, weekly_summary_path, write_weekly_summary_csv
+from scryfall import make_session
+from snapshot_store import load_snapshot
+
+# A changed CSV must keep the same mtime/size this long before it is picked up,
+# so a collection export that is still being written isn't read half-way.
+CSV_SETTLE_SECONDS = 2.0
+
+
+def _parse_hm(s: str) -> Tuple[int, int] | None:
+    try:
+        h, m = (s.strip().split(":") + ["0"])[:2]
+        return int(h), int(m)
+    except Exception:
+        return None
+
+
+def next_run_time(now_local: datetime, run_times_csv: str) -> datetime | None:
+    # Earliest configured HH:MM strictly after now (today or tomorrow)
+    best = None
+    for t in run_times_csv.split(","):
+        hm = _parse_hm(t) if t.strip() else None
+        if hm is None:
+            continue
+        for day in (0, 1):
+            d = now_local.date() + timedelta(days=day)
+            cand = datetime(d.year, d.month, d.day, hm[0], hm[1], tzinfo=now_local.tzinfo)
+            if cand > now_local:
+                best = cand if best is None or cand < best else best
+                break
+    return best
+
+
+def next_weekly_time(now_local: datetime, weekly_day: str, weekly_time: str) -> datetime | None:
+    hm = _parse_hm(weekly_time or "19:00")
+    if hm is None:
+        return None
+    days_ahead = (parse_weekday(weekly_day) - now_local.weekday()) % 7
+    for extra in (0, 7):
+        d = now_local.date() + timedelta(days=days_ahead + extra)
+        cand = datetime(d.year, d.month, d.day, hm[0], hm[1], tzinfo=now_local.tzinfo)
+        if cand > now_local:
+            return cand
+    return None
+
+
+class TrackerDaemon:
+    # Keeps a WarmState alive and calls pipeline.run() itself: alert runs at --run-times,
+    # the weekly summary at --weekly-day/--weekly-time (folded into an alert run at the
+    # same minute, otherwise written from the last run's prices) and an incremental
+    # refresh whenever a collection CSV changes.
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.tz = ZoneInfo(args.tz)
+        self.poll_s = max(1.0, float(args.daemon_poll))
+        self.csv_paths = parse_csv_list(args.csv)
+        self.warm = WarmState()
+        self.warm.scryfall_session = make_session(pool_size=args.fetch_workers)
+        self.warm.discord_session = DiscordQueue._make_session()
+        self.stop = threading.Event()
+        self._csv_seen = self.warm.csv_signature(self.csv_paths)
+
+        # CSV changes are priced incrementally unless a baseline was asked for
+        if not args.baseline_on_csv_change:
+            args.incremental_on_csv_change = True
+
+    def _now(self) -> datetime:
+        return datetime.now(self.tz)
+
+    def _run(self, label: str, **kwargs: Any) -> None:
+        print(f"[daemon] {label} run at {self._now().strftime('%Y-%m-%d %H:%M:%S')}")
+        t0 = time.perf_counter()
+        try:
+            run(self.args, warm=self.warm, **kwargs)
+        except SystemExit as e:
+            print(f"[daemon] {label} run stopped: {e}")
+        except Exception:
+            traceback.print_exc()
+        print(f"[daemon] {label} run finished in {time.perf_counter() - t0:.2f}s")
+
+    def _weekly_only(self) -> None:
+        if self.warm.last_run is None:
+            # Nothing priced yet in this process: price now, write the summary, stay quiet on Discord
+            no_discord = self.args.no_discord
+            self.args.no_discord = True
+            try:
+                self._run("weekly", scheduled=True, weekly=True)
+            finally:
+                self.args.no_discord = no_discord
+            return
+        curr_cards, prev_cards, rate, prev_rate, prev_key_rates = self.warm.last_run
+        path = weekly_summary_path(self.args)
+        write_weekly_summary_csv(
+            out_path=path,
+            cards=curr_cards,
+            rate_gbp_per_eur=rate,
+            prev_cards=prev_cards,
+            prev_rate_gbp_per_eur=prev_rate,
+            prev_key_rates=prev_key_rates,
+        )
+        print(f"[daemon] weekly summary written to {path}")
+
+    def _csv_changed(self) -> bool:
+        sig = self.warm.csv_signature(self.csv_paths)
+        if sig == self._csv_seen:
+            return False
+        # Wait for the file(s) to stop changing
+        while not self.stop.wait(CSV_SETTLE_SECONDS):
+            settled = self.warm.csv_signature(self.csv_paths)
+            if settled == sig:
+                break
+            sig = settled
+        if self.stop.is_set():
+            return False
+        self._csv_seen = sig
+        return all(s is not None for _, s in sig)
+
+    def _warm_up(self) -> bool:
+        # Load everything a run needs once; True when the CSV no longer matches the snapshot
+        args = self.args
+        t0 = time.perf_counter()
+        csv_hash = self.warm.csv_hash(self.csv_paths)
+        self.warm.collection(self.csv_paths, args.csv_engine)
+        if args.card_cache and not args.bulk_file:
+            self.warm.card_cache(args.card_cache)
+        if args.history_db:
+            self.warm.history(args)
+        snap = load_snapshot(args.snapshot, legacy_json_path=args.legacy_snapshot)
+        if snap:
+            self.warm.remember_snapshot(args.snapshot, snap)
+        print(f"[daemon] warm state loaded in {time.perf_counter() - t0:.2f}s")
+        return (snap.get("_meta") or {}).get("csv_sha256") != csv_hash
+
+    def _schedule(self) -> Tuple[datetime | None, datetime | None]:
+        now = self._now()
+        return next_run_time(now, self.args.run_times), next_weekly_time(now, self.args.weekly_day, self.args.weekly_time)
+
+    def serve(self) -> None:
+        next_run, next_weekly = self._schedule()
+        print(
+            f"[daemon] watching {', '.join(self.csv_paths)}; next run "
+            f"{next_run.strftime('%Y-%m-%d %H:%M') if next_run else 'never'}, weekly summary "
+            f"{next_weekly.strftime('%Y-%m-%d %H:%M') if next_weekly else 'never'} ({self.args.tz})"
+        )
+        try:
+            try:
+                stale = self._warm_up()
+            except SystemExit as e:
+                print(f"[daemon] could not load the collection yet: {e}")
+                stale = False
+            if stale:
+                self._run("csv-change", scheduled=False, weekly=False)
+            while not self.stop.is_set():
+                now = self._now()
+                run_due = next_run is not None and now >= next_run
+                weekly_due = next_weekly is not None and now >= next_weekly
+                if run_due:
+                    self._run("scheduled", scheduled=True, weekly=weekly_due)
+                elif weekly_due:
+                    self._weekly_only()
+                elif self._csv_changed():
+                    self._run("csv-change", scheduled=False, weekly=False)
+                if run_due or weekly_due:
+                    next_run, next_weekly = self._schedule()
+                    continue
+
+                upcoming = [t for t in (next_run, next_weekly) if t is not None]
+                wait = self.poll_s
+                if upcoming:
+                    wait = min(wait, max(0.0, (min(upcoming) - self._now()).total_seconds()))
+                self.stop.wait(wait)
+        finally:
+            self.warm.close()
+            print("[daemon] stopped")
+
+
+def run_daemon(args: argparse.Namespace) -> None:
+    d = TrackerDaemon(args)
+
+    def _stop(signum: int, frame: Any) -> None:
+        d.stop.set()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    d.serve()
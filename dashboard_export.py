@@ -0,0 +1,330 @@
+import gzip
+import hashlib
+import json
+import zlib
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, List, Mapping, Tuple
+
+from profiling import PROFILER
+
+DASHBOARD_SHARDS = 64
+MANIFEST_FIELDS = ["label", "base", "set", "cn", "lang", "finish", "rarity", "shard"]
+MOVERS_WINDOWS = [1, 7, 30]
+MOVERS_LIMIT = 8
+
+# Bump when the shard/movers layout or fingerprint rules change, forcing one full rebuild
+EXPORT_STATE_VERSION = 1
+EXPORT_STATE_FILE = "export_state.json"
+
+# Written by the old monolithic exporter; removed so the page can't pick up stale data
+LEGACY_FILES = ["prices.json", "cards.json"]
+
+
+def _safe_float(v: Any) -> float | None:
+    try:
+        if v is None:
+            return None
+        return float(v)
+    except Exception:
+        return None
+
+
+def _date_yyyy_mm_dd_from_iso(ts: str) -> str | None:
+    if not isinstance(ts, str) or not ts.strip():
+        return None
+    # Extended ISO dates (what the tracker writes) parse to their first ten characters
+    if len(ts) >= 10 and ts[4] == "-" and ts[7] == "-":
+        return ts[:10]
+    try:
+        dt = datetime.fromisoformat(ts)
+        return dt.date().isoformat()
+    except Exception:
+        return None
+
+
+def _dashboard_label(info: Dict[str, Any]) -> str:
+    name = str(info.get("name") or "").strip()
+    set_code = str(info.get("set") or "").upper()
+    cn = str(info.get("collector_number") or "").strip()
+    lang = str(info.get("lang") or "").strip()
+    fk = str(info.get("foil_kind") or "").strip()
+    return f"{name} ({set_code} #{cn} {lang} {fk})".strip()
+
+
+def shard_for_base(base: str, shards: int) -> int:
+    # crc32 is stable across runs/processes (unlike hash()), so a card never hops shards
+    return zlib.crc32(base.encode("utf-8")) % max(1, shards)
+
+
+def shard_filename(shard: int) -> str:
+    return f"shard-{shard:03d}.json"
+
+
+def _dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+
+def write_json_variants(path: Path, obj: Any, old_digest: str | None = None) -> Tuple[str, bool]:
+    # Compact JSON plus a .gz sibling for servers that serve pre-compressed files.
+    # Skipped when the content hash matches the last export, so unchanged files stay
+    # byte-identical (and untouched); mtime=0 keeps the gzip bytes deterministic too.
+    raw = _dumps(obj)
+    digest = hashlib.sha256(raw).hexdigest()
+    gz_path = Path(str(path) + ".gz")
+    if digest == old_digest and path.exists() and gz_path.exists():
+        return digest, False
+    path.write_bytes(raw)
+    gz_path.write_bytes(gzip.compress(raw, compresslevel=6, mtime=0))
+    return digest, True
+
+
+def _series_per_day(entries: Any) -> List[List[Any]]:
+    if not isinstance(entries, list):
+        return []
+    per_day: Dict[str, float] = {}
+    for e in entries:
+        if not isinstance(e, dict):
+            continue
+        day = _date_yyyy_mm_dd_from_iso(e.get("ts"))
+        if not day:
+            continue
+
+        gbp = _safe_float(e.get("gbp"))
+        eur = _safe_float(e.get("eur"))
+        price = gbp if gbp is not None else eur
+        if price is None:
+            continue
+
+        per_day[day] = float(price)
+    return [[d, per_day[d]] for d in sorted(per_day.keys())]
+
+
+def combine_series(series_list: List[List[List[Any]]]) -> List[List[Any]]:
+    # Combined view of a base card: the highest printing price on each day
+    per_day: Dict[str, float] = {}
+    for series in series_list:
+        for d, price in series:
+            curr = per_day.get(d)
+            if curr is None or price > curr:
+                per_day[d] = price
+    return [[d, per_day[d]] for d in sorted(per_day.keys())]
+
+
+def mover_inputs(series: List[List[Any]]) -> List[Any]:
+    # [last day, last price, start price per MOVERS_WINDOWS entry (None if the series is too short)].
+    # Start = last point on/before (last day - window), like the page's old client-side calculation.
+    last_day, last_price = series[-1]
+    days = [d for d, _ in series]
+    out: List[Any] = [last_day, last_price]
+    for window in MOVERS_WINDOWS:
+        start_iso = (date.fromisoformat(last_day) - timedelta(days=window)).isoformat()
+        i = bisect_right(days, start_iso) - 1
+        out.append(series[i][1] if i >= 0 else None)
+    return out
+
+
+def rank_movers(
+    inputs: Dict[str, List[Any]],
+    counts: Dict[str, Tuple[int, int]],
+    limit: int = MOVERS_LIMIT,
+) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+    windows = {}
+    for wi, window in enumerate(MOVERS_WINDOWS):
+        movers = []
+        for base in sorted(inputs.keys()):
+            last_price, start_price = inputs[base][1], inputs[base][2 + wi]
+            if start_price is None:
+                continue
+            delta = last_price - start_price
+            printings, sets = counts.get(base, (0, 0))
+            movers.append({
+                "base": base,
+                "delta": delta,
+                "pct": (delta / start_price) * 100 if start_price else None,
+                "printings": printings,
+                "sets": sets,
+            })
+        windows[str(window)] = {
+            "gainers": sorted((m for m in movers if m["delta"] > 0), key=lambda m: -m["delta"])[:limit],
+            "losers": sorted((m for m in movers if m["delta"] < 0), key=lambda m: m["delta"])[:limit],
+        }
+    return windows
+
+
+def _load_export_state(path: Path, shards: int) -> Dict[str, Any] | None:
+    # Anything unreadable or written with different settings means a full rebuild
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or state.get("version") != EXPORT_STATE_VERSION or state.get("shards") != shards:
+        return None
+    return state
+
+
+@PROFILER.timed("dashboard_export")
+def export_dashboard_from_history(
+    *,
+    history: Mapping[str, List[Dict[str, Any]]],
+    curr_cards: Dict[str, Any],
+    out_dir: str = "docs/data",
+    shards: int = DASHBOARD_SHARDS,
+) -> Tuple[str, str, int, int, int]:
+    # docs/data/manifest.json  - one row per printing (label, base name, set, ..., shard)
+    # docs/data/prices/shard-NNN.json - {"printings": {label: [[date, price], ...]},
+    #                                     "combined": {base: [[date, max price], ...]}}
+    # docs/data/movers.json    - top gainers/losers per window in MOVERS_WINDOWS
+    # docs/data/export_state.json - per-label history fingerprints, per-file content hashes and
+    #                               per-base mover inputs from the previous export
+    # The page loads the manifest and movers up front and a shard only when one of its cards is shown.
+    #
+    # Only shards holding a card whose history fingerprint changed are rebuilt, and only the
+    # changed series in them are re-read from history; files whose content hash is unchanged
+    # are not rewritten. Without fingerprints (JSON history) every series is rebuilt, but
+    # unchanged files are still left alone. Delete export_state.json to force a full rebuild.
+    out_path = Path(out_dir)
+    shard_dir = out_path / "prices"
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    state_path = out_path / EXPORT_STATE_FILE
+
+    state = _load_export_state(state_path, shards)
+    old_labels: Dict[str, List[Any]] = (state or {}).get("labels", {})
+    old_hashes: Dict[str, str] = (state or {}).get("files", {})
+    old_movers: Dict[str, List[Any]] = (state or {}).get("movers", {})
+
+    rows: Dict[str, List[Any]] = {}
+    label_keys: Dict[str, List[str]] = {}
+    for k, info in curr_cards.items():
+        label = _dashboard_label(info)
+        label_keys.setdefault(label, []).append(k)
+        if label not in rows:
+            base = str(info.get("name") or "").strip() or label
+            rows[label] = [
+                label,
+                base,
+                info.get("set"),
+                str(info.get("collector_number") or "").strip(),
+                info.get("lang"),
+                info.get("foil_kind"),
+                info.get("rarity"),
+                shard_for_base(base, shards),
+            ]
+
+    fingerprints = history.series_fingerprints() if hasattr(history, "series_fingerprints") else None
+    label_fp: Dict[str, str | None] = {
+        label: None if fingerprints is None else "/".join(fingerprints.get(k, "") for k in keys)
+        for label, keys in label_keys.items()
+    }
+
+    labels_by_shard: Dict[int, List[str]] = {}
+    labels_by_base: Dict[str, List[str]] = {}
+    sets_by_base: Dict[str, set] = {}
+    for label, row in rows.items():
+        labels_by_shard.setdefault(row[-1], []).append(label)
+        labels_by_base.setdefault(row[1], []).append(label)
+        if row[2]:
+            sets_by_base.setdefault(row[1], set()).add(str(row[2]).lower())
+    counts = {base: (len(labels), len(sets_by_base.get(base, ()))) for base, labels in labels_by_base.items()}
+
+    old_labels_by_shard: Dict[int, set] = {}
+    for label, (shard, _, _) in old_labels.items():
+        old_labels_by_shard.setdefault(shard, set()).add(label)
+
+    def changed(label: str) -> bool:
+        fp = label_fp[label]
+        return fp is None or label not in old_labels or old_labels[label][1] != fp
+
+    dirty: Dict[int, List[str]] = {}
+    for shard, labels in labels_by_shard.items():
+        name = shard_filename(shard)
+        on_disk = name in old_hashes and (shard_dir / name).exists()
+        stale = [lb for lb in labels if changed(lb)] if on_disk else labels
+        if stale or set(labels) != old_labels_by_shard.get(shard, set()):
+            dirty[shard] = stale
+
+    # Fresh series for the changed labels: one scan when most of history is needed, else per-key reads
+    # A history store also serves its daily/weekly roll-ups, so series reach back past the raw points
+    wanted = {k: label for shard_stale in dirty.values() for label in shard_stale for k in label_keys[label]}
+    read_all, read_one = history.items, history.get
+    if hasattr(history, "chart_items"):
+        read_all, read_one = history.chart_items, history.chart_entries
+    fresh: Dict[str, List[List[Any]]] = {}
+    if len(wanted) * 4 > len(label_fp):
+        source = ((k, entries) for k, entries in read_all() if k in wanted)
+    else:
+        source = ((k, read_one(k)) for k in wanted)
+    for k, entries in source:
+        series = _series_per_day(entries)
+        if series:
+            fresh[wanted[k]] = series
+
+    new_labels: Dict[str, List[Any]] = {}
+    new_hashes: Dict[str, str] = {}
+    movers_in: Dict[str, List[Any]] = {}
+    written = 0
+    for shard, labels in labels_by_shard.items():
+        name = shard_filename(shard)
+        if shard not in dirty:
+            for label in labels:
+                new_labels[label] = old_labels[label]
+            for base in {rows[lb][1] for lb in labels}:
+                if base in old_movers:
+                    movers_in[base] = old_movers[base]
+            new_hashes[name] = old_hashes[name]
+            continue
+
+        stale = set(dirty[shard])
+        printings: Dict[str, List[List[Any]]] = {}
+        if len(stale) < len(labels):
+            with open(shard_dir / name, "r", encoding="utf-8") as f:
+                printings = {lb: s for lb, s in json.load(f)["printings"].items() if lb in rows and lb not in stale}
+        for label in stale:
+            if label in fresh:
+                printings[label] = fresh[label]
+        for label in labels:
+            new_labels[label] = [shard, label_fp[label], int(label in printings)]
+
+        combined: Dict[str, List[List[Any]]] = {}
+        for base in {rows[lb][1] for lb in labels}:
+            series = combine_series([printings[lb] for lb in labels_by_base[base] if lb in printings])
+            if series:
+                combined[base] = series
+                movers_in[base] = mover_inputs(series)
+
+        new_hashes[name], did_write = write_json_variants(
+            shard_dir / name, {"printings": printings, "combined": combined}, old_hashes.get(name)
+        )
+        written += did_write
+
+    manifest_rows = sorted(rows.values(), key=lambda r: (r[0].lower(), r[0]))
+    manifest = {"version": 1, "shards": shards, "fields": MANIFEST_FIELDS, "rows": manifest_rows}
+    manifest_out = out_path / "manifest.json"
+    new_hashes["manifest.json"], _ = write_json_variants(manifest_out, manifest, old_hashes.get("manifest.json"))
+    new_hashes["movers.json"], _ = write_json_variants(
+        out_path / "movers.json", {"windows": rank_movers(movers_in, counts)}, old_hashes.get("movers.json")
+    )
+
+    new_state = {
+        "version": EXPORT_STATE_VERSION,
+        "shards": shards,
+        "files": new_hashes,
+        "labels": new_labels,
+        "movers": movers_in,
+    }
+    raw_state = _dumps(new_state)
+    if not state_path.exists() or state_path.read_bytes() != raw_state:
+        state_path.write_bytes(raw_state)
+
+    # Shards whose cards all left the collection (or a changed --dashboard-shards)
+    keep = {n for name in new_hashes for n in (name, name + ".gz")}
+    for p in shard_dir.glob("shard-*.json*"):
+        if p.name not in keep:
+            p.unlink()
+    for name in LEGACY_FILES:
+        (out_path / name).unlink(missing_ok=True)
+
+    series_count = sum(v[2] for v in new_labels.values())
+    return str(manifest_out), str(shard_dir), len(manifest_rows), series_count, written
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, Any, Iterable, List, Tuple
+
+from profiling import PROFILER
+
+# Annotations only; requests is imported by the methods that send
+if TYPE_CHECKING:
+    import requests
+
+DISCORD_PENDING_PATH = "data/discord_pending.json"
+
+# Webhook message content limit
+DISCORD_CONTENT_LIMIT = 2000
+DISCORD_MAX_RETRIES = 5
+
+
+def _split_long(text: str, limit: int) -> List[str]:
+    # Break an oversized message on line boundaries (hard-cutting only single lines over the limit)
+    parts: List[str] = []
+    cur = ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if cur:
+                parts.append(cur)
+                cur = ""
+            parts.append(line[:limit])
+            line = line[limit:]
+        if cur and len(cur) + 1 + len(line) > limit:
+            parts.append(cur)
+            cur = line
+        else:
+            cur = f"{cur}\n{line}" if cur else line
+    if cur.strip():
+        parts.append(cur)
+    return parts
+
+
+def pack_messages(messages: Iterable[str], limit: int = DISCORD_CONTENT_LIMIT) -> List[str]:
+    # Greedily joins consecutive messages (blank line between) into as few payloads as fit,
+    # keeping their order.
+    payloads: List[str] = []
+    cur = ""
+    for m in messages:
+        m = (m or "").strip()
+        if not m:
+            continue
+        for piece in _split_long(m, limit) if len(m) > limit else [m]:
+            if cur and len(cur) + 2 + len(piece) <= limit:
+                cur = cur + "\n\n" + piece
+            else:
+                if cur:
+                    payloads.append(cur)
+                cur = piece
+    if cur:
+        payloads.append(cur)
+    return payloads
+
+
+def _float_header(headers: Any, name: str) -> float | None:
+    try:
+        v = headers.get(name)
+        return float(v) if v is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class DiscordQueue:
+    # Ordered outbox for one webhook: post() queues messages, start() packs them and
+    # sends from a background thread, finish() waits and saves anything undelivered to
+    # pending_path, which the next run's queue sends first.
+    #
+    # Rate limits follow Discord's headers: X-RateLimit-Remaining / Reset-After per
+    # X-RateLimit-Bucket (requests wait for the bucket to reset instead of hitting 429),
+    # and a 429's retry_after pauses the route, or every route when it is global.
+
+    def __init__(
+        self,
+        webhook_url: str,
+        *,
+        pending_path: str = DISCORD_PENDING_PATH,
+        session: requests.Session | None = None,
+        max_retries: int = DISCORD_MAX_RETRIES,
+    ):
+        self.webhook_url = webhook_url
+        self.pending_path = pending_path
+        self.max_retries = max(0, int(max_retries))
+        self.session = session or self._make_session()
+        self.messages: List[str] = []
+        self.payloads: List[str] = []
+        self.sent = 0
+        self.dropped = 0
+        self._buckets: Dict[str, Dict[str, float]] = {}
+        self._route_bucket: Dict[str, str] = {}
+        self._global_until = 0.0
+        self._thread: threading.Thread | None = None
+
+    @staticmethod
+    def _make_session() -> requests.Session:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        s = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        s.mount("https://", adapter)
+        s.mount("http://", adapter)
+        return s
+
+    # ---- queueing ----
+
+    def post(self, content: str) -> None:
+        self.messages.append(content)
+
+    def extend(self, contents: Iterable[str]) -> None:
+        self.messages.extend(contents)
+
+    def _load_pending(self) -> List[str]:
+        if not self.pending_path or not os.path.exists(self.pending_path):
+            return []
+        try:
+            with open(self.pending_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return [p["content"] for p in data.get("payloads", []) if p.get("content")]
+        except Exception:
+            return []
+
+    def _save_pending(self, payloads: List[str]) -> None:
+        if not self.pending_path:
+            return
+        if not payloads:
+            if os.path.exists(self.pending_path):
+                os.remove(self.pending_path)
+            return
+        if os.path.dirname(self.pending_path):
+            os.makedirs(os.path.dirname(self.pending_path), exist_ok=True)
+        now = datetime.now(timezone.utc).isoformat()
+        tmp = self.pending_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"payloads": [{"content": p, "queued_at": now} for p in payloads]}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.pending_path)
+
+    # ---- delivery ----
+
+    def start(self) -> None:
+        # Leftovers from earlier runs go first so the channel stays in order
+        pending = self._load_pending()
+        self.payloads = pending + pack_messages(self.messages)
+        self.messages = []
+        if pending:
+            print(f"[discord] retrying {len(pending)} undelivered payload(s) from a previous run")
+        self._thread = threading.Thread(target=self._deliver_all, name="discord-queue", daemon=True)
+        self._thread.start()
+
+    @PROFILER.timed("discord")
+    def finish(self, timeout: float | None = None) -> Tuple[int, int]:
+        # Returns (delivered, left pending); never raises for delivery failures
+        if self._thread is None:
+            self.start()
+        self._thread.join(timeout)
+        left = self.payloads[self.sent + self.dropped:]
+        self._save_pending(left)
+        if left:
+            print(f"[discord] {len(left)} payload(s) undelivered, saved to {self.pending_path}")
+        return self.sent, len(left)
+
+    def _deliver_all(self) -> None:
+        for content in self.payloads:
+            status = self._send(content)
+            if status == "sent":
+                self.sent += 1
+            elif status == "rejected":
+                self.dropped += 1
+            else:
+                # Keep order: everything from here on waits for the next run
+                return
+
+    def _wait_for_route(self) -> None:
+        now = time.monotonic()
+        wait = self._global_until - now
+        b = self._buckets.get(self._route_bucket.get(self.webhook_url, ""))
+        if b and b["remaining"] <= 0:
+            wait = max(wait, b["reset_at"] - now)
+        if wait > 0:
+            time.sleep(wait)
+
+    def _update_bucket(self, headers: Any) -> None:
+        bucket = headers.get("X-RateLimit-Bucket")
+        remaining = _float_header(headers, "X-RateLimit-Remaining")
+        reset_after = _float_header(headers, "X-RateLimit-Reset-After")
+        if not bucket or remaining is None or reset_after is None:
+            return
+        self._route_bucket[self.webhook_url] = bucket
+        self._buckets[bucket] = {"remaining": remaining, "reset_at": time.monotonic() + reset_after}
+
+    def _send(self, content: str) -> str:
+        # "sent", "rejected" (4xx other than 429: retrying can't help) or "failed"
+        import requests
+
+        backoff = 1.0
+        for _ in range(self.max_retries + 1):
+            self._wait_for_route()
+            try:
+                with PROFILER.http("discord.webhook") as rec:
+                    r = self.session.post(self.webhook_url, json={"content": content}, timeout=30)
+                    if rec is not None:
+                        rec["status"] = r.status_code
+            except requests.RequestException as e:
+                print(f"[discord] request failed: {e}")
+                time.sleep(backoff)
+                backoff *= 2
+                continue
+
+            self._update_bucket(r.headers)
+            if r.status_code == 429:
+                try:
+                    body = r.json()
+                except ValueError:
+                    body = {}
+                retry_after = body.get("retry_after") or _float_header(r.headers, "Retry-After") or 1.0
+                if body.get("global") or r.headers.get("X-RateLimit-Global"):
+                    self._global_until = time.monotonic() + float(retry_after)
+                else:
+                    time.sleep(float(retry_after))
+                continue
+            if r.status_code >= 500:
+                time.sleep(backoff)
+                backoff *= 2
+                continue
+            if r.status_code >= 400:
+                print(f"[discord] payload rejected ({r.status_code}): {r.text[:200]}")
+                return "rejected"
+            return "sent"
+        return "failed"
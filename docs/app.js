@@ -4,8 +4,11 @@
    - Printing selector for specific printings
    - View mode: Combined (default) or Specific printing
    - Combined aggregation: MAX price per day across printings
-   - Dynamic Top Movers (24h / 7d)
+   - Top Movers (24h / 7d / 30d), precomputed by the exporter
    - Movers show printing + set counts and are clickable
+   - Loads data/manifest.json and data/movers.json up front; price shards
+     (data/prices/shard-NNN.json, per-printing and combined series) are fetched
+     only when a card in them is shown
 */
 
 const els = {
@@ -25,10 +28,14 @@ const els = {
   movers: document.getElementById("movers"),
 };
 
-let cards = [];
+let manifest = null;
+let movers = null;
 let pricesById = {};
+let combinedByBase = {};
 let chart = null;
 
+const loadedShards = new Map();
+
 let baseNames = [];
 let printingsByBase = new Map();
 let selectedBase = null;
@@ -110,25 +117,42 @@ function parseLabel(label) {
   return out;
 }
 
-/* ---------------- Aggregation ---------------- */
+function printingFromRow(row) {
+  // Row fields come from manifest.fields; the base name is exported as-is so names
+  // containing parentheses don't depend on label parsing
+  const r = {};
+  manifest.fields.forEach((f, i) => { r[f] = row[i]; });
+  const p = parseLabel(r.label);
+  p.baseName = r.base || p.baseName;
+  p.shard = r.shard;
+  return p;
+}
 
-function buildCombinedSeries(baseName) {
-  const printings = printingsByBase.get(baseName) || [];
-  const perDay = new Map();
+/* ---------------- Shards ---------------- */
 
-  for (const p of printings) {
-    const series = pricesById[p.id] || [];
-    for (const pt of series) {
-      const curr = perDay.get(pt.date);
-      if (curr === undefined || pt.price > curr) {
-        perDay.set(pt.date, pt.price);
+function shardPath(shard) {
+  return `./data/prices/shard-${String(shard).padStart(3, "0")}.json`;
+}
+
+function ensureShard(shard) {
+  if (!loadedShards.has(shard)) {
+    const pending = loadJson(shardPath(shard)).then(data => {
+      for (const [label, points] of Object.entries(data.printings)) {
+        pricesById[label] = points.map(([date, price]) => ({ date, price }));
+      }
+      for (const [base, points] of Object.entries(data.combined)) {
+        combinedByBase[base] = points.map(([date, price]) => ({ date, price }));
       }
-    }
+    });
+    // A failed fetch can be retried on the next selection
+    pending.catch(() => loadedShards.delete(shard));
+    loadedShards.set(shard, pending);
   }
+  return loadedShards.get(shard);
+}
 
-  return Array.from(perDay.entries())
-    .sort((a, b) => a[0].localeCompare(b[0]))
-    .map(([date, price]) => ({ date, price }));
+function ensureShardsFor(printings) {
+  return Promise.all([...new Set(printings.map(p => p.shard))].map(ensureShard));
 }
 
 /* ---------------- Stats ---------------- */
@@ -158,43 +182,10 @@ function computeStats(series) {
 
 /* ---------------- Movers ---------------- */
 
-function getMetaCounts(baseName) {
-  const printings = printingsByBase.get(baseName) || [];
-  const sets = new Set(printings.map(p => p.set).filter(Boolean));
-  return { printings: printings.length, sets: sets.size };
-}
-
-function computeMovers(days, limit = 8) {
-  const movers = [];
-
-  for (const baseName of baseNames) {
-    const combined = buildCombinedSeries(baseName);
-    if (!combined.length) continue;
-
-    const last = combined[combined.length - 1];
-    const startISO = isoMinusDays(last.date, days);
-    const startPt = getClosestOnOrBefore(combined, startISO);
-    if (!startPt) continue;
-
-    const delta = last.price - startPt.price;
-    movers.push({
-      baseName,
-      delta,
-      pct: pctChange(startPt.price, last.price),
-      meta: getMetaCounts(baseName),
-    });
-  }
-
-  return {
-    gainers: movers.filter(m => m.delta > 0).sort((a, b) => b.delta - a.delta).slice(0, limit),
-    losers: movers.filter(m => m.delta < 0).sort((a, b) => a.delta - b.delta).slice(0, limit),
-  };
-}
-
 function renderMovers() {
   const days = Number(els.moversWindow?.value || 7);
   const label = days === 1 ? "24h" : `${days}d`;
-  const { gainers, losers } = computeMovers(days);
+  const { gainers, losers } = movers.windows[String(days)] || { gainers: [], losers: [] };
 
   els.movers.innerHTML = "";
 
@@ -211,8 +202,8 @@ function renderMovers() {
     li.style.cursor = "pointer";
     const delta = `${m.delta >= 0 ? "+" : ""}${formatGBP(m.delta)}`;
     const pct = m.pct == null ? "—" : `${m.pct >= 0 ? "+" : ""}${m.pct.toFixed(1)}%`;
-    li.textContent = `${m.baseName} (${m.meta.printings}p · ${m.meta.sets}s): ${delta} (${pct})`;
-    li.onclick = () => setSelectedBase(m.baseName);
+    li.textContent = `${m.base} (${m.printings}p · ${m.sets}s): ${delta} (${pct})`;
+    li.onclick = () => setSelectedBase(m.base).catch(console.error);
     return li;
   };
 
@@ -248,12 +239,16 @@ function renderChart(label, series) {
   });
 }
 
-function applyViewState() {
-  const printings = printingsByBase.get(selectedBase) || [];
+async function applyViewState() {
+  const base = selectedBase;
+  const printings = printingsByBase.get(base) || [];
   const mode = els.viewMode.value;
 
+  await ensureShardsFor(printings);
+  if (base !== selectedBase) return;  // another card was picked while this shard loaded
+
   if (mode === "combined" || printings.length <= 1) {
-    const series = buildCombinedSeries(selectedBase);
+    const series = combinedByBase[selectedBase] || [];
     els.cardTitle.textContent = `${selectedBase} — Combined`;
     renderChart(selectedBase, series);
     return;
@@ -269,7 +264,7 @@ function setSelectedBase(name) {
   selectedBase = name;
   const printings = printingsByBase.get(name) || [];
   selectedPrintingId = printings[0]?.id || null;
-  applyViewState();
+  return applyViewState();
 }
 
 /* ---------------- Init ---------------- */
@@ -281,12 +276,12 @@ async function loadJson(path) {
 }
 
 async function init() {
-  [cards, pricesById] = await Promise.all([
-    loadJson("./data/cards.json"),
-    loadJson("./data/prices.json"),
+  [manifest, movers] = await Promise.all([
+    loadJson("./data/manifest.json"),
+    loadJson("./data/movers.json"),
   ]);
 
-  const printings = cards.map(c => parseLabel(c.name));
+  const printings = manifest.rows.map(printingFromRow);
   for (const p of printings) {
     if (!printingsByBase.has(p.baseName)) printingsByBase.set(p.baseName, []);
     printingsByBase.get(p.baseName).push(p);
@@ -295,12 +290,13 @@ async function init() {
   baseNames = Array.from(printingsByBase.keys()).sort();
   els.cardSelect.innerHTML = baseNames.map(n => `<option>${n}</option>`).join("");
 
-  setSelectedBase(baseNames[0]);
-  renderMovers();
+  els.cardSelect.onchange = e => setSelectedBase(e.target.value).catch(console.error);
+  els.viewMode.onchange = () => applyViewState().catch(console.error);
 
-  els.cardSelect.onchange = e => setSelectedBase(e.target.value);
-  els.viewMode.onchange = applyViewState;
   els.moversWindow.onchange = renderMovers;
+
+  renderMovers();
+  await setSelectedBase(baseNames[0]);
 }
 
 init().catch(console.error);
@@ -0,0 +1,95 @@
+import json
+import os
+import time
+from typing import Dict, Any, Iterable, Iterator, List, Set, Tuple
+
+from card_cache import ident_key
+from scryfall import slim_card
+
+FETCH_CHECKPOINT_PATH = "data/fetch_checkpoint.jsonl"
+
+# Layout (one JSON object per line, appended as batches complete):
+#   {"csv_sha256": ..., "started_at": ...}                      header
+#   {"at": ..., "keys": [...], "data": [...], "not_found": [...]}  one per Scryfall batch
+# "keys" are the ident_keys the batch asked for; "data" holds slim_card() responses.
+# A run killed mid-line leaves a torn line; it is skipped on resume and its batch refetched.
+
+
+def _batch_keys(batch: Iterable[Dict[str, str]]) -> List[str]:
+    return [ident_key(i["set"], i["collector_number"], i["lang"]) for i in batch]
+
+
+class FetchCheckpoint:
+    # Scryfall batches a run has already paid for. A run that dies part-way (retries
+    # exhausted, runner killed) leaves the file behind; the next run for the same
+    # collection (csv_sha256) replays those batches and only fetches the rest. A
+    # checkpoint started more than max_age_s ago is ignored and its batches refetched.
+
+    def __init__(self, path: str, csv_sha256: str, max_age_s: float):
+        self.path = path
+        self.csv_sha256 = csv_sha256
+        self.max_age_s = max_age_s
+        self.done: Set[str] = set()
+        self._f = None
+
+    def resume(self) -> Iterator[Tuple[float, Dict[str, Any]]]:
+        # (fetched_at, {"data", "not_found"}) per checkpointed batch of this collection;
+        # their keys land in self.done. A file for another collection (or too old) is ignored.
+        try:
+            f = open(self.path, "r", encoding="utf-8")
+        except OSError:
+            return
+        with f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                return
+            if not isinstance(header, dict) or header.get("csv_sha256") != self.csv_sha256:
+                return
+            if time.time() - float(header.get("started_at") or 0) >= self.max_age_s:
+                return
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self.done.update(entry.get("keys") or [])
+                yield float(entry.get("at") or 0), entry
+
+    def pending(self, identifiers: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        return [i for i, k in zip(identifiers, _batch_keys(identifiers)) if k not in self.done]
+
+    def record(self, batch: List[Dict[str, str]], data: Dict[str, Any], at: float) -> None:
+        if self._f is None:
+            self._start()
+        entry = {
+            "at": at,
+            "keys": _batch_keys(batch),
+            "data": [slim_card(c) for c in data.get("data", [])],
+            "not_found": data.get("not_found", []),
+        }
+        self._f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._f.flush()
+
+    def _start(self) -> None:
+        # Keep appending to a file we resumed from; otherwise start a fresh one
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if self.done:
+            self._f = open(self.path, "a", encoding="utf-8")
+            # Ends a torn last line, so it can't swallow the next batch
+            self._f.write("\n")
+            return
+        self._f = open(self.path, "w", encoding="utf-8")
+        self._f.write(json.dumps({"csv_sha256": self.csv_sha256, "started_at": time.time()}) + "\n")
+
+    def close(self, completed: bool) -> None:
+        # A completed fetch no longer needs its checkpoint; a failed one keeps it
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        if completed:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
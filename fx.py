@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from datetime import date, datetime, timezone
+from typing import TYPE_CHECKING, Dict, Iterable, Tuple
+
+from profiling import PROFILER
+
+# numpy/requests load on first use: tracker reads FX_RATES_PATH before its run-time gate
+if TYPE_CHECKING:
+    import numpy as np
+    import requests
+
+FX_RATES_PATH = "data/fx_rates.json"
+ECB_DAILY_URL = "https://www.ecb.europa.eu/stats/eurofxref/eurofxref-daily.xml"
+ECB_HIST_90D_URL = "https://www.ecb.europa.eu/stats/eurofxref/eurofxref-hist-90d.xml"
+FX_CURRENCY = "GBP"
+
+# The daily file only carries the latest business day; a table further behind than
+# this (or empty) is caught up from the 90-day file instead.
+FX_BACKFILL_AFTER_DAYS = 4
+
+
+def parse_ecb_rates(xml_text: str, currency: str = FX_CURRENCY) -> Dict[str, float]:
+    # {YYYY-MM-DD: rate} from either ECB file; both have one <Cube time="..."> per day
+    out: Dict[str, float] = {}
+    root = ET.fromstring(xml_text)
+    for day in root.iter():
+        t = day.attrib.get("time")
+        if not t:
+            continue
+        for node in day:
+            if node.attrib.get("currency") == currency:
+                try:
+                    out[t] = float(node.attrib["rate"])
+                except (KeyError, ValueError):
+                    pass
+    return out
+
+
+def _as_days(days: Iterable[str]) -> np.ndarray:
+    import numpy as np
+
+    days = list(days)
+    try:
+        return np.array(days, dtype="datetime64[D]")
+    except ValueError:
+        out = np.empty(len(days), dtype="datetime64[D]")
+        for i, d in enumerate(days):
+            try:
+                out[i] = np.datetime64(d, "D")
+            except ValueError:
+                out[i] = np.datetime64("NaT")
+        return out
+
+
+class FxTable:
+    # GBP per EUR by ECB publication date. Lookups are as-of: weekends, holidays and days
+    # after the newest published rate use the latest earlier rate; days before the table
+    # starts have none.
+
+    def __init__(self, rates: Dict[str, float] | None = None, fetched_at: float = 0.0):
+        import numpy as np
+
+        self.rates: Dict[str, float] = dict(sorted((rates or {}).items()))
+        self.fetched_at = float(fetched_at or 0.0)
+        self._days = _as_days(self.rates.keys())
+        self._values = np.array(list(self.rates.values()), dtype=np.float64)
+
+    @classmethod
+    def load(cls, path: str) -> "FxTable":
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return cls(data.get(FX_CURRENCY) or {}, data.get("fetched_at") or 0.0)
+        except (OSError, ValueError, AttributeError):
+            return cls()
+
+    def save(self, path: str) -> None:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": self.fetched_at, FX_CURRENCY: self.rates}, f, indent=0, sort_keys=True)
+            f.write("\n")
+        os.replace(tmp, path)
+
+    def merged(self, rates: Dict[str, float], fetched_at: float) -> "FxTable":
+        return FxTable({**self.rates, **rates}, fetched_at)
+
+    def latest(self) -> Tuple[str, float] | None:
+        if not self.rates:
+            return None
+        day = next(reversed(self.rates))
+        return day, self.rates[day]
+
+    def rates_on(self, days: Iterable[str]) -> np.ndarray:
+        # Vectorized as-of lookup for YYYY-MM-DD strings; NaN where no rate applies
+        import numpy as np
+
+        d = _as_days(days)
+        out = np.full(len(d), np.nan)
+        if not len(self._days) or not len(d):
+            return out
+        idx = np.searchsorted(self._days, d, side="right") - 1
+        ok = (idx >= 0) & ~np.isnat(d)
+        out[ok] = self._values[idx[ok]]
+        return out
+
+    def rate_on(self, day: str) -> float | None:
+        r = float(self.rates_on([day])[0])
+        return None if math.isnan(r) else r
+
+
+def refresh_fx_table(path: str, ttl_s: float, session: requests.Session | None = None) -> FxTable:
+    # The stored table while it is younger than ttl_s, otherwise caught up from the ECB.
+    # A failed fetch keeps the stored rates (so a run still converts with the last known one).
+    table = FxTable.load(path)
+    if table.rates and time.time() - table.fetched_at < ttl_s:
+        return table
+
+    latest = table.latest()
+    today = datetime.now(timezone.utc).date()
+    behind = (today - date.fromisoformat(latest[0])).days if latest else None
+    url, label = ECB_DAILY_URL, "ecb.daily"
+    if behind is None or behind > FX_BACKFILL_AFTER_DAYS:
+        url, label = ECB_HIST_90D_URL, "ecb.hist90d"
+    import requests
+
+    try:
+        with PROFILER.http(label) as rec:
+            r = (session or requests).get(url, timeout=30)
+            if rec is not None:
+                rec["status"] = r.status_code
+        r.raise_for_status()
+        rates = parse_ecb_rates(r.text)
+    except Exception as e:
+        print(f"[fx] ECB fetch failed ({e}); using {f'the {latest[0]} rate' if latest else 'no GBP rate'}")
+        return table
+
+    table = table.merged(rates, time.time())
+    table.save(path)
+    return table
+
+
+class FxRefresh:
+    # refresh_fx_table() on a background thread, so the ECB request overlaps the
+    # collection parsing and Scryfall fetch; result() waits for it.
+
+    def __init__(self, path: str, ttl_s: float):
+        self._table: FxTable | None = None
+        self._thread = threading.Thread(target=self._run, args=(path, ttl_s), name="fx-refresh", daemon=True)
+        self._thread.start()
+
+    def _run(self, path: str, ttl_s: float) -> None:
+        try:
+            self._table = refresh_fx_table(path, ttl_s)
+        except Exception as e:
+            print(f"[fx] could not refresh {path}: {e}")
+
+    def result(self) -> FxTable:
+        self._thread.join()
+        return self._table if self._table is not None else FxTable()
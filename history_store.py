@@ -0,0 +1,638 @@
+import json
+import os
+import sqlite3
+from collections.abc import Mapping
+from datetime import date, datetime, timedelta, timezone
+from itertools import groupby
+from typing import Dict, Any, Iterable, Iterator, List, Tuple
+
+from profiling import PROFILER
+
+HISTORY_DB_PATH = "data/history.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cards (
+    id  INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS points (
+    card INTEGER NOT NULL,
+    ts   TEXT NOT NULL,
+    eur  REAL,
+    gbp  REAL,
+    PRIMARY KEY (card, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rolling (
+    card         INTEGER PRIMARY KEY,
+    n            INTEGER NOT NULL,
+    n_eur        INTEGER NOT NULL,
+    sum_eur      REAL NOT NULL,
+    n_gbp        INTEGER NOT NULL,
+    sum_gbp      REAL NOT NULL,
+    ewma_eur     REAL,
+    ewma_gbp     REAL,
+    min_eur      REAL,
+    max_eur      REAL,
+    since_rebase INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    card      INTEGER NOT NULL,
+    tier      TEXT NOT NULL,
+    period    INTEGER NOT NULL,
+    open_eur  REAL NOT NULL,
+    high_eur  REAL NOT NULL,
+    low_eur   REAL NOT NULL,
+    close_eur REAL NOT NULL,
+    close_gbp REAL,
+    close_ts  INTEGER NOT NULL,
+    n         INTEGER NOT NULL,
+    PRIMARY KEY (card, tier, period)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    name  TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+# Long-term history lives in roll-ups, one row per card per period. Every appended point
+# updates its day's row in place; once a day is more than `daily_days` old its row folds
+# into its week's row (period = the ISO week's Monday), and weeks older than
+# `weekly_weeks` are dropped. Both happen as points are written, so a card's storage
+# stays bounded. Prices are OHLC in EUR; GBP is only kept for the close, the one value
+# the dashboard plots (a point's GBP can be filled in later, see fill_missing_gbp()).
+#
+# Size budget: a card keeps at most max_points raw points, one rolling row, daily_days + 1
+# daily rows and weekly_weeks + 1 weekly rows. A card's key string is stored once (in
+# `cards`) and roll-up rows hold only numbers, so on disk a point is ~65 bytes and a roll-up
+# row ~60. The defaults below (a quarter of daily bars, three years of weekly ones) come to
+# ~15.5 kB per card once both tiers have filled: ~265 MB for a 17k-printing collection after
+# three years, against ~470 MB with text keys and periods. Each extra day or week kept adds
+# ~60 bytes per card (~1 MB at 17k).
+ROLLUP_DAILY_DAYS = 90
+ROLLUP_WEEKLY_WEEKS = 156
+DAILY, WEEKLY = "D", "W"
+
+# Merges one period's worth of prices (a point, or a whole day) into a roll-up row;
+# inputs arrive oldest first, so the first one opens the row and the newest closes it
+_ROLLUP_UPSERT = """
+INSERT INTO rollups (card, tier, period, open_eur, high_eur, low_eur, close_eur, close_gbp, close_ts, n)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (card, tier, period) DO UPDATE SET
+    high_eur = max(high_eur, excluded.high_eur),
+    low_eur = min(low_eur, excluded.low_eur),
+    close_eur = excluded.close_eur,
+    close_gbp = excluded.close_gbp,
+    close_ts = excluded.close_ts,
+    n = n + excluded.n
+WHERE excluded.close_ts > close_ts
+"""
+
+
+# Roll-up periods are day ordinals (date.toordinal(); a week is its Monday's) and close
+# times are Unix seconds, so a roll-up row holds no strings
+def _week_ordinal(day: int) -> int:
+    # Ordinal 1 (0001-01-01) is a Monday
+    return day - (day - 1) % 7
+
+
+def _epoch(ts: str) -> int:
+    dt = datetime.fromisoformat(ts)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def _iso(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+
+def _entry(ts: str, eur: float | None, gbp: float | None) -> Dict[str, Any]:
+    return {"ts": ts, "eur": eur, "gbp": gbp}
+
+
+def _safe_float(v: Any) -> float | None:
+    try:
+        return float(v) if v is not None else None
+    except Exception:
+        return None
+
+
+_ROLLING_COLS = ("n", "n_eur", "sum_eur", "n_gbp", "sum_gbp", "ewma_eur", "ewma_gbp", "min_eur", "max_eur", "since_rebase")
+
+
+def _ewma(prev: float | None, x: float | None, alpha: float) -> float | None:
+    if x is None:
+        return prev
+    if prev is None:
+        return x
+    return alpha * x + (1.0 - alpha) * prev
+
+
+def rolling_from_entries(entries: List[Tuple[float | None, float | None]], alpha: float) -> Dict[str, Any]:
+    # entries are (eur, gbp) oldest first, already cut to the window
+    eurs = [e for e, _ in entries if e is not None]
+    gbps = [g for _, g in entries if g is not None]
+    ewma_eur = ewma_gbp = None
+    for e, g in entries:
+        ewma_eur = _ewma(ewma_eur, e, alpha)
+        ewma_gbp = _ewma(ewma_gbp, g, alpha)
+    return {
+        "n": len(entries),
+        "n_eur": len(eurs),
+        "sum_eur": sum(eurs),
+        "n_gbp": len(gbps),
+        "sum_gbp": sum(gbps),
+        "ewma_eur": ewma_eur,
+        "ewma_gbp": ewma_gbp,
+        "min_eur": min(eurs) if eurs else None,
+        "max_eur": max(eurs) if eurs else None,
+        "since_rebase": 0,
+    }
+
+
+# Per-card price history in SQLite. Reads behave like the old Dict[str, List[entry]]
+# (history[k], history.get(k, []), history.items()); writes only touch cards priced this run.
+# Cards are stored under integer ids (the `cards` table maps them to keys), which this
+# object keeps in memory while it is open.
+class HistoryStore(Mapping):
+    def __init__(
+        self,
+        path: str,
+        max_points: int,
+        max_days: float = 0.0,
+        stats_window: int = 0,
+        daily_days: int = ROLLUP_DAILY_DAYS,
+        weekly_weeks: int = ROLLUP_WEEKLY_WEEKS,
+    ):
+        self.path = path
+        self.max_points = max(1, int(max_points))
+        self.max_days = float(max_days or 0.0)
+        self.daily_days = max(1, int(daily_days))
+        # 0 drops days as they leave the daily tier
+        self.weekly_weeks = max(0, int(weekly_weeks))
+        self._days: Dict[str, int] = {}
+        # Rolling stats cover the trend window, which can't be longer than what we keep
+        self.stats_window = min(self.max_points, int(stats_window or self.max_points))
+        self.alpha = 2.0 / (self.stats_window + 1)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self._ids: Dict[str, int] = dict(self.conn.execute("SELECT key, id FROM cards"))
+        self._keys: Dict[int, str] = {i: k for k, i in self._ids.items()}
+
+    # ---- card ids ----
+
+    def _card_ids(self, keys: Iterable[str]) -> Dict[str, int]:
+        # Ids for keys about to be written, registering new cards
+        keys = list(keys)
+        new = [(k,) for k in dict.fromkeys(keys) if k not in self._ids]
+        if new:
+            self.conn.executemany("INSERT OR IGNORE INTO cards (key) VALUES (?)", new)
+            for i in range(0, len(new), 500):
+                part = [k for (k,) in new[i:i + 500]]
+                marks = ",".join("?" * len(part))
+                for k, cid in self.conn.execute(f"SELECT key, id FROM cards WHERE key IN ({marks})", part):
+                    self._ids[k] = cid
+                    self._keys[cid] = k
+        return {k: self._ids[k] for k in keys}
+
+    # ---- Mapping API (read side) ----
+
+    def __getitem__(self, key: str) -> List[Dict[str, Any]]:
+        cid = self._ids.get(key)
+        rows = [] if cid is None else self.conn.execute(
+            "SELECT ts, eur, gbp FROM points WHERE card = ? ORDER BY ts", (cid,)
+        ).fetchall()
+        if not rows:
+            raise KeyError(key)
+        return [_entry(*r) for r in rows]
+
+    def __contains__(self, key: object) -> bool:
+        cid = self._ids.get(key) if isinstance(key, str) else None
+        return cid is not None and self.conn.execute("SELECT 1 FROM points WHERE card = ? LIMIT 1", (cid,)).fetchone() is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for (cid,) in self.conn.execute("SELECT DISTINCT card FROM points ORDER BY card"):
+            yield self._keys[cid]
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(DISTINCT card) FROM points").fetchone()[0]
+
+    def _scan_points(self) -> Iterator[Tuple[int, List[Tuple[str, float | None, float | None]]]]:
+        # One ordered scan of the (card, ts) primary key instead of a query per card
+        rows = self.conn.execute("SELECT card, ts, eur, gbp FROM points ORDER BY card, ts")
+        for cid, grp in groupby(rows, key=lambda r: r[0]):
+            yield cid, [r[1:] for r in grp]
+
+    def items(self) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        for cid, rows in self._scan_points():
+            yield self._keys[cid], [_entry(*r) for r in rows]
+
+    def series_fingerprints(self) -> Dict[str, str]:
+        # Summarises what a card's daily series (last priced point per day) depends on.
+        # Points are only appended at the end and retired from the front, so the series
+        # changes exactly when the first priced day, the last priced point's day, or the
+        # last priced values change. Two streaming scans of the (card, ts) primary key.
+        priced = "FROM points WHERE eur IS NOT NULL OR gbp IS NOT NULL GROUP BY card"
+        first = dict(self.conn.execute(f"SELECT card, substr(MIN(ts), 1, 10) {priced}"))
+        # Roll-ups also change from the front when a tier's oldest period is retired; one
+        # primary-key seek per card and tier
+        starts = {
+            cid: (d, w)
+            for cid, d, w in self.conn.execute(
+                "SELECT card,"
+                " (SELECT period FROM rollups r WHERE r.card = s.card AND r.tier = 'D' ORDER BY period LIMIT 1),"
+                " (SELECT period FROM rollups r WHERE r.card = s.card AND r.tier = 'W' ORDER BY period LIMIT 1)"
+                " FROM rolling s"
+            )
+        }
+        # With a single MAX() aggregate SQLite takes the bare eur/gbp columns from that row
+        last = {
+            cid: (last_ts[:10], eur, gbp)
+            for cid, last_ts, eur, gbp in self.conn.execute(f"SELECT card, MAX(ts), eur, gbp {priced}")
+        }
+        # Cards whose raw points all aged out can still have roll-ups
+        return {
+            self._keys[cid]: "|".join(
+                map(repr, (first.get(cid), *last.get(cid, (None, None, None)), *starts.get(cid, (None, None))))
+            )
+            for cid in last.keys() | starts.keys()
+        }
+
+    def chart_entries(self, key: str) -> List[Dict[str, Any]]:
+        # Everything kept for a card as entries, coarsest tier first: weekly closes, daily
+        # closes, then raw points. Read per day with the last entry winning (as the dashboard
+        # does), each day gets its finest value, so the series spans the weekly tier.
+        cid = self._ids.get(key)
+        if cid is None:
+            return []
+        rows = self.conn.execute(
+            "SELECT close_ts, close_eur, close_gbp FROM rollups WHERE card = ? AND tier = ? ORDER BY period",
+            (cid, WEEKLY),
+        ).fetchall()
+        rows += self.conn.execute(
+            "SELECT close_ts, close_eur, close_gbp FROM rollups WHERE card = ? AND tier = ? ORDER BY period",
+            (cid, DAILY),
+        ).fetchall()
+        entries = [_entry(_iso(t), eur, gbp) for t, eur, gbp in rows]
+        rows = self.conn.execute("SELECT ts, eur, gbp FROM points WHERE card = ? ORDER BY ts", (cid,)).fetchall()
+        return entries + [_entry(*r) for r in rows]
+
+    def chart_items(self) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        # chart_entries() for every card, from one primary-key-ordered scan of each table
+        rollups = groupby(
+            self.conn.execute("SELECT card, tier, close_ts, close_eur, close_gbp FROM rollups ORDER BY card, tier, period"),
+            key=lambda r: r[0],
+        )
+
+        def tiers(grp: Iterable[Tuple[Any, ...]]) -> List[Dict[str, Any]]:
+            rows = list(grp)
+            return [_entry(_iso(r[2]), *r[3:]) for r in rows if r[1] == WEEKLY] + [
+                _entry(_iso(r[2]), *r[3:]) for r in rows if r[1] == DAILY
+            ]
+
+        pending = next(rollups, None)
+        for cid, rows in self._scan_points():
+            entries: List[Dict[str, Any]] = []
+            while pending is not None and pending[0] <= cid:
+                if pending[0] == cid:
+                    entries = tiers(pending[1])
+                else:
+                    yield self._keys[pending[0]], tiers(pending[1])
+                pending = next(rollups, None)
+            yield self._keys[cid], entries + [_entry(*r) for r in rows]
+        while pending is not None:
+            yield self._keys[pending[0]], tiers(pending[1])
+            pending = next(rollups, None)
+
+    def range(self, key: str, since: str | None = None, until: str | None = None) -> List[Dict[str, Any]]:
+        cid = self._ids.get(key)
+        if cid is None:
+            return []
+        sql = "SELECT ts, eur, gbp FROM points WHERE card = ?"
+        params: List[Any] = [cid]
+        if since:
+            sql += " AND ts >= ?"
+            params.append(since)
+        if until:
+            sql += " AND ts <= ?"
+            params.append(until)
+        sql += " ORDER BY ts"
+        return [_entry(*r) for r in self.conn.execute(sql, params)]
+
+    # ---- write side ----
+
+    @PROFILER.timed("history_append")
+    def append(self, curr_cards: Dict[str, Any], rate_gbp_per_eur: float | None, ts: str) -> int:
+        priced = []
+        for k, info in curr_cards.items():
+            eur = _safe_float(info.get("eur"))
+            if eur is None:
+                continue
+            gbp = (eur * rate_gbp_per_eur) if rate_gbp_per_eur is not None else None
+            priced.append((k, eur, gbp))
+
+        with self.conn:
+            ids = self._card_ids(k for k, _, _ in priced)
+            rows = [(ids[k], ts, eur, gbp) for k, eur, gbp in priced]
+            self.conn.executemany("INSERT OR REPLACE INTO points (card, ts, eur, gbp) VALUES (?, ?, ?, ?)", rows)
+            self._update_rolling(rows)
+            self._roll_up(rows)
+            self._apply_retention([r[0] for r in rows], ts)
+            self._retire_rollups(ts)
+        if rows and rate_gbp_per_eur is None:
+            # Remember where GBP is missing so fill_missing_gbp() doesn't have to scan for it
+            since = self.get_meta("gbp_missing_since")
+            self.set_meta("gbp_missing_since", min(since, ts) if since else ts)
+        return len(rows)
+
+    @PROFILER.timed("history_fill_gbp")
+    def fill_missing_gbp(self, fx: Any) -> int:
+        # Points saved without an FX rate get GBP at the rate of their own day once fx
+        # (an fx.FxTable) has one; returns how many were filled.
+        since = self.get_meta("gbp_missing_since")
+        if since is None:
+            return 0
+        import numpy as np
+
+        rows = self.conn.execute(
+            "SELECT card, ts, eur FROM points WHERE ts >= ? AND gbp IS NULL AND eur IS NOT NULL", (since,)
+        ).fetchall()
+        gbp = np.array([r[2] for r in rows], dtype=np.float64) * fx.rates_on([r[1][:10] for r in rows])
+        ok = ~np.isnan(gbp)
+        filled = [(g, r[0], r[1]) for r, g, good in zip(rows, gbp.tolist(), ok.tolist()) if good]
+        cards = sorted({c for _, c, _ in filled})
+        with self.conn:
+            self.conn.executemany("UPDATE points SET gbp = ? WHERE card = ? AND ts = ?", filled)
+            # A filled point that closes its day (or a week it was folded into) closes it in GBP too
+            self.conn.executemany(
+                "UPDATE rollups SET close_gbp = ?1 WHERE card = ?2 AND tier = ?3 AND period = ?4 AND close_ts = ?5",
+                [
+                    (g, c, tier, period, _epoch(t))
+                    for g, c, t in filled
+                    for tier, period in ((DAILY, self._day(t)), (WEEKLY, _week_ordinal(self._day(t))))
+                ],
+            )
+            self._save_rolling([(c, rolling_from_entries(self._window_entries(c), self.alpha)) for c in cards])
+            if ok.all():
+                self.conn.execute("DELETE FROM meta WHERE name = 'gbp_missing_since'")
+        return len(filled)
+
+    # ---- rolling window statistics ----
+
+    def _window_entries(self, cid: int) -> List[Tuple[float | None, float | None]]:
+        rows = self.conn.execute(
+            "SELECT eur, gbp FROM points WHERE card = ? ORDER BY ts DESC LIMIT ?", (cid, self.stats_window)
+        ).fetchall()
+        rows.reverse()
+        return rows
+
+    def _load_rolling(self, cids: List[int]) -> Dict[int, Dict[str, Any]]:
+        out: Dict[int, Dict[str, Any]] = {}
+        cols = ", ".join(_ROLLING_COLS)
+        for i in range(0, len(cids), 500):
+            part = cids[i:i + 500]
+            marks = ",".join("?" * len(part))
+            for row in self.conn.execute(f"SELECT card, {cols} FROM rolling WHERE card IN ({marks})", part):
+                out[row[0]] = dict(zip(_ROLLING_COLS, row[1:]))
+        return out
+
+    def _save_rolling(self, items: List[Tuple[int, Dict[str, Any]]]) -> None:
+        cols = ", ".join(_ROLLING_COLS)
+        marks = ", ".join("?" * (len(_ROLLING_COLS) + 1))
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO rolling (card, {cols}) VALUES ({marks})",
+            [(c, *[st[col] for col in _ROLLING_COLS]) for c, st in items],
+        )
+
+    def _update_rolling(self, rows: List[Tuple[int, str, float, float | None]]) -> None:
+        # Each new point enters the window and at most one old point leaves it, so the
+        # running sums/counts/EWMA update in O(1). Min/max only need a window rescan when
+        # the leaving point was the extreme, and sums are rebuilt from the window once per
+        # `stats_window` updates so float drift can't accumulate.
+        w = self.stats_window
+        existing = self._load_rolling([r[0] for r in rows])
+        updated: List[Tuple[int, Dict[str, Any]]] = []
+        for c, _ts, eur, gbp in rows:
+            st = existing.get(c)
+            if st is None or st["since_rebase"] + 1 >= w:
+                updated.append((c, rolling_from_entries(self._window_entries(c), self.alpha)))
+                continue
+
+            left = self.conn.execute(
+                "SELECT eur, gbp FROM points WHERE card = ? ORDER BY ts DESC LIMIT 1 OFFSET ?", (c, w)
+            ).fetchone()
+
+            st = dict(st)
+            st["n"] += 1
+            st["n_eur"] += 1
+            st["sum_eur"] += eur
+            if gbp is not None:
+                st["n_gbp"] += 1
+                st["sum_gbp"] += gbp
+            st["ewma_eur"] = _ewma(st["ewma_eur"], eur, self.alpha)
+            st["ewma_gbp"] = _ewma(st["ewma_gbp"], gbp, self.alpha)
+            st["min_eur"] = eur if st["min_eur"] is None else min(st["min_eur"], eur)
+            st["max_eur"] = eur if st["max_eur"] is None else max(st["max_eur"], eur)
+            st["since_rebase"] += 1
+
+            if left is not None:
+                l_eur, l_gbp = left
+                st["n"] -= 1
+                if l_eur is not None:
+                    st["n_eur"] -= 1
+                    st["sum_eur"] -= l_eur
+                if l_gbp is not None:
+                    st["n_gbp"] -= 1
+                    st["sum_gbp"] -= l_gbp
+                if l_eur is not None and l_eur in (st["min_eur"], st["max_eur"]):
+                    fresh = rolling_from_entries(self._window_entries(c), self.alpha)
+                    st["min_eur"], st["max_eur"] = fresh["min_eur"], fresh["max_eur"]
+
+            updated.append((c, st))
+        self._save_rolling(updated)
+
+    def rebuild_rolling(self) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM rolling")
+            batch: List[Tuple[int, Dict[str, Any]]] = []
+            for cid, rows in self._scan_points():
+                window = [(eur, gbp) for _, eur, gbp in rows[-self.stats_window:]]
+                batch.append((cid, rolling_from_entries(window, self.alpha)))
+            self._save_rolling(batch)
+        self.set_meta("rolling_window", str(self.stats_window))
+
+    def rolling_stats(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        stats = self._load_rolling([self._ids[k] for k in keys if k in self._ids])
+        return {self._keys[cid]: st for cid, st in stats.items()}
+
+    # ---- roll-ups ----
+
+    def _day(self, ts: str) -> int:
+        d = self._days.get(ts[:10])
+        if d is None:
+            d = self._days[ts[:10]] = date.fromisoformat(ts[:10]).toordinal()
+        return d
+
+    def _roll_up(self, rows: Iterable[Tuple[int, str, float | None, float | None]]) -> None:
+        # rows are (card, ts, eur, gbp) points, oldest first per card
+        self.conn.executemany(
+            _ROLLUP_UPSERT,
+            [
+                (c, DAILY, self._day(ts), eur, eur, eur, eur, gbp, _epoch(ts), 1)
+                for c, ts, eur, gbp in rows
+                if eur is not None
+            ],
+        )
+
+    def _retire_rollups(self, now_ts: str) -> None:
+        # Days past the daily tier fold into their weeks and weeks past the weekly tier go;
+        # the cutoffs only move once a day
+        day = now_ts[:10]
+        if self.get_meta("rollups_retired_on") == day:
+            return
+        try:
+            today = date.fromisoformat(day)
+        except ValueError:
+            return
+        daily_cutoff = today.toordinal() - self.daily_days
+        days = self.conn.execute(
+            "SELECT card, period, open_eur, high_eur, low_eur, close_eur, close_gbp, close_ts, n FROM rollups"
+            " WHERE tier = ? AND period < ? ORDER BY card, period",
+            (DAILY, daily_cutoff),
+        ).fetchall()
+        if self.weekly_weeks:
+            self.conn.executemany(_ROLLUP_UPSERT, [(r[0], WEEKLY, _week_ordinal(r[1]), *r[2:]) for r in days])
+        self.conn.execute("DELETE FROM rollups WHERE tier = ? AND period < ?", (DAILY, daily_cutoff))
+        weekly_cutoff = _week_ordinal((today - timedelta(weeks=self.weekly_weeks)).toordinal())
+        self.conn.execute("DELETE FROM rollups WHERE tier = ? AND period < ?", (WEEKLY, weekly_cutoff))
+        self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('rollups_retired_on', ?)", (day,))
+
+    def rebuild_rollups(self) -> None:
+        # Roll-ups from the raw points alone (a new or pre-roll-up db): exactly what appending
+        # them one by one would have built
+        with self.conn:
+            self.conn.execute("DELETE FROM rollups")
+            self._roll_up(self.conn.execute("SELECT card, ts, eur, gbp FROM points ORDER BY card, ts").fetchall())
+            self.conn.execute("DELETE FROM meta WHERE name = 'rollups_retired_on'")
+            latest = self.conn.execute("SELECT MAX(ts) FROM points").fetchone()[0]
+            if latest:
+                self._retire_rollups(latest)
+        self.set_meta("rollups_built", "1")
+
+    def _apply_retention(self, cids: List[int], now_ts: str) -> None:
+        # Only cards that just gained a point can have exceeded retention
+        self.conn.executemany(
+            "DELETE FROM points WHERE card = ?1 AND ts < ("
+            "SELECT ts FROM points WHERE card = ?1 ORDER BY ts DESC LIMIT 1 OFFSET ?2)",
+            [(c, self.max_points - 1) for c in cids],
+        )
+        if self.max_days > 0:
+            try:
+                cutoff = (datetime.fromisoformat(now_ts) - timedelta(days=self.max_days)).isoformat()
+            except ValueError:
+                return
+            aged_out = []
+            for c in cids:
+                if self.conn.execute("DELETE FROM points WHERE card = ? AND ts < ?", (c, cutoff)).rowcount:
+                    aged_out.append(c)
+            # Age-based deletes can reach inside the stats window
+            if aged_out:
+                self._save_rolling([(c, rolling_from_entries(self._window_entries(c), self.alpha)) for c in aged_out])
+
+    @PROFILER.timed("history_retain")
+    def retain_keys(self, keep: Iterable[str]) -> None:
+        # Drop series for cards that left the collection
+        with self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep_keys (key TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM keep_keys")
+            self.conn.executemany("INSERT OR IGNORE INTO keep_keys (key) VALUES (?)", ((k,) for k in keep))
+            gone = [
+                cid for (cid,) in self.conn.execute("SELECT id FROM cards WHERE key NOT IN (SELECT key FROM keep_keys)")
+            ]
+            if not gone:
+                return
+            self.conn.execute("DELETE FROM cards WHERE key NOT IN (SELECT key FROM keep_keys)")
+            for t in ("points", "rolling", "rollups"):
+                self.conn.execute(f"DELETE FROM {t} WHERE card NOT IN (SELECT id FROM cards)")
+        for cid in gone:
+            del self._ids[self._keys.pop(cid)]
+
+    def import_json_history(self, data: Dict[str, List[Dict[str, Any]]]) -> int:
+        rows = []
+        for k, entries in data.items():
+            if not isinstance(entries, list):
+                continue
+            for e in entries:
+                if not isinstance(e, dict) or not isinstance(e.get("ts"), str):
+                    continue
+                rows.append((k, e["ts"], _safe_float(e.get("eur")), _safe_float(e.get("gbp"))))
+        with self.conn:
+            ids = self._card_ids(r[0] for r in rows)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO points (card, ts, eur, gbp) VALUES (?, ?, ?, ?)",
+                ((ids[k], *rest) for k, *rest in rows),
+            )
+        return len(rows)
+
+    def get_meta(self, name: str) -> str | None:
+        row = self.conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, name: str, value: str) -> None:
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+@PROFILER.timed("history_open")
+def open_history_store(
+    path: str,
+    *,
+    max_points: int,
+    max_days: float = 0.0,
+    stats_window: int = 0,
+    daily_days: int = ROLLUP_DAILY_DAYS,
+    weekly_weeks: int = ROLLUP_WEEKLY_WEEKS,
+    legacy_json_path: str | None = None,
+) -> HistoryStore:
+    if not os.path.exists(path):
+        print(f"[history] no price history at {path}; starting a new one")
+    store = HistoryStore(
+        path,
+        max_points=max_points,
+        max_days=max_days,
+        stats_window=stats_window,
+        daily_days=daily_days,
+        weekly_weeks=weekly_weeks,
+    )
+
+    # One-time import of the old data/history.json, recorded in meta so this db never reads
+    # it again. The file is left in place; no run updates it any more.
+    if legacy_json_path and store.get_meta("migrated_from_json") is None:
+        if os.path.exists(legacy_json_path):
+            try:
+                with open(legacy_json_path, "r", encoding="utf-8") as f:
+                    content = f.read().strip()
+                data = json.loads(content) if content else {}
+            except Exception as e:
+                print(f"[history] could not read {legacy_json_path} ({e}); nothing imported from it")
+                data = {}
+            if isinstance(data, dict) and data:
+                n = store.import_json_history(data)
+                print(f"[history] migrated {n} points for {len(data)} cards from {legacy_json_path} into {path}")
+        store.set_meta("migrated_from_json", legacy_json_path)
+
+    # Rolling stats are derived data: (re)build them for a new db or a changed window
+    if store.get_meta("rolling_window") != str(store.stats_window):
+        store.rebuild_rolling()
+    # Databases from before the roll-ups start theirs from the points they still have
+    if store.get_meta("rollups_built") is None:
+        store.rebuild_rollups()
+
+    return store
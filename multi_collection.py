@@ -0,0 +1,85 @@
+import argparse
+import hashlib
+import os
+import re
+from typing import Dict, List, Tuple
+
+from card_cache import ident_key
+from fx import FxRefresh
+from pipeline import COLLECTIONS_DIR, RunPlan, complete_run, fetch_cards, parse_csv_list, plan_run
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def parse_collection_specs(specs: List[str]) -> List[Tuple[str, str]]:
+    # ["alice=a.csv", "bob=b1.csv,b2.csv"] -> [("alice", "a.csv"), ("bob", "b1.csv,b2.csv")]
+    out: List[Tuple[str, str]] = []
+    seen = set()
+    for spec in specs:
+        name, sep, csv = spec.partition("=")
+        name = name.strip()
+        if not sep or not _NAME_RE.match(name) or not parse_csv_list(csv):
+            raise SystemExit(f"--collection expects NAME=CSV[,CSV...] (NAME: letters, digits, _ or -), got {spec!r}")
+        if name in seen:
+            raise SystemExit(f"--collection {name} given more than once")
+        seen.add(name)
+        out.append((name, csv))
+    return out
+
+
+def webhook_env(name: str) -> str:
+    return "DISCORD_WEBHOOK_URL_" + name.upper().replace("-", "_")
+
+
+def collection_args(args: argparse.Namespace, name: str, csv: str) -> argparse.Namespace:
+    # Same options as the batch run, with every per-collection file under COLLECTIONS_DIR/name
+    # (dashboard under the dashboard dir's name/ subfolder, export CSV suffixed with _name)
+    base = os.path.join(COLLECTIONS_DIR, name)
+    out = argparse.Namespace(**vars(args))
+    out.csv = csv
+    out.snapshot = os.path.join(base, os.path.basename(args.snapshot))
+    out.legacy_snapshot = ""
+    out.history_db = os.path.join(base, os.path.basename(args.history_db)) if args.history_db else ""
+    out.history_json = os.path.join(base, os.path.basename(args.history_json))
+    out.weekly_dir = os.path.join(base, "weekly")
+    out.discord_pending = os.path.join(base, os.path.basename(args.discord_pending))
+    out.dashboard_out_dir = os.path.join(args.dashboard_out_dir, name)
+    if args.export_csv:
+        root, ext = os.path.splitext(args.export_csv)
+        out.export_csv = f"{root}_{name}{ext or '.csv'}"
+    return out
+
+
+def run_collections(args: argparse.Namespace) -> None:
+    # Plan every collection first, price the union of their printings in one fetch,
+    # then finish each collection against its own snapshot/history/webhook.
+    specs = parse_collection_specs(args.collection)
+    fx = FxRefresh(args.fx_rates, args.fx_ttl_hours * 3600.0)
+    plans: List[Tuple[str, RunPlan]] = []
+    for name, csv in specs:
+        print(f"[collection {name}] {csv}")
+        plan = plan_run(collection_args(args, name, csv), webhook=os.environ.get(webhook_env(name), ""), fx=fx)
+        if plan is not None:
+            plans.append((name, plan))
+    if not plans:
+        return
+
+    union: Dict[str, Dict[str, str]] = {}
+    requested = 0
+    for _, plan in plans:
+        requested += len(plan.identifiers)
+        for i in plan.identifiers:
+            union.setdefault(ident_key(i["set"], i["collector_number"], i["lang"]), i)
+    print(f"[collections] {len(plans)} to price: {requested} identifiers requested, {len(union)} unique printings fetched")
+    # The fetch checkpoint belongs to this exact set of collections
+    key = hashlib.sha256("\n".join(f'{name}={plan.current["_meta"]["csv_sha256"]}' for name, plan in plans).encode()).hexdigest()
+    resolved = fetch_cards(args, list(union.values()), checkpoint_key=key)
+
+    for name, plan in plans:
+        print(f"[collection {name}]")
+        mine = {}
+        for i in plan.identifiers:
+            k = ident_key(i["set"], i["collector_number"], i["lang"])
+            if k in resolved:
+                mine[k] = resolved[k]
+        complete_run(plan, mine)
@@ -0,0 +1,1184 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, Any, Iterable, List, Tuple
+
+from zoneinfo import ZoneInfo
+
+from card_cache import (
+    card_ident_key,
+    ident_key,
+    load_card_cache,
+    remember_cards,
+    remember_not_found,
+    save_card_cache,
+    split_cached,
+)
+from card_record import Card, intern_value
+from dashboard_export import export_dashboard_from_history
+from discord_queue import DiscordQueue
+from fetch_checkpoint import FetchCheckpoint
+from fx import FxRefresh, FxTable
+from history_store import HistoryStore, open_history_store
+from profiling import PROFILER
+from snapshot_store import (
+    load_snapshot,
+    load_snapshot_meta,
+    load_snapshot_prices,
+    price_cards,
+    save_snapshot,
+)
+from scryfall import SCRYFALL_BATCH_SIZE, SCRYFALL_MAX_RETRIES, build_bulk_index, iter_collection_batches
+
+# pandas, numpy and requests are imported by the stages that use them, so a cron run
+# that stops at the run-time gate doesn't pay for them
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+    import requests
+
+    from alerts import AlertResult
+
+# One run, from the run-time gate to the alerts: tracker.py (the command line), daemon.py,
+# multi_collection.py and streaming.py all drive it from here. Only run() reaches back
+# into streaming.py, and only when --stream asks for it.
+
+HISTORY_PATH = "data/history.json"
+WEEKLY_DIR = "data/weekly"
+COLLECTIONS_DIR = "data/collections"
+
+LANG_MAP = {
+    "English": "en",
+    "Japanese": "ja",
+    "German": "de",
+    "French": "fr",
+    "Italian": "it",
+    "Spanish": "es",
+    "Portuguese": "pt",
+    "Russian": "ru",
+    "Korean": "ko",
+    "Chinese Simplified": "zhs",
+    "Chinese Traditional": "zht",
+}
+
+
+def normalise_lang(s: str) -> str:
+    if not isinstance(s, str) or not s.strip():
+        return "en"
+    return LANG_MAP.get(s.strip(), "en")
+
+
+def foil_kind(v: Any) -> str:
+    if not isinstance(v, str) or not v.strip():
+        return "nonfoil"
+    v = v.strip().lower()
+    if v == "foil":
+        return "foil"
+    if v == "etched":
+        return "etched"
+    return "nonfoil"
+
+
+def pick_price_eur(prices: Dict[str, Any], kind: str) -> float | None:
+    key = {"nonfoil": "eur", "foil": "eur_foil", "etched": "eur_etched"}.get(kind, "eur")
+    val = prices.get(key)
+    if val is None:
+        val = prices.get("eur")
+    try:
+        return float(val) if val is not None else None
+    except Exception:
+        return None
+
+
+def chunk(items: List[Dict[str, Any]], n: int) -> List[List[Dict[str, Any]]]:
+    return [items[i:i + n] for i in range(0, len(items), n)]
+
+
+def safe_float(v: Any) -> float | None:
+    try:
+        if v is None:
+            return None
+        return float(v)
+    except Exception:
+        return None
+
+
+@PROFILER.timed("csv_hash")
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for ch in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(ch)
+    return h.hexdigest()
+
+
+# -------- Trend history store --------
+
+@PROFILER.timed("history_load")
+def load_history(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            content = f.read().strip()
+            if not content:
+                return {}
+            data = json.loads(content)
+            return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+@PROFILER.timed("history_save")
+def save_history(path: str, data: Dict[str, List[Dict[str, Any]]]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+@PROFILER.timed("history_append")
+def update_history(
+    history: Dict[str, List[Dict[str, Any]]],
+    curr_cards: Dict[str, Any],
+    rate_gbp_per_eur: float | None,
+    ts: str,
+    window: int,
+) -> Dict[str, List[Dict[str, Any]]]:
+    for k, info in curr_cards.items():
+        eur = safe_float(info.get("eur"))
+        if eur is None:
+            continue
+        gbp = (eur * rate_gbp_per_eur) if rate_gbp_per_eur is not None else None
+        entries = history.get(k)
+        if not isinstance(entries, list):
+            entries = []
+        entries.append({"ts": ts, "eur": eur, "gbp": gbp})
+        if len(entries) > window:
+            entries = entries[-window:]
+        history[k] = entries
+    return history
+
+
+def moving_average(entries: List[Dict[str, Any]]) -> Tuple[float | None, float | None]:
+    if not entries:
+        return None, None
+    eurs = [safe_float(e.get("eur")) for e in entries]
+    eurs = [e for e in eurs if e is not None]
+    gbps = [safe_float(e.get("gbp")) for e in entries]
+    gbps = [g for g in gbps if g is not None]
+    avg_eur = (sum(eurs) / len(eurs)) if eurs else None
+    avg_gbp = (sum(gbps) / len(gbps)) if gbps else None
+    return avg_eur, avg_gbp
+
+
+# -------- Scheduling --------
+
+# OPTION A: hour-based gating (so 07:55 counts as the 07 run)
+def should_run_now(tz_name: str, run_times_csv: str) -> bool:
+    if not run_times_csv.strip():
+        return True
+    tz = ZoneInfo(tz_name)
+    now_local = datetime.now(tz)
+    allowed_hours = set()
+    for t in run_times_csv.split(","):
+        t = t.strip()
+        if not t:
+            continue
+        try:
+            allowed_hours.add(int(t.split(":")[0]))
+        except Exception:
+            continue
+    return now_local.hour in allowed_hours
+
+
+def parse_weekday(s: str) -> int:
+    days = {"MON": 0, "TUE": 1, "WED": 2, "THU": 3, "FRI": 4, "SAT": 5, "SUN": 6}
+    s = (s or "").strip().upper()
+    return days.get(s, 6)
+
+
+def is_weekly_time(tz_name: str, weekly_day: str, weekly_time: str) -> bool:
+    tz = ZoneInfo(tz_name)
+    now_local = datetime.now(tz)
+    wd_target = parse_weekday(weekly_day)
+    hm_target = (weekly_time or "19:00").strip()
+    return now_local.weekday() == wd_target and now_local.strftime("%H:%M") == hm_target
+
+
+# -------- Collection parsing / misc --------
+
+def parse_csv_list(csv_arg: str) -> List[str]:
+    return [p.strip() for p in csv_arg.split(",") if p.strip()]
+
+
+COLLECTION_REQUIRED_COLS = ["Count", "Name", "Edition", "Collector Number", "Language", "Foil"]
+COLLECTION_DTYPES = {
+    "Count": "float64",
+    "Name": "string",
+    "Edition": "category",
+    "Collector Number": "category",
+    "Language": "category",
+    "Foil": "category",
+}
+
+
+def _csv_engine(engine: str) -> str:
+    if engine == "c":
+        return "c"
+    try:
+        import pyarrow  # noqa: F401
+        return "pyarrow"
+    except ImportError:
+        if engine == "pyarrow":
+            raise SystemExit("--csv-engine pyarrow requested but pyarrow is not installed")
+        return "c"
+
+
+@PROFILER.timed("csv_read")
+def read_collection_csvs(csv_paths: List[str], engine: str = "auto") -> pd.DataFrame:
+    # Only the columns we use, with explicit dtypes; the low-cardinality ones stay categorical
+    import pandas as pd
+
+    engine = _csv_engine(engine)
+    dfs = []
+    for p in csv_paths:
+        if not os.path.exists(p):
+            raise SystemExit(f"CSV not found: {p}")
+        header = list(pd.read_csv(p, nrows=0).columns)
+        missing = [c for c in COLLECTION_REQUIRED_COLS if c not in header]
+        if missing:
+            raise SystemExit(f"CSV missing columns: {missing}. Found: {header}")
+        usecols = COLLECTION_REQUIRED_COLS + (["Proxy"] if "Proxy" in header else [])
+        df = pd.read_csv(p, usecols=usecols, dtype=COLLECTION_DTYPES, engine=engine)
+        df["__source_csv"] = p
+        dfs.append(df)
+    if not dfs:
+        raise SystemExit("No CSV files provided.")
+    return pd.concat(dfs, ignore_index=True)
+
+
+def collection_hash(csv_paths: List[str]) -> str:
+    return hashlib.sha256(("|".join([p + ":" + file_sha256(p) for p in csv_paths])).encode("utf-8")).hexdigest()
+
+
+def load_collection(csv_paths: List[str], engine: str = "auto") -> Tuple[List[Dict[str, str]], Dict[str, Card]]:
+    df = read_collection_csvs(csv_paths, engine=engine)
+    grouped = group_collection(df)
+    del df
+    return build_identifiers(grouped)
+
+
+def _map_categories(col: pd.Series, fn, na_value: str) -> np.ndarray:
+    # Apply fn once per distinct value instead of once per row
+    import numpy as np
+    import pandas as pd
+
+    cat = col if isinstance(col.dtype, pd.CategoricalDtype) else col.astype("category")
+    lookup = np.array([fn(v) for v in cat.cat.categories] + [na_value], dtype=object)
+    return lookup[cat.cat.codes.to_numpy()]
+
+
+@PROFILER.timed("csv_group")
+def group_collection(df: pd.DataFrame) -> pd.DataFrame:
+    import pandas as pd
+
+    if "Proxy" in df.columns:
+        df = df[df["Proxy"] != True]
+
+    norm = pd.DataFrame({
+        "set_code": _map_categories(df["Edition"], lambda v: str(v).strip().lower(), "nan"),
+        "collector": _map_categories(df["Collector Number"], lambda v: str(v).strip(), "nan"),
+        "lang_code": _map_categories(df["Language"], normalise_lang, normalise_lang(None)),
+        "foil_kind": _map_categories(df["Foil"], foil_kind, foil_kind(None)),
+        "Count": df["Count"].to_numpy(),
+        "Name": df["Name"].to_numpy(dtype=object, na_value=None),
+    })
+
+    return (
+        norm.groupby(["set_code", "collector", "lang_code", "foil_kind"], dropna=False)
+        .agg(total_qty=("Count", "sum"), name=("Name", "first"))
+        .reset_index()
+    )
+
+
+@PROFILER.timed("build_identifiers")
+def build_identifiers(grouped: pd.DataFrame) -> Tuple[List[Dict[str, str]], Dict[str, Card]]:
+    sets = grouped["set_code"].tolist()
+    cns = grouped["collector"].tolist()
+    langs = grouped["lang_code"].tolist()
+    kinds = grouped["foil_kind"].tolist()
+    names = grouped["name"].tolist()
+    qtys = grouped["total_qty"].fillna(0).astype("int64").tolist()
+
+    identifiers = [{"set": s, "collector_number": c, "lang": lg} for s, c, lg in zip(sets, cns, langs)]
+    key_to_meta: Dict[str, Card] = {}
+    for s, c, lg, fk, name, qty in zip(sets, cns, langs, kinds, names, qtys):
+        key_to_meta[f"{s}|{c}|{lg}|{fk}"] = Card(
+            name=intern_value(name),
+            set=s,
+            collector_number=c,
+            lang=lg,
+            foil_kind=fk,
+            qty=qty,
+        )
+    return identifiers, key_to_meta
+
+
+def reprint_risk(info: Dict[str, Any]) -> str:
+    if info.get("reserved_list") is True:
+        return "Very Low (RL)"
+    year = info.get("released_year")
+    if isinstance(year, int):
+        if year <= 2003:
+            return "Low (Older printing)"
+        if year <= 2015:
+            return "Medium"
+        return "Medium/High"
+    return "Unknown"
+
+
+def merge_collection_batch(
+    batch: List[Dict[str, str]],
+    cards_data: List[Dict[str, Any]],
+    key_to_meta: Dict[str, Card],
+    out_cards: Dict[str, Any],
+) -> None:
+    by_id: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+    for c in cards_data:
+        set_code = str(c.get("set", "")).lower()
+        collector_number = str(c.get("collector_number", "")).strip()
+        lang = str(c.get("lang", "en")).lower()
+        by_id[(set_code, collector_number, lang)] = c
+
+    for ident in batch:
+        sc = ident["set"]
+        cn = ident["collector_number"]
+        lang = ident["lang"]
+        c = by_id.get((sc, cn, lang))
+        if not c:
+            continue
+
+        prices = c.get("prices", {}) or {}
+        purchase = c.get("purchase_uris") or {}
+        cardmarket_url = purchase.get("cardmarket")
+
+        released_at = c.get("released_at")  # YYYY-MM-DD
+        released_year = None
+        try:
+            if isinstance(released_at, str) and len(released_at) >= 4:
+                released_year = int(released_at[:4])
+        except Exception:
+            released_year = None
+
+        reserved_list = bool(c.get("reserved")) if c.get("reserved") is not None else False
+
+        base_key_prefix = f"{sc}|{cn}|{lang}|"
+        for kind in ("nonfoil", "foil", "etched"):
+            k = base_key_prefix + kind
+            meta = key_to_meta.get(k)
+            if meta is None:
+                continue
+            eur = pick_price_eur(prices, kind)
+            info = meta.priced(
+                scryfall_uri=c.get("scryfall_uri"),
+                cardmarket_url=cardmarket_url,
+                eur=eur,
+                released_year=released_year,
+                reserved_list=reserved_list,
+            )
+            info.risk = reprint_risk(info)
+            out_cards[k] = info
+
+
+@PROFILER.timed("scryfall_fetch")
+def resolve_cards(
+    identifiers: List[Dict[str, str]],
+    *,
+    card_cache_path: str,
+    price_ttl_s: float,
+    not_found_ttl_s: float,
+    workers: int,
+    card_cache: Dict[str, Dict[str, Any]] | None = None,
+    session: requests.Session | None = None,
+    checkpoint_path: str = "",
+    checkpoint_key: str = "",
+    checkpoint_max_age_s: float = 0.0,
+    max_retries: int = SCRYFALL_MAX_RETRIES,
+) -> Dict[str, Dict[str, Any]]:
+    # Serve what we can from the local card cache; only stale/unknown identifiers go to Scryfall.
+    # A resident process passes its in-memory cache (and HTTP session) instead of re-reading it.
+    if card_cache is None:
+        card_cache = load_card_cache(card_cache_path) if card_cache_path else {}
+    cache_now = time.time()
+    resolved, to_fetch, cache_stats = split_cached(
+        identifiers,
+        card_cache,
+        now=cache_now,
+        price_ttl_s=price_ttl_s,
+        not_found_ttl_s=not_found_ttl_s,
+    )
+
+    def take(data: Dict[str, Any], fetched_at: float) -> None:
+        cards_data = data.get("data", [])
+        for c in cards_data:
+            resolved[card_ident_key(c)] = c
+        if card_cache_path:
+            remember_cards(card_cache, cards_data, fetched_at)
+            remember_not_found(card_cache, data.get("not_found", []), fetched_at)
+
+    # Batches an interrupted run for this collection already fetched count as fetched
+    checkpoint = None
+    if checkpoint_path and checkpoint_key:
+        checkpoint = FetchCheckpoint(checkpoint_path, checkpoint_key, checkpoint_max_age_s)
+        resumed = 0
+        for fetched_at, data in checkpoint.resume():
+            take(data, fetched_at)
+            resumed += 1
+        if resumed:
+            before = len(to_fetch)
+            to_fetch = checkpoint.pending(to_fetch)
+            print(f"[checkpoint] resumed {resumed} batches from {checkpoint_path}: {before - len(to_fetch)} identifiers not refetched")
+
+    # Query Scryfall in batches of up to 75 identifiers (several in flight, rate-limited)
+    batches = chunk(to_fetch, SCRYFALL_BATCH_SIZE)
+    completed = False
+    try:
+        for batch, data in iter_collection_batches(batches, workers=workers, session=session, max_retries=max_retries):
+            if checkpoint is not None:
+                checkpoint.record(batch, data, cache_now)
+            take(data, cache_now)
+        completed = True
+    finally:
+        if checkpoint is not None:
+            checkpoint.close(completed)
+
+    if card_cache_path:
+        save_card_cache(card_cache_path, card_cache)
+        print(
+            f"[card-cache] {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+            f"{cache_stats['not_found']} known not-found skipped"
+        )
+    return resolved
+
+
+@PROFILER.timed("bulk_index")
+def resolve_cards_from_bulk(identifiers: List[Dict[str, str]], bulk_path: str) -> Dict[str, Dict[str, Any]]:
+    if not os.path.exists(bulk_path):
+        raise SystemExit(f"Bulk file not found: {bulk_path}")
+    wanted = {(i["set"], i["collector_number"], i["lang"]) for i in identifiers}
+    index = build_bulk_index(bulk_path, wanted)
+    print(f"[bulk] {len(index)} of {len(wanted)} printings found in {bulk_path}")
+    return {ident_key(*k): c for k, c in index.items()}
+
+
+def diff_collection(
+    key_to_meta: Dict[str, Card],
+    prev_cards: Dict[str, Any],
+    prev_unpriced: List[str] | None = None,
+) -> Tuple[List[str], List[str], List[str]]:
+    # Against the previous collection: the snapshot's cards plus the printings that run
+    # couldn't price (never in the snapshot, so they'd otherwise be "added" every time)
+    unpriced = set(prev_unpriced or ())
+    added = [k for k in key_to_meta if k not in prev_cards and k not in unpriced]
+    removed = [k for k in prev_cards if k not in key_to_meta] + sorted(unpriced.difference(key_to_meta))
+    kept = [k for k in key_to_meta if k in prev_cards]
+    return added, removed, kept
+
+
+def identifiers_for_keys(identifiers: List[Dict[str, str]], keys: List[str]) -> List[Dict[str, str]]:
+    wanted = {k.rsplit("|", 1)[0] for k in keys}
+    return [i for i in identifiers if f'{i["set"]}|{i["collector_number"]}|{i["lang"]}' in wanted]
+
+
+def carry_forward_cards(
+    key_to_meta: Dict[str, Card],
+    prev_cards: Dict[str, Any],
+    kept_keys: List[str],
+    fetched: Dict[str, Any],
+) -> Dict[str, Any]:
+    # Unchanged printings keep their last price/metadata but pick up the new quantity/name
+    kept = set(kept_keys)
+    out: Dict[str, Any] = {}
+    for k, meta in key_to_meta.items():
+        if k in fetched:
+            out[k] = fetched[k]
+        elif k in kept:
+            out[k] = Card.from_mapping(prev_cards[k]).merged(**meta)
+    return out
+
+
+def prices_as_of(meta: Dict[str, Any]) -> str:
+    # When a snapshot's prices were fetched: its own run, except for an incremental run,
+    # whose carried-forward prices keep the date of the run that fetched them. Snapshots
+    # from before prices_as_of fall back to generated_at.
+    return str(meta.get("prices_as_of") or meta.get("generated_at") or "")
+
+
+def prev_price_rates(
+    fx_table: FxTable, prev_meta: Dict[str, Any], rate: float | None
+) -> Tuple[float | None, Dict[str, float | None]]:
+    # (rate, {key: rate}) for the previous snapshot's prices: the rate on its prices_as_of,
+    # except for printings an incremental run priced later (its price_blocks), which
+    # convert at the rate of the day they were fetched. Unknown days fall back to rate.
+    prev_rate = fx_table.rate_on(prices_as_of(prev_meta)[:10]) or rate
+    by_key: Dict[str, float | None] = {}
+    for ts, keys in (prev_meta.get("price_blocks") or {}).items():
+        by_key.update(dict.fromkeys(keys, fx_table.rate_on(str(ts)[:10]) or rate))
+    return prev_rate, by_key
+
+
+def price_blocks(prev_meta: Dict[str, Any], cards: Dict[str, Any], priced: Iterable[str], ts: str) -> Dict[str, List[str]]:
+    # An incremental snapshot's {fetched_at: [keys]} for prices newer than its prices_as_of:
+    # the blocks it inherited (minus printings that left the collection) plus this run's
+    blocks = {t: [k for k in keys if k in cards] for t, keys in (prev_meta.get("price_blocks") or {}).items()}
+    blocks[ts] = list(priced)
+    return {t: keys for t, keys in blocks.items() if keys}
+
+
+def weekly_summary_row(
+    info: Dict[str, Any],
+    prev_eur: float | None,
+    rate_gbp_per_eur: float | None,
+    prev_rate: float | None,
+) -> Dict[str, Any]:
+    eur = safe_float(info.get("eur"))
+    gbp = (eur * rate_gbp_per_eur) if (eur is not None and rate_gbp_per_eur is not None) else None
+
+    prev_gbp = (prev_eur * prev_rate) if (prev_eur is not None and prev_rate is not None) else None
+
+    delta_eur = (eur - prev_eur) if (eur is not None and prev_eur is not None) else None
+    delta_gbp = (gbp - prev_gbp) if (gbp is not None and prev_gbp is not None) else None
+    pct = ((delta_eur / prev_eur) * 100.0) if (delta_eur is not None and prev_eur not in (None, 0)) else None
+
+    return {
+        "name": info.get("name"),
+        "set": info.get("set"),
+        "collector_number": info.get("collector_number"),
+        "lang": info.get("lang"),
+        "foil_kind": info.get("foil_kind"),
+        "qty": info.get("qty"),
+        "eur": eur,
+        "gbp": gbp,
+        "prev_eur": prev_eur,
+        "prev_gbp": prev_gbp,
+        "delta_eur": delta_eur,
+        "delta_gbp": delta_gbp,
+        "pct_change": pct,
+        "risk": info.get("risk"),
+        "reserved_list": info.get("reserved_list"),
+        "released_year": info.get("released_year"),
+        "scryfall_uri": info.get("scryfall_uri"),
+        "cardmarket_url": info.get("cardmarket_url"),
+    }
+
+
+@PROFILER.timed("weekly_csv")
+def write_weekly_summary_csv(
+    out_path: str,
+    cards: Dict[str, Any],
+    rate_gbp_per_eur: float | None,
+    prev_cards: Dict[str, Any],
+    prev_rate_gbp_per_eur: float | None = None,
+    prev_key_rates: Dict[str, float | None] | None = None,
+) -> None:
+    # Previous prices convert at the rate of the previous snapshot's day when given, or of
+    # the day in prev_key_rates for printings priced on another day
+    prev_rate = rate_gbp_per_eur if prev_rate_gbp_per_eur is None else prev_rate_gbp_per_eur
+    prev_key_rates = prev_key_rates or {}
+    rows = [
+        weekly_summary_row(
+            info, safe_float(prev_cards.get(k, {}).get("eur")), rate_gbp_per_eur, prev_key_rates.get(k, prev_rate)
+        )
+        for k, info in cards.items()
+    ]
+
+    import pandas as pd
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    df = pd.DataFrame(rows)
+    df.sort_values(by=["name", "set", "collector_number", "foil_kind"], inplace=True, kind="mergesort")
+    df.to_csv(out_path, index=False, encoding="utf-8")
+
+
+def weekly_summary_path(args: argparse.Namespace) -> str:
+    stamp = datetime.now(ZoneInfo(args.tz)).strftime("%Y-%m-%d")
+    return os.path.join(args.weekly_dir, f"weekly_summary_{stamp}.csv")
+
+
+def export_snapshot_row(info: Dict[str, Any], rate_gbp_per_eur: float | None) -> Dict[str, Any]:
+    eur = safe_float(info.get("eur"))
+    gbp = (eur * rate_gbp_per_eur) if (eur is not None and rate_gbp_per_eur is not None) else None
+
+    return {
+        "name": info.get("name"),
+        "set": info.get("set"),
+        "collector_number": info.get("collector_number"),
+        "lang": info.get("lang"),
+        "foil_kind": info.get("foil_kind"),
+        "qty": info.get("qty"),
+        "eur": eur,
+        "gbp": gbp,
+        "risk": info.get("risk"),
+        "reserved_list": info.get("reserved_list"),
+        "released_year": info.get("released_year"),
+        "scryfall_uri": info.get("scryfall_uri"),
+        "cardmarket_url": info.get("cardmarket_url"),
+    }
+
+
+@PROFILER.timed("export_csv")
+def write_export_snapshot_csv(
+    out_path: str,
+    cards: Dict[str, Any],
+    rate_gbp_per_eur: float | None,
+) -> None:
+    rows = [export_snapshot_row(info, rate_gbp_per_eur) for info in cards.values()]
+
+    import pandas as pd
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    df = pd.DataFrame(rows)
+    df.sort_values(by=["name", "set", "collector_number", "foil_kind"], inplace=True, kind="mergesort")
+    df.to_csv(out_path, index=False, encoding="utf-8")
+
+
+# -------- Resident state (--daemon) --------
+
+def _file_sig(path: str) -> Tuple[int, int] | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class WarmState:
+    # What a --daemon process keeps between runs instead of rebuilding it every time:
+    # the parsed collection and its hash (until a CSV's mtime/size changes), the snapshot
+    # it last saved (until the file changes under it), the open history db, the card
+    # cache and the Scryfall/Discord HTTP sessions.
+
+    def __init__(self) -> None:
+        self._csv_hash: Tuple[Any, str] | None = None
+        self._collection: Tuple[Any, str, Any] | None = None
+        self._snapshot: Tuple[str, Any, Dict[str, Any]] | None = None
+        self._history: Tuple[Tuple[Any, ...], HistoryStore] | None = None
+        self._card_cache: Tuple[str, Dict[str, Dict[str, Any]]] | None = None
+        self.scryfall_session: requests.Session | None = None
+        self.discord_session: requests.Session | None = None
+        # Inputs of the most recent priced run: (curr_cards, prev_cards, rate, prev_rate, prev_key_rates)
+        self.last_run: Tuple[
+            Dict[str, Any], Dict[str, Any], float | None, float | None, Dict[str, float | None]
+        ] | None = None
+
+    @staticmethod
+    def csv_signature(csv_paths: List[str]) -> Tuple[Any, ...]:
+        return tuple((p, _file_sig(p)) for p in csv_paths)
+
+    def csv_hash(self, csv_paths: List[str]) -> str:
+        sig = self.csv_signature(csv_paths)
+        if self._csv_hash is None or self._csv_hash[0] != sig:
+            self._csv_hash = (sig, collection_hash(csv_paths))
+        return self._csv_hash[1]
+
+    def collection(self, csv_paths: List[str], engine: str) -> Tuple[List[Dict[str, str]], Dict[str, Card]]:
+        sig = self.csv_signature(csv_paths)
+        if self._collection is None or self._collection[:2] != (sig, engine):
+            self._collection = (sig, engine, load_collection(csv_paths, engine=engine))
+        return self._collection[2]
+
+    def snapshot(self, path: str) -> Dict[str, Any] | None:
+        if self._snapshot is None:
+            return None
+        snap_path, sig, data = self._snapshot
+        if snap_path != path or _file_sig(path) != sig:
+            return None
+        return data
+
+    def remember_snapshot(self, path: str, data: Dict[str, Any]) -> None:
+        self._snapshot = (path, _file_sig(path), data)
+
+    def history(self, args: argparse.Namespace) -> HistoryStore:
+        settings = (
+            args.history_db,
+            args.history_max_points or args.trend_window,
+            args.history_max_days,
+            args.trend_window,
+            args.history_daily_days,
+            args.history_weekly_weeks,
+        )
+        if self._history is None or self._history[0] != settings:
+            if self._history is not None:
+                self._history[1].close()
+            store = open_history_store(
+                args.history_db,
+                max_points=settings[1],
+                max_days=args.history_max_days,
+                stats_window=args.trend_window,
+                daily_days=args.history_daily_days,
+                weekly_weeks=args.history_weekly_weeks,
+                legacy_json_path=args.history_json,
+            )
+            self._history = (settings, store)
+        return self._history[1]
+
+    def card_cache(self, path: str) -> Dict[str, Dict[str, Any]]:
+        if self._card_cache is None or self._card_cache[0] != path:
+            self._card_cache = (path, load_card_cache(path) if path else {})
+        return self._card_cache[1]
+
+    def close(self) -> None:
+        if self._history is not None:
+            self._history[1].close()
+            self._history = None
+        for s in (self.scryfall_session, self.discord_session):
+            if s is not None:
+                s.close()
+
+
+def store_snapshot(args: argparse.Namespace, current: Dict[str, Any], warm: WarmState | None) -> None:
+    save_snapshot(args.snapshot, current)
+    if warm is not None:
+        warm.remember_snapshot(args.snapshot, current)
+
+
+def post_baseline_notice(args: argparse.Namespace, webhook: str, warm: WarmState | None) -> None:
+    now_local = datetime.now(ZoneInfo(args.tz))
+    outbox = DiscordQueue(
+        webhook,
+        pending_path=args.discord_pending,
+        session=warm.discord_session if warm is not None else None,
+    )
+    outbox.post(
+        f"🧱 **Baseline updated** — collection CSV changed.\n"
+        f"Time: {now_local.strftime('%Y-%m-%d %H:%M')} ({args.tz})\n"
+        f"Alerts will resume on the next scheduled run (07:00 or 19:00)."
+    )
+    outbox.finish()
+
+
+def queue_alert_report(
+    args: argparse.Namespace,
+    webhook: str,
+    warm: WarmState | None,
+    rate: float | None,
+    result: AlertResult,
+    prev_suppress_next_no_alerts: bool,
+    meta: Dict[str, Any],
+) -> DiscordQueue:
+    # Queues this run's alert sections (or the no-alerts/heartbeat line) and starts sending;
+    # clears meta["suppress_next_no_alerts"] once the post-baseline suppression is used up.
+    # The caller finish()es the queue after writing its files.
+    alerts = result.alerts
+    sell_candidates = result.sell_candidates
+    buy_more_signals = result.buy_more_signals
+    trend_alerts = result.trend_alerts
+
+    tz = ZoneInfo(args.tz)
+    now_local = datetime.now(tz)
+    fx_line = f"FX: 1 EUR = {rate:.4f} GBP" if rate is not None else "FX: unavailable"
+    header = f"🧾 MTG price watch — {now_local.strftime('%Y-%m-%d %H:%M')} ({args.tz})\n{fx_line}"
+
+    posted_anything = False
+
+    # Queued in the order they used to be posted; the queue packs them into as few
+    # payloads as fit and sends them while the snapshot and dashboard are written.
+    outbox = DiscordQueue(
+        webhook,
+        pending_path=args.discord_pending,
+        session=warm.discord_session if warm is not None else None,
+    )
+    sections = [
+        ("Sell candidates", sell_candidates),
+        ("Buy-more signals", buy_more_signals),
+        ("Trend alerts", trend_alerts),
+        ("Alerts", alerts),
+    ]
+    for title, items in sections:
+        if items:
+            outbox.post(header + f"\n{title}: {len(items)}")
+            outbox.extend(items)
+            posted_anything = True
+
+    if not alerts:
+        any_alerts = bool(sell_candidates or buy_more_signals or trend_alerts)
+        if not any_alerts:
+            if prev_suppress_next_no_alerts:
+                print("Suppressing 'No alerts today' once (post-baseline).")
+                meta["suppress_next_no_alerts"] = False
+            else:
+                outbox.post(header + "\nNo alerts today.")
+                posted_anything = True
+        else:
+            if prev_suppress_next_no_alerts:
+                meta["suppress_next_no_alerts"] = False
+
+    # Heartbeat: always tell you it ran (even if nothing triggered)
+    if not posted_anything:
+        outbox.post(header + "\n✅ Ran successfully — nothing to report.")
+        # posted_anything = True  # not needed after this
+
+    outbox.start()
+    return outbox
+
+
+def export_dashboard(args: argparse.Namespace, history: Any, curr_cards: Dict[str, Any]) -> None:
+    manifest_out, shard_dir, card_count, series_count, written = export_dashboard_from_history(
+        history=history,
+        curr_cards=curr_cards,
+        out_dir=args.dashboard_out_dir,
+        shards=args.dashboard_shards,
+    )
+    print(
+        f"[dashboard] {manifest_out} + {shard_dir} ({card_count} cards, {series_count} series, "
+        f"{written}/{args.dashboard_shards} shards rewritten)"
+    )
+
+
+@dataclass
+class RunPlan:
+    # Everything run() decided before pricing; complete_run() picks up from here
+    args: argparse.Namespace
+    warm: WarmState | None
+    weekly: bool | None
+    webhook: str
+    allow_discord: bool
+    fx: FxRefresh
+    now_iso: str
+    identifiers: List[Dict[str, str]]
+    key_to_meta: Dict[str, Card]
+    current: Dict[str, Any]
+    prev_meta: Dict[str, Any]
+    prev_cards: Dict[str, Any]
+    prev_suppress_next_no_alerts: bool
+    csv_changed: bool
+    incremental_run: bool
+    kept_keys: List[str]
+    warm_snapshot: Dict[str, Any] | None
+
+
+def run(
+    args: argparse.Namespace,
+    *,
+    warm: WarmState | None = None,
+    scheduled: bool | None = None,
+    weekly: bool | None = None,
+) -> None:
+    # scheduled/weekly override the clock checks (the daemon decides those itself);
+    # warm carries state between the runs of a resident process.
+    plan = plan_run(args, warm=warm, scheduled=scheduled, weekly=weekly)
+    if plan is None:
+        return
+    if args.stream:
+        from streaming import complete_streaming_run
+        complete_streaming_run(plan)
+        return
+    complete_run(plan, fetch_cards(args, plan.identifiers, warm, plan.current["_meta"]["csv_sha256"]))
+
+
+def plan_run(
+    args: argparse.Namespace,
+    *,
+    warm: WarmState | None = None,
+    scheduled: bool | None = None,
+    weekly: bool | None = None,
+    webhook: str | None = None,
+    fx: FxRefresh | None = None,
+) -> RunPlan | None:
+    # Gating, FX, collection and previous snapshot; None when there is nothing to do now
+    if webhook is None:
+        webhook = os.environ.get("DISCORD_WEBHOOK_URL", "")
+    webhook = webhook.strip()
+
+    # Determine scheduled status once (do not recompute later)
+    is_scheduled_time = should_run_now(args.tz, args.run_times) if scheduled is None else scheduled
+
+    # Allow Discord posting only for scheduled runs (and not disabled)
+    allow_discord = bool(webhook) and (not args.no_discord) and (not args.no_alerts) and is_scheduled_time
+
+    # Off-schedule runs with nothing to export only go on for a changed CSV; settle that
+    # from the clock, the CSV hash and the snapshot header before loading anything else
+    export_run = bool(args.export_dashboard or args.export_csv)
+    watch_csv = bool(args.baseline_on_csv_change or args.incremental_on_csv_change)
+    if not is_scheduled_time and not export_run and not watch_csv:
+        print("Not a scheduled run time; exiting.")
+        return None
+
+    csv_paths = parse_csv_list(args.csv)
+    csv_hash = warm.csv_hash(csv_paths) if warm is not None else collection_hash(csv_paths)
+
+    # Only _meta and the price column; full cards are read if an incremental run needs them.
+    # A resident process already holds the snapshot it saved last. A streaming run reads
+    # previous prices itself, block by block.
+    warm_snapshot = warm.snapshot(args.snapshot) if warm is not None else None
+    if warm_snapshot is not None:
+        prev_meta = warm_snapshot.get("_meta") or {}
+        prev_cards = warm_snapshot.get("cards") or {}
+    else:
+        if args.stream or (not is_scheduled_time and not export_run):
+            prev_meta = load_snapshot_meta(args.snapshot, legacy_json_path=args.legacy_snapshot)
+            prev_cards = {}
+            if not is_scheduled_time and not export_run and prev_meta.get("csv_sha256") == csv_hash:
+                print("Not a scheduled run time; exiting.")
+                return None
+        if not args.stream:
+            prev_meta, prev_keys, prev_eur = load_snapshot_prices(args.snapshot, legacy_json_path=args.legacy_snapshot)
+            prev_cards = price_cards(prev_keys, prev_eur)
+
+    prev_suppress_next_no_alerts = False
+    try:
+        prev_suppress_next_no_alerts = bool(prev_meta.get("suppress_next_no_alerts"))
+    except Exception:
+        prev_suppress_next_no_alerts = False
+
+    prev_hash = None
+    try:
+        prev_hash = prev_meta.get("csv_sha256")
+    except Exception:
+        prev_hash = None
+
+    csv_changed = (prev_hash != csv_hash)
+
+    # Gate to run times unless this is a baseline run caused by CSV change,
+    # OR this is a dashboard export run (manual refresh),
+    # OR this is a snapshot CSV export run.
+    if not is_scheduled_time:
+        if args.export_dashboard:
+            print("Outside scheduled run time, but exporting dashboard.")
+        elif args.export_csv:
+            print("Outside scheduled run time, but exporting snapshot CSV.")
+        elif watch_csv and csv_changed:
+            pass
+        else:
+            print("Not a scheduled run time; exiting.")
+            return None
+
+    # FX rates (GBP per EUR) refresh in the background; complete_run() waits for them
+    if fx is None:
+        fx = FxRefresh(args.fx_rates, args.fx_ttl_hours * 3600.0)
+
+    # Read & combine collection CSV(s); a streaming run reads them in chunks later
+    if args.stream:
+        identifiers, key_to_meta = [], {}
+    elif warm is not None:
+        identifiers, key_to_meta = warm.collection(csv_paths, args.csv_engine)
+    else:
+        identifiers, key_to_meta = load_collection(csv_paths, engine=args.csv_engine)
+
+    now_iso = datetime.now(timezone.utc).isoformat()
+
+    current: Dict[str, Any] = {
+        "_meta": {
+            "generated_at": now_iso,
+            "prices_as_of": now_iso,
+            "eur_to_gbp": None,
+            "csv_sha256": csv_hash,
+            "run_type": "scheduled",
+            "suppress_next_no_alerts": False,
+        },
+        "cards": {}
+    }
+
+    # Incremental refresh: the CSV changed outside a scheduled run, so only newly added
+    # printings need pricing; everything else carries forward from the last snapshot.
+    incremental_run = bool(
+        args.incremental_on_csv_change and csv_changed and prev_cards and not is_scheduled_time and not args.stream
+    )
+    added_keys, removed_keys, kept_keys = diff_collection(key_to_meta, prev_cards, prev_meta.get("unpriced_keys"))
+    if args.incremental_on_csv_change and csv_changed and prev_cards:
+        print(
+            f"[incremental] {len(added_keys)} added, {len(removed_keys)} removed, "
+            f"{len(key_to_meta) - len(added_keys)} unchanged printings"
+        )
+    if args.stream and args.incremental_on_csv_change and csv_changed:
+        print("[stream] streaming runs price the whole collection; --incremental-on-csv-change is ignored")
+    if incremental_run:
+        current["_meta"]["run_type"] = "incremental"
+        # Most of its prices are carried forward, so the snapshot keeps their date
+        current["_meta"]["prices_as_of"] = prices_as_of(prev_meta) or now_iso
+        identifiers = identifiers_for_keys(identifiers, added_keys)
+
+    return RunPlan(
+        args=args,
+        warm=warm,
+        weekly=weekly,
+        webhook=webhook,
+        allow_discord=allow_discord,
+        fx=fx,
+        now_iso=now_iso,
+        identifiers=identifiers,
+        key_to_meta=key_to_meta,
+        current=current,
+        prev_meta=prev_meta,
+        prev_cards=prev_cards,
+        prev_suppress_next_no_alerts=prev_suppress_next_no_alerts,
+        csv_changed=csv_changed,
+        incremental_run=incremental_run,
+        kept_keys=kept_keys,
+        warm_snapshot=warm_snapshot,
+    )
+
+
+def fetch_cards(
+    args: argparse.Namespace,
+    identifiers: List[Dict[str, str]],
+    warm: WarmState | None = None,
+    checkpoint_key: str = "",
+) -> Dict[str, Dict[str, Any]]:
+    # checkpoint_key identifies the collection(s) being priced (a csv_sha256), so a fetch
+    # checkpoint is only resumed by a run for the same input
+    if args.bulk_file:
+        return resolve_cards_from_bulk(identifiers, args.bulk_file)
+    return resolve_cards(
+        identifiers,
+        card_cache_path=args.card_cache,
+        price_ttl_s=args.price_ttl_hours * 3600.0,
+        not_found_ttl_s=args.not_found_ttl_days * 86400.0,
+        workers=args.fetch_workers,
+        card_cache=warm.card_cache(args.card_cache) if warm is not None else None,
+        session=warm.scryfall_session if warm is not None else None,
+        checkpoint_path=args.fetch_checkpoint,
+        checkpoint_key=checkpoint_key,
+        checkpoint_max_age_s=args.fetch_checkpoint_max_age_hours * 3600.0,
+        max_retries=args.fetch_retries,
+    )
+
+
+def complete_run(plan: RunPlan, resolved: Dict[str, Dict[str, Any]]) -> None:
+    # Merge, history, snapshot, alerts, Discord and exports for one planned run
+    args, warm, weekly, webhook, allow_discord = plan.args, plan.warm, plan.weekly, plan.webhook, plan.allow_discord
+    now_iso, current, prev_cards = plan.now_iso, plan.current, plan.prev_cards
+    identifiers, key_to_meta, kept_keys = plan.identifiers, plan.key_to_meta, plan.kept_keys
+    csv_changed, incremental_run, warm_snapshot = plan.csv_changed, plan.incremental_run, plan.warm_snapshot
+    prev_suppress_next_no_alerts = plan.prev_suppress_next_no_alerts
+
+    # Today's rate for this run; the previous snapshot's prices use the rate of its own day
+    with PROFILER.stage("fx_wait"):
+        fx_table = plan.fx.result()
+    rate = fx_table.rate_on(now_iso[:10])
+    prev_rate, prev_key_rates = prev_price_rates(fx_table, plan.prev_meta, rate)
+    current["_meta"]["eur_to_gbp"] = rate
+
+    # Merge in identifier order so the snapshot matches a fully fetched run
+    with PROFILER.stage("merge"):
+        merge_collection_batch(identifiers, list(resolved.values()), key_to_meta, current["cards"])
+
+    # Only cards priced in this run get a new history point
+    history_cards = current["cards"]
+    if incremental_run:
+        history_cards = dict(current["cards"])
+        if warm_snapshot is not None:
+            prev_full = prev_cards
+        else:
+            prev_full = load_snapshot(args.snapshot, legacy_json_path=args.legacy_snapshot).get("cards") or {}
+        current["cards"] = carry_forward_cards(key_to_meta, prev_full, kept_keys, current["cards"])
+        # The added printings were priced now, not on the snapshot's prices_as_of
+        current["_meta"]["price_blocks"] = price_blocks(plan.prev_meta, current["cards"], history_cards, now_iso)
+
+    curr_cards = current["cards"]
+    # Collection printings Scryfall couldn't price, so the next diff still counts them as known
+    current["_meta"]["unpriced_keys"] = [k for k in key_to_meta if k not in curr_cards]
+
+    # Export a full snapshot CSV if requested
+    if args.export_csv:
+        write_export_snapshot_csv(
+            out_path=args.export_csv,
+            cards=curr_cards,
+            rate_gbp_per_eur=rate,
+        )
+
+    # ---- Update trend history (unless --no-history) ----
+    if args.no_history:
+        history = None
+    elif args.history_db and warm is not None:
+        history = warm.history(args)
+        history.append(history_cards, rate, now_iso)
+        history.retain_keys(curr_cards.keys())
+    elif args.history_db:
+        history = open_history_store(
+            args.history_db,
+            max_points=args.history_max_points or args.trend_window,
+            max_days=args.history_max_days,
+            stats_window=args.trend_window,
+            daily_days=args.history_daily_days,
+            weekly_weeks=args.history_weekly_weeks,
+            legacy_json_path=args.history_json,
+        )
+        history.append(history_cards, rate, now_iso)
+        history.retain_keys(curr_cards.keys())
+    else:
+        history = load_history(args.history_json)
+        history = update_history(history, history_cards, rate, now_iso, args.history_max_points or args.trend_window)
+        history = {k: v for k, v in history.items() if k in curr_cards}
+        save_history(args.history_json, history)
+    if isinstance(history, HistoryStore):
+        filled = history.fill_missing_gbp(fx_table)
+        if filled:
+            print(f"[fx] filled in GBP for {filled} history point(s) saved without a rate")
+
+    # --- BASELINE RUN SHORT-CIRCUIT ---
+    baseline_run = bool(args.baseline_on_csv_change and csv_changed and not args.incremental_on_csv_change)
+    if baseline_run:
+        current["_meta"]["run_type"] = "baseline"
+        current["_meta"]["suppress_next_no_alerts"] = True
+        store_snapshot(args, current, warm)
+
+        if args.export_dashboard:
+            export_dashboard(args, history, curr_cards)
+
+        # IMPORTANT: baseline runs should not spam Discord (only allow at scheduled times + not --no-discord)
+        if allow_discord:
+            post_baseline_notice(args, webhook, warm)
+        return
+
+    # If we're in export-only mode, skip alert generation/posting and just save snapshot (+ optional dashboard)
+    if args.no_alerts:
+        store_snapshot(args, current, warm)
+
+        if args.export_dashboard:
+            export_dashboard(args, history, curr_cards)
+        return
+
+    with PROFILER.stage("alerts"):
+        from alerts import AlertThresholds, evaluate_alerts, trend_stats_from_rolling, trend_window_stats
+
+        keys = list(curr_cards.keys())
+        if isinstance(history, HistoryStore):
+            trend_stats = trend_stats_from_rolling(history.rolling_stats(keys), keys)
+        else:
+            trend_stats = trend_window_stats(history, keys, args.trend_window)
+        result = evaluate_alerts(curr_cards, prev_cards, trend_stats, rate, AlertThresholds.from_args(args))
+
+    if warm is not None:
+        warm.last_run = (curr_cards, prev_cards, rate, prev_rate, prev_key_rates)
+
+    # Weekly CSV
+    if is_weekly_time(args.tz, args.weekly_day, args.weekly_time) if weekly is None else weekly:
+        write_weekly_summary_csv(
+            out_path=weekly_summary_path(args),
+            cards=curr_cards,
+            rate_gbp_per_eur=rate,
+            prev_cards=prev_cards,
+            prev_rate_gbp_per_eur=prev_rate,
+            prev_key_rates=prev_key_rates,
+        )
+
+    # Discord posting (ONLY at scheduled times and only if not --no-discord)
+    if allow_discord:
+        outbox = queue_alert_report(args, webhook, warm, rate, result, prev_suppress_next_no_alerts, current["_meta"])
+
+    # Save snapshot for next run
+    store_snapshot(args, current, warm)
+
+    # Export dashboard files (Option 4)
+    if args.export_dashboard:
+        export_dashboard(args, history, curr_cards)
+
+    if allow_discord:
+        outbox.finish()
@@ -0,0 +1,138 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterator, List
+
+_NOOP = nullcontext()
+
+
+class Profiler:
+    # Per-stage wall time / call counts / tracemalloc peaks plus per-request HTTP latency.
+    # Disabled (the default) every hook returns a shared null context, so instrumented
+    # code pays one attribute check per stage.
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.started = 0.0
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.requests: List[Dict[str, Any]] = []
+        self._stack: List[List[Any]] = []
+        self._lock = threading.Lock()
+
+    def enable(self, trace_memory: bool = True) -> None:
+        self.enabled = True
+        self.started = time.perf_counter()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return _NOOP
+        return self._stage(name)
+
+    @contextmanager
+    def _stage(self, name: str) -> Iterator[None]:
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # Nested stages reset the peak, so fold what the parent has seen so far into it first
+            if self._stack:
+                self._stack[-1][1] = max(self._stack[-1][1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        frame = [name, 0]
+        self._stack.append(frame)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            self._stack.pop()
+            peak = max(frame[1], tracemalloc.get_traced_memory()[1]) if tracing else 0
+            if self._stack:
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+            st = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "peak_bytes": 0})
+            st["calls"] += 1
+            st["seconds"] += elapsed
+            st["peak_bytes"] = max(st["peak_bytes"], peak)
+
+    def timed(self, name: str):
+        # Decorator form of stage(); the enabled check happens per call
+        def deco(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self._stage(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return deco
+
+    def http(self, label: str):
+        if not self.enabled:
+            return _NOOP
+        return self._http(label)
+
+    @contextmanager
+    def _http(self, label: str) -> Iterator[Dict[str, Any]]:
+        rec: Dict[str, Any] = {"label": label, "status": None}
+        t0 = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            rec["seconds"] = round(time.perf_counter() - t0, 4)
+            with self._lock:
+                self.requests.append(rec)
+
+    def report(self, script: str) -> Dict[str, Any]:
+        http: Dict[str, Dict[str, Any]] = {}
+        for r in self.requests:
+            h = http.setdefault(r["label"], {"count": 0, "total_seconds": 0.0, "latencies": []})
+            h["count"] += 1
+            h["total_seconds"] += r["seconds"]
+            h["latencies"].append(r["seconds"])
+        for h in http.values():
+            lat = sorted(h.pop("latencies"))
+            h["total_seconds"] = round(h["total_seconds"], 4)
+            h["mean_seconds"] = round(h["total_seconds"] / h["count"], 4)
+            h["p50_seconds"] = lat[len(lat) // 2]
+            h["p95_seconds"] = lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+            h["max_seconds"] = lat[-1]
+
+        return {
+            "script": script,
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "total_seconds": round(time.perf_counter() - self.started, 4),
+            "tracemalloc_peak_mb": round(tracemalloc.get_traced_memory()[1] / 1e6, 2) if tracemalloc.is_tracing() else None,
+            "stages": {
+                name: {
+                    "calls": st["calls"],
+                    "seconds": round(st["seconds"], 4),
+                    "peak_mb": round(st["peak_bytes"] / 1e6, 2),
+                }
+                for name, st in self.stages.items()
+            },
+            "http": http,
+            "requests": self.requests,
+        }
+
+    def write_report(self, path: str, script: str) -> Dict[str, Any]:
+        rep = self.report(script)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rep, f, ensure_ascii=False, indent=2)
+
+        parts = [f"total {rep['total_seconds']:.2f}s"]
+        parts += [f"{name} {st['seconds']:.2f}s" for name, st in rep["stages"].items()]
+        n_req = len(rep["requests"])
+        if n_req:
+            parts.append(f"http {n_req} req {sum(r['seconds'] for r in rep['requests']) / n_req:.3f}s avg")
+        print(f"[profile] {' | '.join(parts)} -> {path}")
+        return rep
+
+
+PROFILER = Profiler()
@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import gzip
+import json
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Deque, Dict, Any, Iterable, Iterator, List, Tuple
+
+from profiling import PROFILER
+
+# Annotations only; make_session() imports requests, so importing this module stays cheap
+if TYPE_CHECKING:
+    import requests
+
+SCRYFALL_COLLECTION_URL = "https://api.scryfall.com/cards/collection"
+SCRYFALL_BATCH_SIZE = 75
+
+# Scryfall asks for 50-100ms between requests, i.e. ~10 requests/second.
+SCRYFALL_RATE_PER_SEC = 10.0
+SCRYFALL_BURST = 2
+
+USER_AGENT = "mtgPriceChecker/1.0"
+
+# Transient failures (connection errors, timeouts, 5xx, 429) are retried this many times.
+# Backoff is exponential with full jitter, so workers that failed together don't retry together.
+SCRYFALL_MAX_RETRIES = 5
+SCRYFALL_BACKOFF_BASE_S = 1.0
+SCRYFALL_BACKOFF_CAP_S = 30.0
+RETRY_STATUSES = frozenset([500, 502, 503, 504])
+
+
+class TokenBucket:
+    def __init__(self, rate_per_sec: float, capacity: int = 1):
+        self.rate = float(rate_per_sec)
+        self.capacity = max(1, int(capacity))
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self._tokens >= 1.0:
+                        self._tokens -= 1.0
+                        return
+                    wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        # Called on 429 (and retry backoff): every worker waits, not just the one that failed.
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + max(0.0, seconds))
+            self._tokens = 0.0
+
+
+def make_session(pool_size: int = 4) -> requests.Session:
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size))
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    s.headers.update({"User-Agent": USER_AGENT, "Accept": "application/json"})
+    return s
+
+
+def _retry_after_seconds(r: requests.Response, default: float = 1.0) -> float:
+    v = r.headers.get("Retry-After")
+    try:
+        return float(v) if v is not None else default
+    except (TypeError, ValueError):
+        return default
+
+
+def backoff_delay(attempt: int, base: float = SCRYFALL_BACKOFF_BASE_S, cap: float = SCRYFALL_BACKOFF_CAP_S) -> float:
+    return random.uniform(0.0, min(cap, base * (2 ** attempt)))
+
+
+def post_collection_batch(
+    session: requests.Session,
+    limiter: TokenBucket,
+    batch: List[Dict[str, Any]],
+    max_retries: int = SCRYFALL_MAX_RETRIES,
+) -> Dict[str, Any]:
+    import requests
+
+    attempt = 0
+    while True:
+        limiter.acquire()
+        retry = attempt < max_retries
+        try:
+            with PROFILER.http("scryfall.collection") as rec:
+                r = session.post(SCRYFALL_COLLECTION_URL, json={"identifiers": batch}, timeout=60)
+                if rec is not None:
+                    rec["status"] = r.status_code
+            if r.status_code == 429 and retry:
+                limiter.pause(_retry_after_seconds(r))
+                attempt += 1
+                continue
+            if r.status_code in RETRY_STATUSES and retry:
+                reason = f"HTTP {r.status_code}"
+            else:
+                r.raise_for_status()
+                return r.json()
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            if not retry:
+                raise
+            reason = type(e).__name__
+        # Every worker backs off, not just this one: the server is struggling for all of them
+        delay = backoff_delay(attempt)
+        print(f"[scryfall] {reason}; retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+        limiter.pause(delay)
+        attempt += 1
+
+
+def iter_collection_batches(
+    batches: Iterable[List[Dict[str, Any]]],
+    *,
+    workers: int = 4,
+    session: requests.Session | None = None,
+    limiter: TokenBucket | None = None,
+    max_retries: int = SCRYFALL_MAX_RETRIES,
+) -> Iterator[Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
+    # Yields (batch, response_json) in input order so callers merge exactly as the serial loop did.
+    # At most 2 * workers batches are in flight, so responses are never held much ahead of
+    # the caller and batches can come from a generator.
+    workers = max(1, int(workers))
+    own_session = session is None
+    if session is None:
+        session = make_session(pool_size=workers)
+    if limiter is None:
+        limiter = TokenBucket(SCRYFALL_RATE_PER_SEC, SCRYFALL_BURST)
+    try:
+        if workers == 1:
+            for batch in batches:
+                yield batch, post_collection_batch(session, limiter, batch, max_retries)
+            return
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            in_flight: Deque[Tuple[List[Dict[str, Any]], Future]] = deque()
+            try:
+                for batch in batches:
+                    in_flight.append((batch, pool.submit(post_collection_batch, session, limiter, batch, max_retries)))
+                    if len(in_flight) >= 2 * workers:
+                        b, fut = in_flight.popleft()
+                        yield b, fut.result()
+                while in_flight:
+                    b, fut = in_flight.popleft()
+                    yield b, fut.result()
+            except BaseException:
+                for _, fut in in_flight:
+                    fut.cancel()
+                raise
+    finally:
+        if own_session:
+            session.close()
+
+
+# -------- Bulk data (offline pricing) --------
+
+BULK_READ_SIZE = 1024 * 1024
+
+
+def _open_bulk(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_bulk_cards(path: str) -> Iterator[Dict[str, Any]]:
+    # Bulk files are one huge JSON array; decode it element by element so only
+    # the current read buffer and one card are ever held in memory.
+    decoder = json.JSONDecoder()
+    with _open_bulk(path) as f:
+        buf = ""
+        pos = 0
+        eof = False
+        started = False
+
+        def fill() -> bool:
+            nonlocal buf, pos, eof
+            data = f.read(BULK_READ_SIZE)
+            if not data:
+                eof = True
+                return False
+            buf = buf[pos:] + data
+            pos = 0
+            return True
+
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                if eof or not fill():
+                    break
+                continue
+
+            ch = buf[pos]
+            if not started:
+                if ch != "[":
+                    raise ValueError(f"{path}: expected a JSON array of cards")
+                started = True
+                pos += 1
+                continue
+            if ch == "]":
+                return
+
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof or not fill():
+                    raise
+                continue
+            # A value ending exactly at the buffer edge may be a truncated number/literal
+            if end >= len(buf) and not eof and fill():
+                continue
+            pos = end
+            if isinstance(obj, dict):
+                yield obj
+
+    if started:
+        raise ValueError(f"{path}: truncated bulk file")
+
+
+def slim_card(c: Dict[str, Any]) -> Dict[str, Any]:
+    # The subset of a card object that merge_collection_batch reads.
+    prices = c.get("prices") or {}
+    purchase = c.get("purchase_uris") or {}
+    return {
+        "set": c.get("set"),
+        "collector_number": c.get("collector_number"),
+        "lang": c.get("lang"),
+        "scryfall_uri": c.get("scryfall_uri"),
+        "released_at": c.get("released_at"),
+        "reserved": c.get("reserved"),
+        "purchase_uris": {"cardmarket": purchase.get("cardmarket")},
+        "prices": {"eur": prices.get("eur"), "eur_foil": prices.get("eur_foil"), "eur_etched": prices.get("eur_etched")},
+    }
+
+
+def build_bulk_index(
+    path: str,
+    wanted: Iterable[Tuple[str, str, str]] | None = None,
+) -> Dict[Tuple[str, str, str], Dict[str, Any]]:
+    # Keyed like the merge step: (set lower, collector_number, lang lower).
+    # Restricting to the collection's identifiers keeps the index small.
+    wanted_set = set(wanted) if wanted is not None else None
+    index: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+    for c in iter_bulk_cards(path):
+        k = (
+            str(c.get("set", "")).lower(),
+            str(c.get("collector_number", "")).strip(),
+            str(c.get("lang", "en")).lower(),
+        )
+        if wanted_set is not None and k not in wanted_set:
+            continue
+        index[k] = slim_card(c)
+    return index
@@ -0,0 +1,277 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+from datetime import date
+from typing import Dict, Any, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from profiling import PROFILER
+
+ARCHIVE_DIR = "data/weekly/archive"
+SNAP_RE = re.compile(r"^\d{4}-\d{2}-\d{2}\.csv$")
+
+# Layout under the archive dir:
+#   manifest.json           {"partitions": {"YYYY-MM-DD": {"path", "rows", "sha256"}}}
+#   keys.json               card dictionary: row i is [name, set, collector_number, foil_kind, lang]
+#   YYYY/YYYY-MM-DD.npz     one partition per snapshot date, one array per column:
+#                           key_id (int32, sorted), qty, gbp, eur (float64)
+# np.load() on an .npz reads members on access, so a query only reads the columns it
+# asks for, and a card's rows in a partition are found by binary search on key_id.
+MANIFEST_FILE = "manifest.json"
+KEYS_FILE = "keys.json"
+PARTITION_COLUMNS = ["key_id", "qty", "gbp", "eur"]
+# The columns read from a weekly snapshot CSV
+SNAPSHOT_TEXT_COLS = ["name", "set", "collector_number", "foil_kind", "lang"]
+SNAPSHOT_NUM_COLS = ["qty", "gbp", "eur"]
+
+
+@PROFILER.timed("snapshot_load")
+def load_snapshot(path: str) -> pd.DataFrame:
+    # Only the columns the summary reads; text columns stay strings
+    wanted = set(SNAPSHOT_TEXT_COLS + SNAPSHOT_NUM_COLS)
+    df = pd.read_csv(path, usecols=lambda c: c in wanted, dtype={c: str for c in SNAPSHOT_TEXT_COLS})
+
+    # Normalise expected columns defensively
+    for col in SNAPSHOT_NUM_COLS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+
+    if "qty" not in df.columns:
+        df["qty"] = 0
+    df["qty"] = df["qty"].fillna(0)
+
+    # Prefer GBP; fall back to EUR if GBP missing
+    if "gbp" not in df.columns:
+        df["gbp"] = None
+    df["gbp"] = df["gbp"].fillna(df.get("eur", 0)).fillna(0)
+
+    # A stable key to match cards between weeks
+    for c in SNAPSHOT_TEXT_COLS:
+        if c not in df.columns:
+            df[c] = ""
+        df[c] = df[c].fillna("").astype(str)
+
+    df["key"] = (
+        df["name"].str.strip() + "||" +
+        df["set"].str.strip() + "||" +
+        df["collector_number"].str.strip() + "||" +
+        df["foil_kind"].str.strip() + "||" +
+        df["lang"].str.strip()
+    )
+
+    return df
+
+
+def snapshot_value(df: pd.DataFrame) -> float:
+    return float((df["qty"] * df["gbp"]).sum())
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _write_json(path: str, data: Any) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+class SnapshotArchive:
+    # Dated weekly snapshots ingested into per-date columnar partitions that share one
+    # card dictionary, for value-over-time and per-card history without the CSVs.
+
+    def __init__(self, root: str = ARCHIVE_DIR):
+        self.root = root
+        self.partitions: Dict[str, Dict[str, Any]] = {}
+        self.keys: List[List[str]] = []
+        try:
+            with open(os.path.join(root, MANIFEST_FILE), "r", encoding="utf-8") as f:
+                self.partitions = json.load(f).get("partitions") or {}
+            with open(os.path.join(root, KEYS_FILE), "r", encoding="utf-8") as f:
+                self.keys = json.load(f)
+        except (OSError, ValueError, AttributeError):
+            self.partitions, self.keys = {}, []
+        self._key_index: pd.Index | None = None
+
+    # ---- dictionary ----
+
+    def _index(self) -> pd.Index:
+        if self._key_index is None:
+            self._key_index = pd.Index(["||".join(k) for k in self.keys])
+        return self._key_index
+
+    def key_ids(self, keys: Iterable[str]) -> np.ndarray:
+        # Dictionary ids for card keys (name||set||collector_number||foil_kind||lang), -1 if unknown
+        return self._index().get_indexer(list(keys))
+
+    def find_keys(self, name: str) -> List[str]:
+        # Every archived printing of a card name (case-insensitive)
+        name = name.strip().lower()
+        return ["||".join(k) for k in self.keys if k[0].strip().lower() == name]
+
+    # ---- ingest ----
+
+    def dates(self, since: str | None = None, until: str | None = None) -> List[str]:
+        return [d for d in sorted(self.partitions) if (not since or d >= since) and (not until or d <= until)]
+
+    @PROFILER.timed("archive_ingest")
+    def ingest(self, csv_path: str, day: str | None = None) -> bool:
+        # Adds (or replaces) the partition for one dated snapshot CSV; False when it is
+        # already archived with the same content
+        day = day or os.path.basename(csv_path)[:10]
+        date.fromisoformat(day)
+        sha = _sha256(csv_path)
+        if (self.partitions.get(day) or {}).get("sha256") == sha:
+            return False
+
+        df = load_snapshot(csv_path)
+        ids = self.key_ids(df["key"])
+        new = ids < 0
+        if new.any():
+            # The same stripped parts the key is built from
+            new_rows = df.loc[new, SNAPSHOT_TEXT_COLS].apply(lambda col: col.str.strip()).drop_duplicates()
+            self.keys.extend(new_rows.values.tolist())
+            self._key_index = None
+            ids = self.key_ids(df["key"])
+
+        order = np.argsort(ids, kind="stable")
+        eur = df["eur"].to_numpy(dtype=np.float64) if "eur" in df.columns else np.full(len(df), np.nan)
+        columns = {
+            "key_id": ids[order].astype(np.int32),
+            "qty": df["qty"].to_numpy(dtype=np.float64)[order],
+            "gbp": df["gbp"].to_numpy(dtype=np.float64)[order],
+            "eur": eur[order],
+        }
+
+        rel = os.path.join(day[:4], f"{day}.npz")
+        path = os.path.join(self.root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, **columns)
+        os.replace(tmp, path)
+
+        self.partitions[day] = {"path": rel, "rows": int(len(df)), "sha256": sha}
+        # Dictionary first: a manifest never points at key ids the dictionary lacks
+        _write_json(os.path.join(self.root, KEYS_FILE), self.keys)
+        _write_json(os.path.join(self.root, MANIFEST_FILE), {"partitions": dict(sorted(self.partitions.items()))})
+        return True
+
+    def backfill(self, snapshots_dir: str) -> int:
+        # Ingests every YYYY-MM-DD.csv in snapshots_dir that isn't archived yet (or changed)
+        added = 0
+        for name in sorted(f for f in os.listdir(snapshots_dir) if SNAP_RE.match(f)):
+            if self.ingest(os.path.join(snapshots_dir, name)):
+                print(f"[archive] ingested {name}")
+                added += 1
+        return added
+
+    # ---- queries ----
+
+    def _columns(self, day: str, names: List[str]) -> Dict[str, np.ndarray]:
+        with np.load(os.path.join(self.root, self.partitions[day]["path"])) as z:
+            return {n: z[n] for n in names}
+
+    @PROFILER.timed("archive_value")
+    def value_over_time(self, since: str | None = None, until: str | None = None) -> pd.DataFrame:
+        # Collection value (GBP) and card count per snapshot date; reads qty and gbp only
+        rows = []
+        for day in self.dates(since, until):
+            c = self._columns(day, ["qty", "gbp"])
+            rows.append({"date": day, "value_gbp": float(np.dot(c["qty"], np.nan_to_num(c["gbp"]))), "cards": float(c["qty"].sum())})
+        return pd.DataFrame(rows, columns=["date", "value_gbp", "cards"])
+
+    def snapshot(self, day: str) -> pd.DataFrame:
+        # One date's rows as key/qty/gbp, the columns the weekly movers compare
+        c = self._columns(day, ["key_id", "qty", "gbp"])
+        return pd.DataFrame({"key": self._index().to_numpy()[c["key_id"]], "qty": c["qty"], "gbp": c["gbp"]})
+
+    @PROFILER.timed("archive_card_history")
+    def card_history(self, keys: List[str], since: str | None = None, until: str | None = None) -> pd.DataFrame:
+        # One row per (date, key) the card appears in: qty summed, gbp/eur of its first row
+        ids = self.key_ids(keys)
+        known = [(k, i) for k, i in zip(keys, ids.tolist()) if i >= 0]
+        rows = []
+        if known:
+            want = np.array(sorted({i for _, i in known}), dtype=np.int32)
+            for day in self.dates(since, until):
+                c = self._columns(day, PARTITION_COLUMNS)
+                lo = np.searchsorted(c["key_id"], want, side="left")
+                hi = np.searchsorted(c["key_id"], want, side="right")
+                for kid, a, b in zip(want.tolist(), lo.tolist(), hi.tolist()):
+                    if a == b:
+                        continue
+                    rows.append({
+                        "date": day,
+                        "key": "||".join(self.keys[kid]),
+                        "qty": float(c["qty"][a:b].sum()),
+                        "gbp": float(c["gbp"][a]),
+                        "eur": float(c["eur"][a]),
+                    })
+        return pd.DataFrame(rows, columns=["date", "key", "qty", "gbp", "eur"])
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Columnar archive of the dated weekly snapshot CSVs")
+    ap.add_argument("--archive", default=ARCHIVE_DIR, help=f"Archive directory (default: {ARCHIVE_DIR})")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("ingest", help="Add one dated snapshot CSV")
+    p.add_argument("file")
+    p.add_argument("--date", default="", help="Snapshot date (default: from the YYYY-MM-DD.csv file name)")
+
+    p = sub.add_parser("backfill", help="Add every dated CSV in a snapshots directory")
+    p.add_argument("--snapshots-dir", default="data/weekly/snapshots")
+
+    for cmd, help_text in (("value", "Collection value per snapshot date"), ("card", "Price history of one card")):
+        p = sub.add_parser(cmd, help=help_text)
+        if cmd == "card":
+            p.add_argument("card", help="Card name (every printing) or a name||set||number||foil||lang key")
+        p.add_argument("--since", default="", help="YYYY-MM-DD")
+        p.add_argument("--until", default="", help="YYYY-MM-DD")
+        p.add_argument("--out", default="", help="Write CSV here instead of printing")
+
+    ap.add_argument("--profile", nargs="?", const="archive_profile.json", default="",
+                    help="Write per-stage timing/memory JSON here (default: archive_profile.json)")
+    args = ap.parse_args()
+
+    if args.profile:
+        PROFILER.enable()
+    try:
+        archive = SnapshotArchive(args.archive)
+        if args.cmd == "ingest":
+            added = archive.ingest(args.file, args.date or None)
+            print(f"[archive] {'ingested' if added else 'already archived:'} {args.file}")
+            return
+        if args.cmd == "backfill":
+            added = archive.backfill(args.snapshots_dir)
+            print(f"[archive] {added} snapshot(s) added, {len(archive.partitions)} archived")
+            return
+
+        if args.cmd == "value":
+            df = archive.value_over_time(args.since or None, args.until or None)
+        else:
+            keys = [args.card] if "||" in args.card else archive.find_keys(args.card)
+            if not keys:
+                raise SystemExit(f"No archived card matches {args.card!r}")
+            df = archive.card_history(keys, args.since or None, args.until or None)
+        if args.out:
+            df.to_csv(args.out, index=False)
+            print(f"[archive] wrote {len(df)} rows to {args.out}")
+        else:
+            print(df.to_string(index=False))
+    finally:
+        if args.profile:
+            PROFILER.write_report(args.profile, "snapshot_archive")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from operator import itemgetter
+from typing import TYPE_CHECKING, Dict, Any, Iterator, List, Tuple
+
+from card_record import Card, CardPrice, fill_column, full_columns
+from profiling import PROFILER
+
+# numpy is imported by the column codecs, so reading just _meta never loads it
+if TYPE_CHECKING:
+    import numpy as np
+
+SNAPSHOT_PATH = "data/last_prices.snap"
+LEGACY_SNAPSHOT_PATH = "data/last_prices.json"
+
+# Layout: MAGIC | u32 header length | header JSON | column blocks.
+# The header holds _meta, the card count and each column's codec/offset/size, so _meta
+# and single columns can be read with one seek each. Columns:
+#   "f8"   raw little-endian float64, NaN for None (used for eur, loaded straight into numpy)
+#   "json" zlib-compressed JSON list (keys and every other card field)
+# A column may list "absent" row indices for cards that didn't have that field at all.
+# Snapshots written block by block (SnapshotWriter) store each column as "blocks", each
+# with its own codec/offset/size, first row ("start"), row count and "absent" list; rows
+# no block covers are absent.
+MAGIC = b"MTGSNAP1"
+_HEADER_LEN = struct.Struct("<I")
+PRICE_COLUMN = "eur"
+KEY_COLUMN = "\x00key"
+
+
+def _is_f8_column(values: List[Any]) -> bool:
+    return all(v is None or type(v) is float for v in values)
+
+
+def _encode_column(values: List[Any], f8: bool) -> Tuple[str, bytes]:
+    if f8:
+        import numpy as np
+
+        arr = np.array([np.nan if v is None else v for v in values], dtype="<f8")
+        return "f8", arr.tobytes()
+    raw = json.dumps(values, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return "json", zlib.compress(raw, 1)
+
+
+def _decode_column(codec: str, blob: bytes) -> List[Any]:
+    if codec == "f8":
+        import numpy as np
+
+        arr = np.frombuffer(blob, dtype="<f8")
+        return [None if np.isnan(x) else x for x in arr.tolist()]
+    return json.loads(zlib.decompress(blob))
+
+
+def _split_columns(infos: List[Dict[str, Any]]) -> Tuple[List[str], Dict[str, List[Any]], Dict[str, List[int]]]:
+    # Cards normally all carry the same fields, which lets one C-level pass split the rows
+    # into columns; anything else falls back to per-field lookups with "absent" lists.
+    full = full_columns(infos)
+    if full is not None:
+        return full[0], full[1], {}
+    fields = list(infos[0].keys()) if infos else []
+    first_keys = infos[0].keys() if infos else None
+    if fields and all(info.keys() == first_keys for info in infos):
+        get_row = itemgetter(*fields) if len(fields) > 1 else (lambda info: (info[fields[0]],))
+        values_by_field = dict(zip(fields, (list(col) for col in zip(*map(get_row, infos)))))
+        return fields, values_by_field, {}
+    fields = list(dict.fromkeys(f for info in infos for f in info))
+    values_by_field = {f: [info.get(f) for info in infos] for f in fields}
+    absent_by_field = {f: [i for i, info in enumerate(infos) if f not in info] for f in fields}
+    return fields, values_by_field, absent_by_field
+
+
+@PROFILER.timed("snapshot_save")
+def save_snapshot(path: str, data: Dict[str, Any]) -> None:
+    cards: Dict[str, Dict[str, Any]] = data.get("cards") or {}
+    keys = list(cards.keys())
+    fields, values_by_field, absent_by_field = _split_columns(list(cards.values()))
+
+    columns = [(KEY_COLUMN, *_encode_column(keys, f8=False), [])]
+    for f in fields:
+        values = values_by_field[f]
+        columns.append((f, *_encode_column(values, f8=_is_f8_column(values)), absent_by_field.get(f, [])))
+
+    offset = 0
+    header_cols = []
+    for name, codec, blob, absent in columns:
+        col = {"name": name, "codec": codec, "offset": offset, "size": len(blob)}
+        if absent:
+            col["absent"] = absent
+        header_cols.append(col)
+        offset += len(blob)
+    header = json.dumps(
+        {"meta": data.get("_meta") or {}, "count": len(keys), "columns": header_cols},
+        ensure_ascii=False, separators=(",", ":"),
+    ).encode("utf-8")
+
+    # Write-then-rename so a crash never leaves a half-written snapshot behind
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(_HEADER_LEN.pack(len(header)))
+        f.write(header)
+        for _, _, blob, _ in columns:
+            f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class SnapshotWriter:
+    # save_snapshot() for cards that arrive a block at a time (--stream): add() encodes each
+    # block's columns into per-column spool files, close() writes the header (with _meta,
+    # which is only final at the end of a run) and copies the spools in after it.
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._spool_dir = tempfile.mkdtemp(prefix=".snapshot-", dir=os.path.dirname(path) or ".")
+        self._spools: Dict[str, Any] = {}
+        self._blocks: Dict[str, List[Dict[str, Any]]] = {}
+        self.count = 0
+
+    def _append(self, name: str, values: List[Any], f8: bool, start: int, absent: List[int]) -> None:
+        if name not in self._spools:
+            self._spools[name] = open(os.path.join(self._spool_dir, str(len(self._spools))), "w+b")
+            self._blocks[name] = []
+        spool = self._spools[name]
+        codec, blob = _encode_column(values, f8)
+        block = {"codec": codec, "offset": spool.tell(), "size": len(blob), "start": start, "count": len(values)}
+        if absent:
+            block["absent"] = absent
+        spool.write(blob)
+        self._blocks[name].append(block)
+
+    def add(self, cards: Dict[str, Dict[str, Any]]) -> None:
+        if not cards:
+            return
+        fields, values_by_field, absent_by_field = _split_columns(list(cards.values()))
+        self._append(KEY_COLUMN, list(cards.keys()), False, self.count, [])
+        for f in fields:
+            values = values_by_field[f]
+            self._append(f, values, _is_f8_column(values), self.count, absent_by_field.get(f, []))
+        self.count += len(cards)
+
+    @PROFILER.timed("snapshot_save")
+    def close(self, meta: Dict[str, Any]) -> None:
+        try:
+            if KEY_COLUMN not in self._spools:
+                self._append(KEY_COLUMN, [], False, 0, [])
+            header_cols = []
+            base = 0
+            for name, spool in self._spools.items():
+                for block in self._blocks[name]:
+                    block["offset"] += base
+                header_cols.append({"name": name, "blocks": self._blocks[name]})
+                base += spool.tell()
+            header = json.dumps(
+                {"meta": meta or {}, "count": self.count, "columns": header_cols},
+                ensure_ascii=False, separators=(",", ":"),
+            ).encode("utf-8")
+
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(MAGIC)
+                f.write(_HEADER_LEN.pack(len(header)))
+                f.write(header)
+                for spool in self._spools.values():
+                    spool.seek(0)
+                    shutil.copyfileobj(spool, f, 1 << 20)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        finally:
+            self.abort()
+
+    def abort(self) -> None:
+        for spool in self._spools.values():
+            spool.close()
+        self._spools = {}
+        shutil.rmtree(self._spool_dir, ignore_errors=True)
+
+
+class _Reader:
+    def __init__(self, f):
+        self.f = f
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("not a snapshot file")
+        (n,) = _HEADER_LEN.unpack(f.read(_HEADER_LEN.size))
+        self.header = json.loads(f.read(n))
+        self.base = len(MAGIC) + _HEADER_LEN.size + n
+        self.columns = {c["name"]: c for c in self.header["columns"]}
+
+    def blocks(self, name: str) -> List[Dict[str, Any]]:
+        # Every column as a list of blocks; a single-block column covers all rows
+        c = self.columns[name]
+        if "blocks" in c:
+            return c["blocks"]
+        return [{**c, "start": 0, "count": self.header["count"]}]
+
+    def blob(self, block: Dict[str, Any]) -> bytes:
+        self.f.seek(self.base + block["offset"])
+        return self.f.read(block["size"])
+
+    def block_values(self, block: Dict[str, Any]) -> List[Any]:
+        return _decode_column(block["codec"], self.blob(block))
+
+    def values(self, name: str) -> List[Any]:
+        out: List[Any] = []
+        for block in self.blocks(name):
+            out.extend(self.block_values(block))
+        return out
+
+
+def _load_legacy_json(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            content = f.read().strip()
+        data = json.loads(content) if content else {}
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+
+def _resolve(path: str, legacy_json_path: str | None) -> Tuple[str | None, bool]:
+    # (path to read, is legacy JSON); the old JSON snapshot is read until the first save
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            is_binary = f.read(len(MAGIC)) == MAGIC
+        return path, not is_binary
+    if legacy_json_path and os.path.exists(legacy_json_path):
+        return legacy_json_path, True
+    return None, False
+
+
+@PROFILER.timed("snapshot_load")
+def load_snapshot(path: str, legacy_json_path: str | None = None) -> Dict[str, Any]:
+    # Full {"_meta": ..., "cards": {...}}; {} when missing or unreadable
+    src, legacy = _resolve(path, legacy_json_path)
+    if src is None:
+        return {}
+    if legacy:
+        data = _load_legacy_json(src)
+        if isinstance(data.get("cards"), dict):
+            data["cards"] = {k: Card.from_mapping(v) for k, v in data["cards"].items() if isinstance(v, dict)}
+        return data
+    try:
+        with open(src, "rb") as f:
+            r = _Reader(f)
+            keys = r.values(KEY_COLUMN)
+            cards: Dict[str, Card] = {k: Card() for k in keys}
+            rows = list(cards.values())
+            for c in r.header["columns"]:
+                if c["name"] == KEY_COLUMN:
+                    continue
+                name = c["name"]
+                for block in r.blocks(name):
+                    start = block["start"]
+                    part = rows[start:start + block["count"]]
+                    values = r.block_values(block)
+                    if block.get("absent"):
+                        absent = set(block["absent"])
+                        part = [row for i, row in enumerate(part) if i not in absent]
+                        values = [v for i, v in enumerate(values) if i not in absent]
+                    fill_column(part, name, values)
+        return {"_meta": r.header["meta"], "cards": cards}
+    except Exception:
+        return {}
+
+
+@PROFILER.timed("snapshot_meta")
+def load_snapshot_meta(path: str, legacy_json_path: str | None = None) -> Dict[str, Any]:
+    # Just _meta (csv_sha256, generated_at, ...): the header of a binary snapshot, no columns
+    src, legacy = _resolve(path, legacy_json_path)
+    if src is None:
+        return {}
+    if legacy:
+        return _load_legacy_json(src).get("_meta") or {}
+    try:
+        with open(src, "rb") as f:
+            return _Reader(f).header["meta"] or {}
+    except Exception:
+        return {}
+
+
+@PROFILER.timed("snapshot_load")
+def load_snapshot_prices(path: str, legacy_json_path: str | None = None) -> Tuple[Dict[str, Any], List[str], np.ndarray]:
+    # (_meta, keys, eur as float64 with NaN for missing) without decoding any other column
+    import numpy as np
+
+    src, legacy = _resolve(path, legacy_json_path)
+    if src is None:
+        return {}, [], np.empty(0)
+    if legacy:
+        data = _load_legacy_json(src)
+        cards = data.get("cards") or {}
+        eur = np.array([_as_float(c.get(PRICE_COLUMN)) for c in cards.values()], dtype=np.float64)
+        return data.get("_meta") or {}, list(cards.keys()), eur
+    try:
+        with open(src, "rb") as f:
+            r = _Reader(f)
+            keys = r.values(KEY_COLUMN)
+            eur = np.full(len(keys), np.nan)
+            if PRICE_COLUMN in r.columns:
+                for block in r.blocks(PRICE_COLUMN):
+                    start = block["start"]
+                    eur[start:start + block["count"]] = _price_block(r, block)
+        return r.header["meta"], keys, eur
+    except Exception:
+        return {}, [], np.empty(0)
+
+
+def _price_block(r: _Reader, block: Dict[str, Any]) -> np.ndarray:
+    import numpy as np
+
+    if block["codec"] == "f8":
+        return np.frombuffer(r.blob(block), dtype="<f8")
+    return np.array([_as_float(v) for v in r.block_values(block)], dtype=np.float64)
+
+
+def iter_snapshot_prices(
+    path: str,
+    legacy_json_path: str | None = None,
+) -> Iterator[Tuple[List[str], np.ndarray]]:
+    # load_snapshot_prices() a key block at a time, so a snapshot written by SnapshotWriter
+    # is read back in bounded memory (older snapshots come back as one block)
+    import numpy as np
+
+    src, legacy = _resolve(path, legacy_json_path)
+    if src is None:
+        return
+    if not legacy:
+        with open(src, "rb") as f:
+            try:
+                r = _Reader(f)
+                blocked = "blocks" in r.columns.get(KEY_COLUMN, {})
+            except Exception:
+                blocked = False
+            if blocked:
+                price_blocks = {b["start"]: b for b in r.blocks(PRICE_COLUMN)} if PRICE_COLUMN in r.columns else {}
+                for block in r.blocks(KEY_COLUMN):
+                    keys = r.block_values(block)
+                    pb = price_blocks.get(block["start"])
+                    eur = _price_block(r, pb).astype(np.float64) if pb is not None else np.full(len(keys), np.nan)
+                    if keys:
+                        yield keys, eur
+                return
+    _, keys, eur = load_snapshot_prices(path, legacy_json_path=legacy_json_path)
+    if keys:
+        yield keys, eur
+
+
+def _as_float(v: Any) -> float:
+    try:
+        return float(v) if v is not None else math.nan
+    except Exception:
+        return math.nan
+
+
+def price_cards(keys: List[str], eur: np.ndarray) -> Dict[str, CardPrice]:
+    # The {key: {"eur": ...}} shape alerts and the weekly CSV read from the previous snapshot
+    return {k: CardPrice(None if math.isnan(e) else e) for k, e in zip(keys, eur.tolist())}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Convert price snapshots between the JSON and binary formats")
+    ap.add_argument("src", help="Snapshot to read (JSON or binary)")
+    ap.add_argument("dst", help="Where to write it")
+    ap.add_argument("--to", choices=["snap", "json"], default="snap", help="Output format (default: snap)")
+    args = ap.parse_args()
+
+    data = load_snapshot(args.src)
+    if not data:
+        raise SystemExit(f"Could not read a snapshot from {args.src}")
+    if args.to == "snap":
+        save_snapshot(args.dst, data)
+    else:
+        if os.path.dirname(args.dst):
+            os.makedirs(os.path.dirname(args.dst), exist_ok=True)
+        with open(args.dst, "w", encoding="utf-8") as f:
+            cards = {k: dict(v) for k, v in (data.get("cards") or {}).items()}
+            json.dump({**data, "cards": cards}, f, ensure_ascii=False, indent=2, sort_keys=True)
+    print(f"Wrote {len(data.get('cards') or {})} cards to {args.dst}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+import csv
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from collections import deque
+from collections.abc import Mapping
+from typing import Dict, Any, Deque, Iterator, List, Tuple
+
+from card_record import Card, CardPrice, intern_value
+from history_store import open_history_store
+from pipeline import (
+    COLLECTION_DTYPES,
+    COLLECTION_REQUIRED_COLS,
+    RunPlan,
+    export_dashboard,
+    export_snapshot_row,
+    group_collection,
+    is_weekly_time,
+    merge_collection_batch,
+    parse_csv_list,
+    post_baseline_notice,
+    prev_price_rates,
+    queue_alert_report,
+    weekly_summary_path,
+    weekly_summary_row,
+)
+from profiling import PROFILER
+from scryfall import SCRYFALL_BATCH_SIZE, iter_bulk_cards, iter_collection_batches, slim_card
+from snapshot_store import SnapshotWriter, iter_snapshot_prices
+
+# --stream keeps everything that grows with the collection in a scratch SQLite file:
+# the grouped printings (filled chunk by chunk from the CSVs), the previous snapshot's
+# prices, bulk-file hits and every merged card (for the sorted CSVs and the dashboard).
+# Python only ever holds one CSV chunk, a few Scryfall batches and one block of cards.
+_SCRATCH_SCHEMA = """
+CREATE TABLE printings (
+    set_code  TEXT NOT NULL,
+    collector TEXT NOT NULL,
+    lang_code TEXT NOT NULL,
+    foil_kind TEXT NOT NULL,
+    qty       REAL NOT NULL,
+    name      TEXT,
+    PRIMARY KEY (set_code, collector, lang_code, foil_kind)
+) WITHOUT ROWID;
+CREATE TABLE prev (
+    key TEXT PRIMARY KEY,
+    eur REAL
+) WITHOUT ROWID;
+CREATE TABLE bulk (
+    set_code  TEXT NOT NULL,
+    collector TEXT NOT NULL,
+    lang_code TEXT NOT NULL,
+    card      TEXT NOT NULL,
+    PRIMARY KEY (set_code, collector, lang_code)
+) WITHOUT ROWID;
+CREATE TABLE cards (
+    seq           INTEGER PRIMARY KEY,
+    key           TEXT NOT NULL UNIQUE,
+    info          TEXT NOT NULL,
+    prev_eur      REAL,
+    name          TEXT,
+    set_code      TEXT,
+    collector     TEXT,
+    foil_kind     TEXT,
+    released_year INTEGER
+);
+"""
+
+# The order write_export_snapshot_csv()'s stable pandas sort gives (missing names last)
+_CSV_ORDER = "ORDER BY name IS NULL, name, set_code, collector, foil_kind, seq"
+
+
+def open_scratch(tmp_dir: str) -> sqlite3.Connection:
+    db = sqlite3.connect(os.path.join(tmp_dir, "stream.sqlite"))
+    db.execute("PRAGMA journal_mode=OFF")
+    db.execute("PRAGMA synchronous=OFF")
+    db.executescript(_SCRATCH_SCHEMA)
+    return db
+
+
+# -------- Collection --------
+
+@PROFILER.timed("stream_csv")
+def ingest_collection(db: sqlite3.Connection, csv_paths: List[str], chunk_rows: int) -> int:
+    # group_collection() a chunk at a time, summing quantities per printing in the scratch db.
+    # Always the C parser: pandas' pyarrow engine can't read in chunks.
+    import pandas as pd
+
+    if not csv_paths:
+        raise SystemExit("No CSV files provided.")
+    rows = 0
+    for p in csv_paths:
+        if not os.path.exists(p):
+            raise SystemExit(f"CSV not found: {p}")
+        header = list(pd.read_csv(p, nrows=0).columns)
+        missing = [c for c in COLLECTION_REQUIRED_COLS if c not in header]
+        if missing:
+            raise SystemExit(f"CSV missing columns: {missing}. Found: {header}")
+        usecols = COLLECTION_REQUIRED_COLS + (["Proxy"] if "Proxy" in header else [])
+        for df in pd.read_csv(p, usecols=usecols, dtype=COLLECTION_DTYPES, chunksize=max(1, chunk_rows)):
+            rows += len(df)
+            g = group_collection(df)
+            names = [n if isinstance(n, str) else None for n in g["name"].tolist()]
+            db.executemany(
+                "INSERT INTO printings (set_code, collector, lang_code, foil_kind, qty, name) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (set_code, collector, lang_code, foil_kind) "
+                "DO UPDATE SET qty = qty + excluded.qty, name = COALESCE(name, excluded.name)",
+                zip(
+                    g["set_code"].tolist(),
+                    g["collector"].tolist(),
+                    g["lang_code"].tolist(),
+                    g["foil_kind"].tolist(),
+                    g["total_qty"].fillna(0).tolist(),
+                    names,
+                ),
+            )
+    db.commit()
+    return rows
+
+
+def iter_identifier_batches(db: sqlite3.Connection) -> Iterator[Tuple[List[Dict[str, str]], Dict[str, Card]]]:
+    # (identifiers, key_to_meta) per Scryfall batch, in build_identifiers() order with
+    # duplicate printings dropped (foil and nonfoil rows share one identifier)
+    batch: List[Dict[str, str]] = []
+    key_to_meta: Dict[str, Card] = {}
+    last = None
+    rows = db.execute(
+        "SELECT set_code, collector, lang_code, foil_kind, qty, name FROM printings "
+        "ORDER BY set_code, collector, lang_code, foil_kind"
+    )
+    for s, c, lg, fk, qty, name in rows:
+        if (s, c, lg) != last:
+            if len(batch) == SCRYFALL_BATCH_SIZE:
+                yield batch, key_to_meta
+                batch, key_to_meta = [], {}
+            batch.append({"set": s, "collector_number": c, "lang": lg})
+            last = (s, c, lg)
+        key_to_meta[f"{s}|{c}|{lg}|{fk}"] = Card(
+            name=intern_value(name),
+            set=intern_value(s),
+            collector_number=c,
+            lang=intern_value(lg),
+            foil_kind=intern_value(fk),
+            qty=int(qty),
+        )
+    if batch:
+        yield batch, key_to_meta
+
+
+# -------- Pricing --------
+
+@PROFILER.timed("bulk_index")
+def ingest_bulk(db: sqlite3.Connection, bulk_path: str) -> Tuple[int, int]:
+    # build_bulk_index() into the scratch db; returns (found, wanted)
+    if not os.path.exists(bulk_path):
+        raise SystemExit(f"Bulk file not found: {bulk_path}")
+    wanted = "SELECT 1 FROM printings WHERE set_code = ? AND collector = ? AND lang_code = ? LIMIT 1"
+    for c in iter_bulk_cards(bulk_path):
+        k = (
+            str(c.get("set", "")).lower(),
+            str(c.get("collector_number", "")).strip(),
+            str(c.get("lang", "en")).lower(),
+        )
+        if db.execute(wanted, k).fetchone() is not None:
+            db.execute("INSERT OR REPLACE INTO bulk VALUES (?, ?, ?, ?)", (*k, json.dumps(slim_card(c))))
+    db.commit()
+    found = db.execute("SELECT COUNT(*) FROM bulk").fetchone()[0]
+    total = db.execute("SELECT COUNT(*) FROM (SELECT DISTINCT set_code, collector, lang_code FROM printings)").fetchone()[0]
+    return found, total
+
+
+def iter_priced_batches(
+    plan: RunPlan,
+    db: sqlite3.Connection,
+) -> Iterator[Tuple[List[Dict[str, str]], Dict[str, Card], List[Dict[str, Any]]]]:
+    # (identifiers, key_to_meta, Scryfall cards) per batch, in collection order
+    args = plan.args
+    if args.bulk_file:
+        found, total = ingest_bulk(db, args.bulk_file)
+        print(f"[bulk] {found} of {total} printings found in {args.bulk_file}")
+        lookup = "SELECT card FROM bulk WHERE set_code = ? AND collector = ? AND lang_code = ?"
+        for batch, key_to_meta in iter_identifier_batches(db):
+            cards = []
+            for i in batch:
+                row = db.execute(lookup, (i["set"], i["collector_number"], i["lang"])).fetchone()
+                if row is not None:
+                    cards.append(json.loads(row[0]))
+            yield batch, key_to_meta, cards
+        return
+
+    # Responses come back in submission order, so the metas queue lines up with them
+    metas: Deque[Dict[str, Card]] = deque()
+
+    def identifiers() -> Iterator[List[Dict[str, str]]]:
+        for batch, key_to_meta in iter_identifier_batches(db):
+            metas.append(key_to_meta)
+            yield batch
+
+    session = plan.warm.scryfall_session if plan.warm is not None else None
+    for batch, data in iter_collection_batches(
+        identifiers(), workers=args.fetch_workers, session=session, max_retries=args.fetch_retries
+    ):
+        yield batch, metas.popleft(), data.get("data", [])
+
+
+def iter_card_blocks(plan: RunPlan, db: sqlite3.Connection, block_size: int) -> Iterator[Dict[str, Any]]:
+    # merge_collection_batch() output, block_size cards (or a little more) at a time
+    block: Dict[str, Any] = {}
+    for batch, key_to_meta, cards in iter_priced_batches(plan, db):
+        merge_collection_batch(batch, cards, key_to_meta, block)
+        if len(block) >= block_size:
+            yield block
+            block = {}
+    if block:
+        yield block
+
+
+def load_prev_prices(db: sqlite3.Connection, plan: RunPlan) -> None:
+    args = plan.args
+    for keys, eur in iter_snapshot_prices(args.snapshot, legacy_json_path=args.legacy_snapshot):
+        db.executemany(
+            "INSERT OR REPLACE INTO prev (key, eur) VALUES (?, ?)",
+            ((k, None if e != e else e) for k, e in zip(keys, eur.tolist())),
+        )
+    db.commit()
+
+
+def prev_prices(db: sqlite3.Connection, keys: List[str]) -> Dict[str, CardPrice]:
+    # The previous snapshot's {key: {"eur": ...}} for one block
+    out: Dict[str, CardPrice] = {}
+    for i in range(0, len(keys), 500):
+        part = keys[i:i + 500]
+        marks = ",".join("?" * len(part))
+        for k, eur in db.execute(f"SELECT key, eur FROM prev WHERE key IN ({marks})", part):
+            out[k] = CardPrice(eur)
+    return out
+
+
+# -------- Outputs --------
+
+class ScratchCards(Mapping):
+    # This run's cards, read back from the scratch db in merge order (for the dashboard export)
+    def __init__(self, db: sqlite3.Connection):
+        self.db = db
+
+    def __getitem__(self, key: str) -> Dict[str, Any]:
+        row = self.db.execute("SELECT info FROM cards WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def __iter__(self) -> Iterator[str]:
+        for (k,) in self.db.execute("SELECT key FROM cards ORDER BY seq"):
+            yield k
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM cards").fetchone()[0]
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for k, info in self.db.execute("SELECT key, info FROM cards ORDER BY seq"):
+            yield k, json.loads(info)
+
+
+def _csv_cell(v: Any, float_ints: bool) -> str:
+    # What DataFrame.to_csv() writes for the value: missing values are empty, and an int
+    # column with gaps became float64 (2003 -> "2003.0")
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return str(v)
+    if isinstance(v, int) and float_ints:
+        return repr(float(v))
+    if isinstance(v, float):
+        return repr(v)
+    return str(v)
+
+
+def write_sorted_csv(db: sqlite3.Connection, out_path: str, make_row) -> None:
+    # The cards table through make_row(key, info, prev_eur), in the pandas writers' sort order
+    has_year = db.execute("SELECT 1 FROM cards WHERE released_year IS NOT NULL LIMIT 1").fetchone() is not None
+    no_year = db.execute("SELECT 1 FROM cards WHERE released_year IS NULL LIMIT 1").fetchone() is not None
+    float_years = has_year and no_year
+
+    if os.path.dirname(out_path):
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with open(out_path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, lineterminator="\n")
+        header = None
+        for key, info, prev_eur in db.execute(f"SELECT key, info, prev_eur FROM cards {_CSV_ORDER}"):
+            row = make_row(key, json.loads(info), prev_eur)
+            if header is None:
+                header = list(row.keys())
+                w.writerow(header)
+            w.writerow([_csv_cell(v, float_years and c == "released_year") for c, v in row.items()])
+
+
+# -------- Run --------
+
+def complete_streaming_run(plan: RunPlan) -> None:
+    # complete_run() for a --stream plan: the collection is read, priced, merged, alerted on
+    # and written a block at a time instead of being held in memory as a whole
+    args, warm, webhook, allow_discord = plan.args, plan.warm, plan.webhook, plan.allow_discord
+    now_iso, current = plan.now_iso, plan.current
+    baseline_run = bool(args.baseline_on_csv_change and plan.csv_changed and not args.incremental_on_csv_change)
+    alerting = not baseline_run and not args.no_alerts
+    if args.card_cache and not args.bulk_file:
+        print("[stream] the card cache isn't used in streaming runs; every printing is fetched")
+
+    tmp_dir = tempfile.mkdtemp(prefix="mtg-stream-")
+    db = open_scratch(tmp_dir)
+    writer = SnapshotWriter(args.snapshot)
+    history = open_history_store(
+        args.history_db,
+        max_points=args.history_max_points or args.trend_window,
+        max_days=args.history_max_days,
+        stats_window=args.trend_window,
+        daily_days=args.history_daily_days,
+        weekly_weeks=args.history_weekly_weeks,
+        legacy_json_path=args.history_json,
+    )
+    try:
+        rows = ingest_collection(db, parse_csv_list(args.csv), args.stream_chunk_rows)
+        load_prev_prices(db, plan)
+
+        with PROFILER.stage("fx_wait"):
+            fx_table = plan.fx.result()
+        rate = fx_table.rate_on(now_iso[:10])
+        prev_rate, prev_key_rates = prev_price_rates(fx_table, plan.prev_meta, rate)
+        current["_meta"]["eur_to_gbp"] = rate
+
+        # Points saved without a rate on earlier runs; this run's points get one (or can't)
+        filled = history.fill_missing_gbp(fx_table)
+        if filled:
+            print(f"[fx] filled in GBP for {filled} history point(s) saved without a rate")
+
+        if alerting:
+            from alerts import AlertResult, AlertThresholds, evaluate_alerts, trend_stats_from_rolling
+
+            thresholds = AlertThresholds.from_args(args)
+            result = AlertResult([], [], [], [])
+
+        seq = 0
+        for block in iter_card_blocks(plan, db, max(1, args.stream_batch)):
+            with PROFILER.stage("stream_block"):
+                keys = list(block.keys())
+                prev_cards = prev_prices(db, keys)
+                writer.add(block)
+                history.append(block, rate, now_iso)
+                if alerting:
+                    trend_stats = trend_stats_from_rolling(history.rolling_stats(keys), keys)
+                    r = evaluate_alerts(block, prev_cards, trend_stats, rate, thresholds)
+                    result.alerts.extend(r.alerts)
+                    result.sell_candidates.extend(r.sell_candidates)
+                    result.buy_more_signals.extend(r.buy_more_signals)
+                    result.trend_alerts.extend(r.trend_alerts)
+                db.executemany(
+                    "INSERT INTO cards VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            seq + i, k, json.dumps(dict(info)), (prev_cards.get(k) or {}).get("eur"),
+                            info.get("name"), info.get("set"), info.get("collector_number"),
+                            info.get("foil_kind"), info.get("released_year"),
+                        )
+                        for i, (k, info) in enumerate(block.items())
+                    ],
+                )
+                db.commit()
+                seq += len(block)
+        print(f"[stream] {rows} CSV rows -> {seq} cards in blocks of {args.stream_batch}")
+
+        history.retain_keys(k for (k,) in db.execute("SELECT key FROM cards"))
+        # Same as complete_run(): printings that got no card, for the next run's collection diff
+        current["_meta"]["unpriced_keys"] = [
+            k for (k,) in db.execute(
+                "SELECT k FROM (SELECT set_code || '|' || collector || '|' || lang_code || '|' || foil_kind AS k FROM printings)"
+                " WHERE k NOT IN (SELECT key FROM cards)"
+            )
+        ]
+        curr_cards = ScratchCards(db)
+
+        if args.export_csv:
+            with PROFILER.stage("export_csv"):
+                write_sorted_csv(db, args.export_csv, lambda _, info, __: export_snapshot_row(info, rate))
+
+        if baseline_run:
+            current["_meta"]["run_type"] = "baseline"
+            current["_meta"]["suppress_next_no_alerts"] = True
+            writer.close(current["_meta"])
+            if args.export_dashboard:
+                export_dashboard(args, history, curr_cards)
+            if allow_discord:
+                post_baseline_notice(args, webhook, warm)
+            return
+
+        if args.no_alerts:
+            writer.close(current["_meta"])
+            if args.export_dashboard:
+                export_dashboard(args, history, curr_cards)
+            return
+
+        if is_weekly_time(args.tz, args.weekly_day, args.weekly_time) if plan.weekly is None else plan.weekly:
+            with PROFILER.stage("weekly_csv"):
+                write_sorted_csv(
+                    db,
+                    weekly_summary_path(args),
+                    lambda key, info, prev_eur: weekly_summary_row(
+                        info, prev_eur, rate, prev_key_rates.get(key, prev_rate)
+                    ),
+                )
+
+        if allow_discord:
+            outbox = queue_alert_report(
+                args, webhook, warm, rate, result, plan.prev_suppress_next_no_alerts, current["_meta"]
+            )
+
+        writer.close(current["_meta"])
+
+        if args.export_dashboard:
+            export_dashboard(args, history, curr_cards)
+
+        if allow_discord:
+            outbox.finish()
+    finally:
+        writer.abort()
+        history.close()
+        db.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
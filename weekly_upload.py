@@ -1,179 +1,174 @@
 import argparse
+import bisect
 import os
-import re
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from typing import Dict, List
 from zoneinfo import ZoneInfo
 
 import pandas as pd
 import requests
 
-
-SNAP_RE = re.compile(r"^\d{4}-\d{2}-\d{2}\.csv$")
+from profiling import PROFILER
+from snapshot_archive import ARCHIVE_DIR, SNAP_RE, SnapshotArchive, load_snapshot, snapshot_value
 
 
+@PROFILER.timed("discord_upload")
 def discord_upload_file(webhook_url: str, filepath: str, message: str) -> None:
     if not webhook_url:
         raise SystemExit("DISCORD_WEBHOOK_URL is missing")
     if not os.path.exists(filepath):
         raise SystemExit(f"File not found: {filepath}")
 
-    with open(filepath, "rb") as f:
+    with open(filepath, "rb") as f, PROFILER.http("discord.upload") as rec:
         r = requests.post(
             webhook_url,
             data={"content": message},
             files={"file": (os.path.basename(filepath), f, "text/csv")},
             timeout=60,
         )
+        if rec is not None:
+            rec["status"] = r.status_code
 
     if r.status_code >= 300:
         raise SystemExit(f"Discord upload failed ({r.status_code}): {r.text}")
 
 
-def load_snapshot(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
-
-    # Normalise expected columns defensively
-    for col in ["qty", "gbp", "eur"]:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    if "qty" not in df.columns:
-        df["qty"] = 0
-    df["qty"] = df["qty"].fillna(0)
-
-    # Prefer GBP; fall back to EUR if GBP missing
-    if "gbp" not in df.columns:
-        df["gbp"] = None
-    df["gbp"] = df["gbp"].fillna(df.get("eur", 0)).fillna(0)
-
-    # A stable key to match cards between weeks
-    for c in ["name", "set", "collector_number", "foil_kind", "lang"]:
-        if c not in df.columns:
-            df[c] = ""
-        df[c] = df[c].fillna("").astype(str)
-
-    df["key"] = (
-        df["name"].str.strip() + "||" +
-        df["set"].str.strip() + "||" +
-        df["collector_number"].str.strip() + "||" +
-        df["foil_kind"].str.strip() + "||" +
-        df["lang"].str.strip()
-    )
-
-    return df
+# Weeks back the summary compares against; the first one also lists the top movers
+SUMMARY_WINDOWS = [1, 4, 12]
+TOP_MOVERS = 5
+# One week back is the snapshot just before the latest one, whatever its date. "N weeks
+# back" (N > 1) is the newest snapshot dated at least 7*N - WINDOW_SLACK_DAYS days before
+# the latest one, so a run a day or two late still lines up with its week.
+WINDOW_SLACK_DAYS = 3
 
 
+@PROFILER.timed("find_snapshots")
 def find_latest_and_prev(snapshots_dir: str) -> tuple[str | None, str | None]:
     if not snapshots_dir or not os.path.isdir(snapshots_dir):
         return None, None
-
-    files = [
-        f for f in os.listdir(snapshots_dir)
-        if SNAP_RE.match(f)
-    ]
-    files.sort()
-    if len(files) < 2:
-        latest = os.path.join(snapshots_dir, files[-1]) if files else None
-        return latest, None
-
+    files = sorted(f for f in os.listdir(snapshots_dir) if SNAP_RE.match(f))
+    if not files:
+        return None, None
     latest = os.path.join(snapshots_dir, files[-1])
-    prev = os.path.join(snapshots_dir, files[-2])
+    prev = os.path.join(snapshots_dir, files[-2]) if len(files) >= 2 else None
     return latest, prev
 
 
+def weeks_back(days: List[str], weeks: int) -> int | None:
+    # Index (into the sorted snapshot dates) of the snapshot to compare the newest one
+    # against, None if there is none that old
+    if len(days) < 2:
+        return None
+    if weeks == 1:
+        return len(days) - 2
+    target = (date.fromisoformat(days[-1]) - timedelta(days=7 * weeks - WINDOW_SLACK_DAYS)).isoformat()
+    i = bisect.bisect_right(days, target, 0, len(days) - 1) - 1
+    return i if i >= 0 else None
+
+
 def fmt_pct(x: float) -> str:
     return f"{x*100:+.2f}%"
 
 
-def build_summary(latest_csv: str, snapshots_dir: str | None) -> tuple[str, str]:
-    # Returns (summary_text, movers_text)
-    latest_df = load_snapshot(latest_csv)
-    latest_value = float((latest_df["qty"] * latest_df["gbp"]).sum())
+def window_label(weeks: int) -> str:
+    return "Weekly change" if weeks == 1 else f"{weeks}-week change"
 
-    movers_text = ""
-    change_text = "**Weekly change:** N/A (no previous snapshot found)"
 
-    prev_csv = None
-    if snapshots_dir:
-        _, prev_csv = find_latest_and_prev(snapshots_dir)
+def mover_labels(df: pd.DataFrame) -> pd.Series:
+    # "name (set) foil_kind", skipping empty parts, as whole-column string operations
+    label = df["name"]
+    for part in (("(" + df["set"] + ")").where(df["set"] != "", ""), df["foil_kind"]):
+        sep = pd.Series(" ", index=df.index).where((label != "") & (part != ""), "")
+        label = label + sep + part
+    return label.str.strip()
 
-    if prev_csv and os.path.exists(prev_csv):
-        prev_df = load_snapshot(prev_csv)
 
-        prev_value = float((prev_df["qty"] * prev_df["gbp"]).sum())
+def card_movers(latest_df: pd.DataFrame, prev_df: pd.DataFrame) -> pd.DataFrame:
+    # Per-card movement between two snapshots (impact on your collection)
+    m = latest_df[["key", "name", "set", "collector_number", "foil_kind", "lang", "qty", "gbp"]].merge(
+        prev_df[["key", "qty", "gbp"]].rename(columns={"qty": "qty_prev", "gbp": "gbp_prev"}),
+        on="key",
+        how="outer",
+    )
+    for c in ["name", "set", "collector_number", "foil_kind", "lang"]:
+        m[c] = m[c].fillna("")
+    for c in ["qty", "gbp", "qty_prev", "gbp_prev"]:
+        m[c] = m[c].fillna(0)
+
+    # Collection impact: assume current qty for impact (you can swap to min/avg if you prefer)
+    m["delta_price"] = m["gbp"] - m["gbp_prev"]
+    m["impact_value"] = m["qty"] * m["delta_price"]
+    m["label"] = mover_labels(m)
+    return m
+
+
+def format_movers(df: pd.DataFrame) -> str:
+    lines = [
+        f"- {label}: £{impact:+,.2f} (Δ £{delta:+,.2f})"
+        for label, impact, delta in zip(df["label"].tolist(), df["impact_value"].tolist(), df["delta_price"].tolist())
+        if label
+    ]
+    return "\n".join(lines) if lines else "- (none)"
+
+
+@PROFILER.timed("build_summary")
+def build_summary(
+    latest_csv: str,
+    archive_dir: str | None,
+    windows: List[int] | None = None,
+) -> tuple[str, str]:
+    # Returns (summary_text, movers_text): one value-change line per window (weeks back)
+    # and the top movers against the first window's snapshot. The earlier snapshots come
+    # from the archive, whose newest date is the latest snapshot's (the weekly workflow
+    # ingests it before the upload).
+    windows = windows or SUMMARY_WINDOWS
+    latest_df = load_snapshot(latest_csv)
+    latest_value = snapshot_value(latest_df)
+    archive = SnapshotArchive(archive_dir) if archive_dir else None
+    days = archive.dates() if archive is not None else []
+    back = {weeks: weeks_back(days, weeks) for weeks in windows}
+
+    # Totals for every date from the oldest window on; only their qty/gbp columns are read
+    values: Dict[str, float] = {}
+    found = [days[i] for i in back.values() if i is not None]
+    if found:
+        v = archive.value_over_time(since=min(found))
+        values = dict(zip(v["date"].tolist(), v["value_gbp"].tolist()))
+
+    change_lines = []
+    movers_text = ""
+    for n, weeks in enumerate(windows):
+        i = back[weeks]
+        if i is None:
+            why = "no previous snapshot found" if weeks == 1 else f"no snapshot from {weeks} weeks back"
+            change_lines.append(f"**{window_label(weeks)}:** N/A ({why})")
+            continue
+
+        prev_value = values[days[i]]
         delta_value = latest_value - prev_value
         delta_pct = (delta_value / prev_value) if prev_value else 0.0
-
-        change_text = f"**Weekly change:** £{delta_value:+,.2f} ({fmt_pct(delta_pct)})"
-
-        # Merge for per-card movement (impact on your collection)
-        m = latest_df[["key", "name", "set", "collector_number", "foil_kind", "lang", "qty", "gbp"]].merge(
-            prev_df[["key", "qty", "gbp"]].rename(columns={"qty": "qty_prev", "gbp": "gbp_prev"}),
-            on="key",
-            how="outer",
-        )
-
-        m["name"] = m["name"].fillna("")
-        m["set"] = m["set"].fillna("")
-        m["collector_number"] = m["collector_number"].fillna("")
-        m["foil_kind"] = m["foil_kind"].fillna("")
-        m["lang"] = m["lang"].fillna("")
-
-        m["qty"] = m["qty"].fillna(0)
-        m["gbp"] = m["gbp"].fillna(0)
-        m["qty_prev"] = m["qty_prev"].fillna(0)
-        m["gbp_prev"] = m["gbp_prev"].fillna(0)
-
-        # Collection impact: assume current qty for impact (you can swap to min/avg if you prefer)
-        m["delta_price"] = m["gbp"] - m["gbp_prev"]
-        m["impact_value"] = m["qty"] * m["delta_price"]
-
-        # A nicer display label
-        def label(row) -> str:
-            bits = [row["name"]]
-            if row["set"]:
-                bits.append(f"({row['set']})")
-            if row["foil_kind"]:
-                bits.append(row["foil_kind"])
-            return " ".join([b for b in bits if b]).strip()
-
-        m["label"] = m.apply(label, axis=1)
-
-        # Top movers by value impact
-        up = m.sort_values("impact_value", ascending=False).head(5)
-        down = m.sort_values("impact_value", ascending=True).head(5)
-
-        def format_movers(df: pd.DataFrame) -> str:
-            lines = []
-            for _, r in df.iterrows():
-                if not r["label"]:
-                    continue
-                lines.append(f"- {r['label']}: £{float(r['impact_value']):+,.2f} (Δ £{float(r['delta_price']):+,.2f})")
-            return "\n".join(lines) if lines else "- (none)"
-
-        movers_text = (
-            "\n\n**Top 5 risers (collection impact)**\n"
-            f"{format_movers(up)}\n"
-            "\n**Top 5 fallers (collection impact)**\n"
-            f"{format_movers(down)}"
-        )
-
-    summary_text = f"**Total value:** £{latest_value:,.2f}\n{change_text}"
+        change_lines.append(f"**{window_label(weeks)}:** £{delta_value:+,.2f} ({fmt_pct(delta_pct)})")
+
+        if n == 0:
+            m = card_movers(latest_df, archive.snapshot(days[i]))
+            span = "" if weeks == 1 else f", {weeks} weeks"
+            movers_text = (
+                f"\n\n**Top {TOP_MOVERS} risers (collection impact{span})**\n"
+                f"{format_movers(m.nlargest(TOP_MOVERS, 'impact_value'))}\n"
+                f"\n**Top {TOP_MOVERS} fallers (collection impact{span})**\n"
+                f"{format_movers(m.nsmallest(TOP_MOVERS, 'impact_value'))}"
+            )
+
+    summary_text = f"**Total value:** £{latest_value:,.2f}\n" + "\n".join(change_lines)
     return summary_text, movers_text
 
 
-def main() -> None:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--file", required=True, help="CSV file to upload")
-    ap.add_argument("--snapshots-dir", default="", help="Directory containing dated snapshots (YYYY-MM-DD.csv)")
-    ap.add_argument("--tz", default="Europe/London")
-    ap.add_argument("--label", default="Weekly MTG Collection Snapshot")
-    args = ap.parse_args()
-
+def run(args: argparse.Namespace) -> None:
     webhook_url = os.getenv("DISCORD_WEBHOOK_URL", "").strip()
     now = datetime.now(ZoneInfo(args.tz))
 
-    summary_text, movers_text = build_summary(args.file, args.snapshots_dir or None)
+    windows = [int(w) for w in args.windows.split(",") if w.strip()]
+    summary_text, movers_text = build_summary(args.file, args.archive or None, windows)
 
     message = (
         f"📎 **{args.label}** ({now:%d %b %Y})\n"
@@ -185,5 +180,27 @@ def main() -> None:
     discord_upload_file(webhook_url, args.file, message)
 
 
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--file", required=True, help="CSV file to upload")
+    ap.add_argument("--archive", default=ARCHIVE_DIR,
+                    help=f"Snapshot archive the earlier weeks are read from (default: {ARCHIVE_DIR}; empty disables)")
+    ap.add_argument("--tz", default="Europe/London")
+    ap.add_argument("--label", default="Weekly MTG Collection Snapshot")
+    ap.add_argument("--windows", default=",".join(map(str, SUMMARY_WINDOWS)),
+                    help="Weeks back to compare total value against; top movers use the first (default: 1,4,12)")
+    ap.add_argument("--profile", nargs="?", const="weekly_profile.json", default="",
+                    help="Write per-stage timing/memory/HTTP latency JSON here (default: weekly_profile.json)")
+    args = ap.parse_args()
+
+    if args.profile:
+        PROFILER.enable()
+    try:
+        run(args)
+    finally:
+        if args.profile:
+            PROFILER.write_report(args.profile, "weekly_upload")
+
+
 if __name__ == "__main__":
     main()